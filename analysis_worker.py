@@ -0,0 +1,233 @@
+# --- 画像解析のバックグラウンド実行 ---
+# 解析はプロセス共有のイベントループ上でジョブとして実行し、Streamlit のスクリプトは即座に返す。
+# 画面側はジョブハンドルを st.session_state に保持し、完了をポーリングする。
+# HTTP 呼び出し (requests) は同期APIのため、イベントループから専用スレッドプールへ委譲する。
+# LogMeal クライアント (requests) は API トークン付きの解析が来たときに初めて読み込む。
+
+import asyncio
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import metrics
+from logmeal_cache import LogMealCache
+
+MAX_IN_FLIGHT = 8  # プロセスあたりの同時解析数
+MAX_QUEUED = 64  # 実行待ちを含めた受付上限
+DEMO_DELAY = 1.0  # デモモードの疑似スキャン時間 (秒)
+SPECULATIVE_TTL = 120.0  # 先読みジョブを引き取られないまま残す時間 (秒)。過ぎたら取り消す (タブを閉じた場合など)
+RESOLVE_MIN_SCORE = 0.8  # 認識した料理名を食品DBで置き換える一致度 (誤一致を避けるため厳しめ)
+
+STATUS_LABELS = {
+    "queued": "解析の順番待ち...",
+    "api": "LogMeal AI で解析中...",
+    "demo": "画像をスキャン中... (デモモード)",
+    "done": "解析完了",
+    "cancelled": "キャンセルしました",
+}
+
+# デモデータ
+DEMO_INGREDIENTS = [
+    {"食材名": "白米", "カロリー(kcal)": 250, "タンパク質(g)": 4, "脂質(g)": 0.5, "炭水化物(g)": 55, "水溶性食物繊維(g)": 0, "不溶性食物繊維(g)": 0.3, "ビタミンB1(mg)": 0.02, "ビタミンC(mg)": 0, "ビタミンD(μg)": 0, "鉄分(mg)": 0.1, "亜鉛(mg)": 0.6, "マグネシウム(mg)": 7, "カテゴリ": "主食"},
+    {"食材名": "味噌汁", "カロリー(kcal)": 40, "タンパク質(g)": 2, "脂質(g)": 1, "炭水化物(g)": 5, "水溶性食物繊維(g)": 0.5, "不溶性食物繊維(g)": 1.0, "ビタミンB1(mg)": 0.04, "ビタミンC(mg)": 0, "ビタミンD(μg)": 0, "鉄分(mg)": 0.8, "亜鉛(mg)": 0.2, "マグネシウム(mg)": 15, "カテゴリ": "汁物"},
+    {"食材名": "焼き魚", "カロリー(kcal)": 200, "タンパク質(g)": 20, "脂質(g)": 12, "炭水化物(g)": 0.5, "水溶性食物繊維(g)": 0, "不溶性食物繊維(g)": 0, "ビタミンB1(mg)": 0.1, "ビタミンC(mg)": 0, "ビタミンD(μg)": 15, "鉄分(mg)": 0.3, "亜鉛(mg)": 1.2, "マグネシウム(mg)": 30, "カテゴリ": "主菜"},
+    {"食材名": "ほうれん草のお浸し", "カロリー(kcal)": 25, "タンパク質(g)": 2, "脂質(g)": 0.2, "炭水化物(g)": 3, "水溶性食物繊維(g)": 0.7, "不溶性食物繊維(g)": 1.5, "ビタミンB1(mg)": 0.05, "ビタミンC(mg)": 15, "ビタミンD(μg)": 0, "鉄分(mg)": 2.0, "亜鉛(mg)": 0.4, "マグネシウム(mg)": 40, "カテゴリ": "副菜"},
+    {"食材名": "納豆", "カロリー(kcal)": 100, "タンパク質(g)": 8, "脂質(g)": 5, "炭水化物(g)": 6, "水溶性食物繊維(g)": 2.0, "不溶性食物繊維(g)": 4.0, "ビタミンB1(mg)": 0.07, "ビタミンC(mg)": 0, "ビタミンD(μg)": 0, "鉄分(mg)": 1.5, "亜鉛(mg)": 1.0, "マグネシウム(mg)": 50, "カテゴリ": "副菜"},
+    {"食材名": "サラダ", "カロリー(kcal)": 50, "タンパク質(g)": 1, "脂質(g)": 3, "炭水化物(g)": 5, "水溶性食物繊維(g)": 0.5, "不溶性食物繊維(g)": 2.0, "ビタミンB1(mg)": 0.05, "ビタミンC(mg)": 20, "ビタミンD(μg)": 0, "鉄分(mg)": 0.5, "亜鉛(mg)": 0.2, "マグネシウム(mg)": 10, "カテゴリ": "副菜"},
+    {"食材名": "卵焼き", "カロリー(kcal)": 150, "タンパク質(g)": 10, "脂質(g)": 10, "炭水化物(g)": 4, "水溶性食物繊維(g)": 0, "不溶性食物繊維(g)": 0, "ビタミンB1(mg)": 0.03, "ビタミンC(mg)": 0, "ビタミンD(μg)": 1.5, "鉄分(mg)": 0.9, "亜鉛(mg)": 0.7, "マグネシウム(mg)": 6, "カテゴリ": "副菜"}
+]
+
+
+class WorkerBusyError(Exception):
+    """受付上限に達しており、新しい解析を受け付けられない"""
+
+
+class AnalysisJob:
+    """
+    1回の画像解析のハンドル (st.session_state に保持する)
+    messages: 画面に表示する (レベル, 文言) のリスト。レベルは "error" / "warning"
+    sampled: 各段階の所要時間を metrics に記録するか
+    speculative: ボタンを押す前に始めた先読みのジョブで、まだ引き取られていない (AnalysisWorker.claim)
+    """
+
+    def __init__(self, key, speculative=False):
+        self.key = key
+        self.status = "queued"
+        self.messages = []
+        self.submitted = time.monotonic()
+        self.sampled = metrics.sample()
+        self.speculative = speculative
+        self.future = None
+
+    @property
+    def done(self):
+        return self.future.done()
+
+    @property
+    def cancelled(self):
+        # future は submit の戻り値で設定されるため、実行開始の直後はまだ None のことがある
+        return self.future is not None and self.future.cancelled()
+
+    @property
+    def status_label(self):
+        return STATUS_LABELS.get(self.status, self.status)
+
+    def cancel(self):
+        if self.future.cancel():
+            self.status = "cancelled"
+            return True
+        return False
+
+    def result(self):
+        """食材表の行 (dict) のリスト。キャンセル済みなら None"""
+        try:
+            return self.future.result()
+        except CancelledError:
+            return None
+
+
+def call_logmeal_api(job, image, api_token, client, cache, food_db=None):
+    """
+    キャッシュ → LogMeal API の順に解析し、食材表の行を返す。失敗時は None
+    食品DBで名前を解決できた料理は、栄養素APIを呼ばずにDBの値を使う
+    (同梱のデモ用DBでは解決しない。仮の値で実際の栄養素を上書きしないため)
+    """
+    from logmeal_client import NUTRITION_MISSING, CircuitOpenError
+
+    resolve = None
+    if food_db is not None and not food_db.demo:
+        def resolve(name):
+            return food_db.lookup(name, min_score=RESOLVE_MIN_SCORE)
+    try:
+        rows = cache.get(image.key)
+        if rows is None:
+            # 取り消されたジョブ (差し替えられた写真の先読みなど) では API を呼ばない
+            if job.cancelled:
+                return None
+            # 写っている料理をすべて認識し、料理ごとの栄養素を並行取得
+            with metrics.span("logmeal_api", job.sampled):
+                rows = client.analyze_meal(image.upload_bytes, api_token, resolve=resolve,
+                                           cancelled=lambda: job.cancelled)
+            if rows is None:
+                return None
+            missing = [row["食材名"] for row in rows if row.get(NUTRITION_MISSING)]
+            if missing:
+                # 取得できなかった料理は空欄で返す。次回また取得を試みるようキャッシュしない
+                job.messages.append(("warning", f"栄養素を取得できなかった料理があります: {'、'.join(missing)}"
+                                                "（食材表に値を入力してください）"))
+            else:
+                cache.put(image.key, rows)
+        if rows:
+            return rows
+        job.messages.append(("error", "料理を認識できませんでした。"))
+        return None
+    except CircuitOpenError:
+        job.messages.append(("warning", "LogMeal API が不安定なため、一時的に接続を停止しています。"))
+        return None
+    except Exception as e:
+        job.messages.append(("error", f"APIエラー: {e}"))
+        return None
+
+
+class AnalysisWorker:
+    """
+    プロセス共有の解析ワーカー
+    max_in_flight: 同時に実行する解析の数 (超えた分は順番待ち)
+    max_queued: 順番待ちを含めた受付上限 (超えると WorkerBusyError)。取り消したジョブも処理が終わるまで数える
+    speculative_ttl: 先読みのジョブを引き取られないまま残す秒数
+    """
+
+    def __init__(self, client=None, cache=None, food_db=None, max_in_flight=MAX_IN_FLIGHT,
+                 max_queued=MAX_QUEUED, demo_delay=DEMO_DELAY, speculative_ttl=SPECULATIVE_TTL):
+        self._client = client
+        self.cache = cache or LogMealCache()
+        self.food_db = food_db
+        self.max_queued = max_queued
+        self.demo_delay = demo_delay
+        self.speculative_ttl = speculative_ttl
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._io = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="analysis-io")
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True, name="analysis-loop")
+        self._thread.start()
+
+    @property
+    def client(self):
+        # デモモードだけなら requests を読み込まない
+        with self._lock:
+            if self._client is None:
+                from logmeal_client import LogMealClient
+                self._client = LogMealClient()
+            return self._client
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def submit(self, image, api_token=None, speculative=False):
+        """
+        解析ジョブを登録してすぐに返す
+        speculative: 先読みのジョブ。speculative_ttl 秒以内に claim されなければ取り消す
+        """
+        with self._lock:
+            if self._pending >= self.max_queued:
+                raise WorkerBusyError("解析の受付上限に達しています")
+            self._pending += 1
+        job = AnalysisJob(image.key, speculative=speculative)
+        # 受付枠は _run の終了時に返す (取り消されても、スレッドでの処理が終わるまでは枠を使い続けるため)
+        job.future = asyncio.run_coroutine_threadsafe(self._run(job, image, api_token), self.loop)
+        if speculative:
+            self.loop.call_soon_threadsafe(self.loop.call_later, self.speculative_ttl, self._expire, job)
+        return job
+
+    def claim(self, job):
+        """先読みのジョブを引き取る (以後は期限切れで取り消さない)。取り消し済みなら False"""
+        with self._lock:
+            job.speculative = False
+            return not job.cancelled
+
+    def _expire(self, job):
+        with self._lock:
+            if job.speculative and job.cancel():
+                metrics.count_speculative("expired")
+
+    async def _run(self, job, image, api_token):
+        try:
+            async with self._slots:
+                metrics.observe("analysis_queue", time.monotonic() - job.submitted, job.sampled)
+                rows = await self.analyze_image(job, image, api_token)
+                job.status = "done"
+                return rows
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def analyze_image(self, job, image, api_token=None):
+        if api_token:
+            job.status = "api"
+            call = self.loop.run_in_executor(
+                self._io, call_logmeal_api, job, image, api_token, self.client, self.cache, self.food_db)
+            try:
+                rows = await asyncio.shield(call)
+            except asyncio.CancelledError:
+                # スレッドでの API 呼び出しは途中で止められないため、終わるまで同時実行の枠を持ったまま待つ
+                # (call_logmeal_api は取り消しを見て残りの呼び出しを省く)
+                await asyncio.wait([call])
+                raise
+            if rows is not None:
+                return rows
+            job.messages.append(("warning", "API解析に失敗したため、デモデータを使用します。"))
+
+        job.status = "demo"
+        with metrics.span("demo_scan", job.sampled):
+            await asyncio.sleep(self.demo_delay)
+        return [dict(row) for row in DEMO_INGREDIENTS]
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._io.shutdown(wait=False, cancel_futures=True)
+        if self._client is not None:
+            self._client.close()
+        self.cache.close()
@@ -1,9 +1,16 @@
+import os
+import uuid
+
 import streamlit as st
-import pandas as pd
-import numpy as np
-import time
-import requests
-import plotly.graph_objects as go
+
+import metrics
+# 入力画面の表示に不要な重いモジュール (pandas, numpy, requests, Plotly, Pillow) は
+# 使う場所で初めて import する (起動・初回表示を速くするため)
+from scoring import (
+    ALLERGY_OPTIONS, ALPHA, HABIT_OPTIONS, STRESS_LEVELS, SUPPLEMENT_OPTIONS, W_BIO, W_DIET, W_DOP, W_RISK,
+    WEIGHTS_VERSION,
+)
+from session_store import SessionStore
 
 # --- 初期設定 ---
 st.set_page_config(
@@ -17,286 +24,178 @@ if 'page' not in st.session_state:
     st.session_state['page'] = 'input'
 if 'input_step' not in st.session_state:
     st.session_state['input_step'] = 1  # 1: 問1-10, 2: 問11-20, 3: 画像アップロード
-if 'uploaded_file' not in st.session_state:
-    st.session_state['uploaded_file'] = None
-if 'ingredients_df' not in st.session_state:
-    st.session_state['ingredients_df'] = None
-if 'user_profile' not in st.session_state:
-    st.session_state['user_profile'] = {}
-if 'habit_answers' not in st.session_state:
-    st.session_state['habit_answers'] = {}
-
-# --- API連携 & 画像解析ロジック (変更なし) ---
-
-def call_logmeal_api(image_file, api_token):
-    headers = {'Authorization': 'Bearer ' + api_token}
-    url_recognition = 'https://api.logmeal.es/v2/image/recognition/dish'
+if 'session_id' not in st.session_state:
+    # 回答・プロフィール・画像・食材表は SessionStore にこのIDで保持する
+    st.session_state['session_id'] = uuid.uuid4().hex
+if 'uploaded_file_id' not in st.session_state:
+    st.session_state['uploaded_file_id'] = None
+if 'ingredients_version' not in st.session_state:
+    st.session_state['ingredients_version'] = 0  # 食材表を差し替えるたびに増やす (編集状態のリセット用)
+if 'ingredient_totals' not in st.session_state:
+    st.session_state['ingredient_totals'] = None  # 現在の食材表の IncrementalTotals
+if 'nnbi_scorer' not in st.session_state:
+    st.session_state['nnbi_scorer'] = None  # IncrementalScorer (結果画面で作成)
+if 'analysis_job' not in st.session_state:
+    st.session_state['analysis_job'] = None  # 実行中の AnalysisJob
+if 'speculative_job' not in st.session_state:
+    st.session_state['speculative_job'] = None  # アップロード時に先に始めた AnalysisJob
+if 'speculative_key' not in st.session_state:
+    st.session_state['speculative_key'] = None  # 先読み中の (画像のハッシュ, APIトークン)
+if 'diary_token' not in st.session_state:
+    st.session_state['diary_token'] = None  # このブラウザの食事記録の鍵 (URL の ?diary= にも載せる)
+if 'recorded_meal' not in st.session_state:
+    st.session_state['recorded_meal'] = None  # 記録済みの (user_id, ingredients_version) (同じ食事の二重記録防止)
+if 'editor_signature' not in st.session_state:
+    st.session_state['editor_signature'] = None  # 前回の実行での食材表の編集状態 (編集による再実行を数える)
+if 'lite_charts' not in st.session_state:
+    # 軽量表示 (Plotly を使わない簡易グラフ)。NNBI_LITE_CHARTS=1 で既定をオンにできる
+    st.session_state['lite_charts'] = os.environ.get("NNBI_LITE_CHARTS") == "1"
+
+# --- 計測 ---
+
+@st.cache_resource
+def start_metrics_server():
+    # NNBI_METRICS_PORT が設定されていれば、プロセスに1つ /metrics のサーバーを立てる
+    port = os.environ.get("NNBI_METRICS_PORT")
+    if not port:
+        return None
     try:
-        files = {'image': image_file.getvalue()}
-        response = requests.post(url_recognition, headers=headers, files=files)
-        response.raise_for_status()
-        data = response.json()
-        if 'recognition_results' in data and len(data['recognition_results']) > 0:
-            dish_result = data['recognition_results'][0]
-            dish_name = dish_result['name']
-            detected_ingredients = [
-                {
-                    "食材名": dish_name,
-                    "カロリー(kcal)": int(dish_result.get('calories', 300)),
-                    "タンパク質(g)": 15, "脂質(g)": 10, "炭水化物(g)": 40,
-                    "水溶性食物繊維(g)": 1.0, "不溶性食物繊維(g)": 2.0,
-                    "ビタミンB1(mg)": 0.1, "ビタミンC(mg)": 5, "ビタミンD(μg)": 0,
-                    "鉄分(mg)": 1.0, "亜鉛(mg)": 2.0, "マグネシウム(mg)": 10,
-                    "カテゴリ": "主食"
-                }
-            ]
-            return pd.DataFrame(detected_ingredients)
-        else:
-            st.error("料理を認識できませんでした。")
-            return None
-    except Exception as e:
-        st.error(f"APIエラー: {e}")
+        return metrics.serve(int(port))
+    except OSError:
+        # 同じポートを別プロセスが使っている場合は計測の出力だけを諦める
         return None
 
-def analyze_image(file_obj, api_token=None):
-    if api_token:
-        with st.spinner('LogMeal AI で解析中...'):
-            df = call_logmeal_api(file_obj, api_token)
-            if df is not None: return df
-            else: st.warning("API解析に失敗したため、デモデータを使用します。")
-    
-    with st.spinner('画像をスキャン中... (デモモード)'):
-        time.sleep(1.0)
-    
-    # デモデータ
-    initial_data = [
-        {"食材名": "白米", "カロリー(kcal)": 250, "タンパク質(g)": 4, "脂質(g)": 0.5, "炭水化物(g)": 55, "水溶性食物繊維(g)": 0, "不溶性食物繊維(g)": 0.3, "ビタミンB1(mg)": 0.02, "ビタミンC(mg)": 0, "ビタミンD(μg)": 0, "鉄分(mg)": 0.1, "亜鉛(mg)": 0.6, "マグネシウム(mg)": 7, "カテゴリ": "主食"},
-        {"食材名": "味噌汁", "カロリー(kcal)": 40, "タンパク質(g)": 2, "脂質(g)": 1, "炭水化物(g)": 5, "水溶性食物繊維(g)": 0.5, "不溶性食物繊維(g)": 1.0, "ビタミンB1(mg)": 0.04, "ビタミンC(mg)": 0, "ビタミンD(μg)": 0, "鉄分(mg)": 0.8, "亜鉛(mg)": 0.2, "マグネシウム(mg)": 15, "カテゴリ": "汁物"},
-        {"食材名": "焼き魚", "カロリー(kcal)": 200, "タンパク質(g)": 20, "脂質(g)": 12, "炭水化物(g)": 0.5, "水溶性食物繊維(g)": 0, "不溶性食物繊維(g)": 0, "ビタミンB1(mg)": 0.1, "ビタミンC(mg)": 0, "ビタミンD(μg)": 15, "鉄分(mg)": 0.3, "亜鉛(mg)": 1.2, "マグネシウム(mg)": 30, "カテゴリ": "主菜"},
-        {"食材名": "ほうれん草のお浸し", "カロリー(kcal)": 25, "タンパク質(g)": 2, "脂質(g)": 0.2, "炭水化物(g)": 3, "水溶性食物繊維(g)": 0.7, "不溶性食物繊維(g)": 1.5, "ビタミンB1(mg)": 0.05, "ビタミンC(mg)": 15, "ビタミンD(μg)": 0, "鉄分(mg)": 2.0, "亜鉛(mg)": 0.4, "マグネシウム(mg)": 40, "カテゴリ": "副菜"},
-        {"食材名": "納豆", "カロリー(kcal)": 100, "タンパク質(g)": 8, "脂質(g)": 5, "炭水化物(g)": 6, "水溶性食物繊維(g)": 2.0, "不溶性食物繊維(g)": 4.0, "ビタミンB1(mg)": 0.07, "ビタミンC(mg)": 0, "ビタミンD(μg)": 0, "鉄分(mg)": 1.5, "亜鉛(mg)": 1.0, "マグネシウム(mg)": 50, "カテゴリ": "副菜"},
-        {"食材名": "サラダ", "カロリー(kcal)": 50, "タンパク質(g)": 1, "脂質(g)": 3, "炭水化物(g)": 5, "水溶性食物繊維(g)": 0.5, "不溶性食物繊維(g)": 2.0, "ビタミンB1(mg)": 0.05, "ビタミンC(mg)": 20, "ビタミンD(μg)": 0, "鉄分(mg)": 0.5, "亜鉛(mg)": 0.2, "マグネシウム(mg)": 10, "カテゴリ": "副菜"},
-        {"食材名": "卵焼き", "カロリー(kcal)": 150, "タンパク質(g)": 10, "脂質(g)": 10, "炭水化物(g)": 4, "水溶性食物繊維(g)": 0, "不溶性食物繊維(g)": 0, "ビタミンB1(mg)": 0.03, "ビタミンC(mg)": 0, "ビタミンD(μg)": 1.5, "鉄分(mg)": 0.9, "亜鉛(mg)": 0.7, "マグネシウム(mg)": 6, "カテゴリ": "副菜"}
-    ]
-    return pd.DataFrame(initial_data)
-
-def calculate_total_nutrients(df_ingredients):
-    if df_ingredients is None or df_ingredients.empty:
-        return {}
-    
-    total = df_ingredients.sum(numeric_only=True)
-    return {
-        "calories": int(total.get("カロリー(kcal)", 0)),
-        "protein": round(total.get("タンパク質(g)", 0), 1),
-        "fat": round(total.get("脂質(g)", 0), 1),
-        "carbs": round(total.get("炭水化物(g)", 0), 1),
-        "fiber_sol": round(total.get("水溶性食物繊維(g)", 0), 1),
-        "fiber_insol": round(total.get("不溶性食物繊維(g)", 0), 1),
-        "vit_b1": round(total.get("ビタミンB1(mg)", 0), 2),
-        "vit_c": round(total.get("ビタミンC(mg)", 0), 1),
-        "vit_d": round(total.get("ビタミンD(μg)", 0), 1),
-        "iron": round(total.get("鉄分(mg)", 0), 1),
-        "zinc": round(total.get("亜鉛(mg)", 0), 1),
-        "magnesium": round(total.get("マグネシウム(mg)", 0), 1)
-    }
-
-# --- ロジック: NNBIスコア算出 (更新版) ---
-
-def calculate_comprehensive_score(habit_answers, user_profile, nutrients, constitution_type):
+def rerun(reason):
+    # st.rerun() の前に理由ごとの再実行回数を数える
+    metrics.count_rerun(reason)
+    st.rerun()
+
+# --- セッションデータ ---
+
+@st.cache_resource
+def get_session_store():
+    # 全セッションのデータ (画像は一時ファイルへ退避) をプロセス内で保持し、放置されたセッションは破棄する
+    return SessionStore()
+
+def session_data():
+    return get_session_store().session(st.session_state['session_id'])
+
+def set_ingredients(table):
+    # 食材表 (IngredientTable) を差し替える (data_editor の編集状態と合計もリセットされる)
+    session_data().ingredients = table
+    st.session_state['ingredients_version'] += 1
+    st.session_state['ingredient_totals'] = None
+
+def restart_input():
+    # 入力画面の最初からやり直す
+    cancel_speculative_analysis()
+    if st.session_state['analysis_job'] is not None:
+        st.session_state['analysis_job'].cancel()
+        st.session_state['analysis_job'] = None
+    st.session_state['page'] = 'input'
+    st.session_state['input_step'] = 1
+    st.session_state['uploaded_file_id'] = None
+    get_session_store().set_image(st.session_state['session_id'], None)
+
+@st.cache_resource
+def get_meal_diary():
+    # 食事記録 (SQLite) はプロセス内で1接続を共有する
+    from meal_diary import MealDiary
+    return MealDiary()
+
+# --- API連携 & 画像解析ロジック ---
+
+@st.cache_resource
+def get_food_db():
+    # 栄養素はメモリマップで開くため、ワーカー間で物理メモリを共有できる
+    from food_db import FoodDatabase
+    return FoodDatabase()
+
+@st.cache_resource
+def get_analysis_worker():
+    # 解析ワーカー (イベントループ・接続プール・キャッシュ) はプロセス内の全セッションで共有
+    from analysis_worker import AnalysisWorker
+    return AnalysisWorker(food_db=get_food_db())
+
+def start_speculative_analysis(image, api_token):
     """
-    NNBI理論モデルに基づくスコア算出
-    Formula: Score = 20 + (0.35 * X_diet) + (0.25 * X_bio) + (0.20 * X_dop) - (0.20 * X_risk)
-    ※ ベースライン(α)を20とし、満点が100になるよう設計
+    アップロードされた写真の解析を、ボタンを押す前に始めておく
+    写真 (ハッシュ) とトークンが同じなら実行中・完了済みのジョブをそのまま使い、
+    写真の差し替え・削除やトークンの変更があれば前のジョブを取り消す (API の呼び出し回数を無駄にしない)
+    デモモード (トークンなし) では待つだけなので先読みしない。引き取られないジョブはワーカーが期限切れで取り消す
     """
-    
-    # 結果格納用コンテナ
-    breakdown = {
-        "diet": {"score": 0, "reasons": []}, # X_diet: 良質な食事パターン
-        "bio":  {"score": 0, "reasons": []}, # X_bio: 腸内環境・微生物
-        "dop":  {"score": 0, "reasons": []}, # X_dop: ドーパミン合成能
-        "risk": {"score": 0, "reasons": []}  # X_risk: 炎症・リスク因子
-    }
-
-    # ==========================================
-    # 1. X_diet: ポジティブな食事パターン (Max 100)
-    # ==========================================
-    xd_score = 0
-    
-    # 習慣 (計60点)
-    if habit_answers.get("fish") in ["週3回以上", "週1-2回"]: xd_score += 10
-    if habit_answers.get("chicken") in ["週3回以上", "週1-2回"]: xd_score += 10
-    if habit_answers.get("veg_variety") == "5種類以上": xd_score += 15
-    elif habit_answers.get("veg_variety") == "3-4種類": xd_score += 5
-    if habit_answers.get("oil") == "オリーブ/アマニ油中心": xd_score += 10
-    if habit_answers.get("water") == "1.5L以上": xd_score += 5
-    if habit_answers.get("breakfast") == "毎日食べる": xd_score += 10
-
-    # 食事内容 (計40点)
-    # PFCバランスが極端でないか
-    p, f, c = nutrients['protein'], nutrients['fat'], nutrients['carbs']
-    total_g = p + f + c
-    if total_g > 0:
-        p_ratio = p / total_g
-        if 0.15 <= p_ratio <= 0.35: # タンパク質比率が適正
-            xd_score += 20
-            breakdown["diet"]["reasons"].append("・PFCバランスが良好")
-    
-    # ビタミンC (抗酸化)
-    if nutrients['vit_c'] > 30:
-        xd_score += 20
-        breakdown["diet"]["reasons"].append("・十分なビタミンC (抗酸化作用)")
-
-    xd_score = min(100, xd_score)
-    breakdown["diet"]["score"] = xd_score
-    if xd_score >= 80: breakdown["diet"]["reasons"].append("・地中海式に近い良質な食習慣")
-
-    # ==========================================
-    # 2. X_bio: 腸内環境・Coprococcus係数 (Max 100)
-    # ==========================================
-    xb_score = 0
-    
-    # 習慣 (計50点)
-    if habit_answers.get("fiber") == "1日3皿分以上": xb_score += 25
-    elif habit_answers.get("fiber") == "1日2皿分": xb_score += 15
-    
-    if habit_answers.get("fermented") == "ほぼ毎日": xb_score += 25
-    elif habit_answers.get("fermented") == "週3-4回": xb_score += 15
-
-    # 食事内容 (計50点)
-    total_fiber = nutrients['fiber_sol'] + nutrients['fiber_insol']
-    if total_fiber >= 5.0:
-        xb_score += 30
-        breakdown["bio"]["reasons"].append(f"・1食で十分な食物繊維 ({total_fiber}g)")
-    elif total_fiber >= 2.0:
-        xb_score += 10
-    
-    if nutrients['magnesium'] >= 30: # Mgは腸の蠕動運動に寄与
-        xb_score += 20
-        breakdown["bio"]["reasons"].append("・マグネシウムによる代謝補助")
-
-    xb_score = min(100, xb_score)
-    breakdown["bio"]["score"] = xb_score
-    
-    # ==========================================
-    # 3. X_dop: ドーパミン・神経伝達物質合成能 (Max 100)
-    # ==========================================
-    xdo_score = 0
-    
-    # 習慣 (計40点)
-    if habit_answers.get("protein") == "毎食摂取": xdo_score += 20
-    if habit_answers.get("bluefish") in ["週2回以上", "週1回"]: xdo_score += 20
-
-    # 食事内容 (計60点: NT-Index簡易版)
-    # ドーパミン合成には アミノ酸(タンパク質) + 鉄 + 葉酸/B群 + 亜鉛 が必須
-    mat_score = 0
-    if nutrients['protein'] >= 20: mat_score += 20
-    elif nutrients['protein'] >= 10: mat_score += 10
-    
-    if nutrients['iron'] >= 2.0: mat_score += 10
-    if nutrients['zinc'] >= 3.0: mat_score += 10
-    if nutrients['vit_b1'] >= 0.1: mat_score += 10
-    if nutrients['vit_d'] >= 5.0: mat_score += 10 # セロトニン/ドーパミン調整
-    
-    xdo_score += mat_score
-    if mat_score >= 40:
-        breakdown["dop"]["reasons"].append("・神経伝達物質の原料が豊富")
-    
-    xdo_score = min(100, xdo_score)
-    breakdown["dop"]["score"] = xdo_score
-
-    # ==========================================
-    # 4. X_risk: 炎症・阻害リスク因子 (Max 100)
-    # ==========================================
-    xr_score = 0
-    risk_reasons = []
-
-    # 習慣・摂取頻度 (高いほどリスク大)
-    if habit_answers.get("gluten") in ["ほぼ毎日", "週3-5回"]: xr_score += 10
-    if habit_answers.get("fastfood") == "週3回以上": xr_score += 15
-    if habit_answers.get("processed_meat") in ["ほぼ毎日", "週3-5回"]: xr_score += 10
-    if habit_answers.get("carbs") == "過剰(菓子パン等含む)": xr_score += 15
-    if habit_answers.get("snack") == "毎日甘いもの": xr_score += 10
-    if habit_answers.get("alcohol") == "ほぼ毎日": xr_score += 10
-    if habit_answers.get("late_night") == "寝る直前が多い": xr_score += 10
-
-    # プロフィール要因
-    if user_profile.get("stress_level") == "High":
-        xr_score += 20
-        risk_reasons.append("・高ストレスによるコルチゾール負荷")
-    
-    # アレルギー不整合
-    if "グルテン" in user_profile.get("allergies", []) and habit_answers.get("gluten") != "週1回未満":
-        xr_score += 20
-        risk_reasons.append("・アレルギー物質の摂取リスク")
-
-    xr_score = min(100, xr_score)
-    breakdown["risk"]["score"] = xr_score
-    breakdown["risk"]["reasons"] = risk_reasons
-
-    # ==========================================
-    # Final Calculation (NNBI Formula)
-    # M = 20 + 0.35(Diet) + 0.25(Bio) + 0.20(Dop) - 0.20(Risk)
-    # ==========================================
-    
-    # 各係数
-    w_diet = 0.35
-    w_bio = 0.25
-    w_dop = 0.20
-    w_risk = 0.20
-    alpha = 20 # ベースライン切片
-
-    calculation = alpha + (xd_score * w_diet) + (xb_score * w_bio) + (xdo_score * w_dop) - (xr_score * w_risk)
-    final_score = int(max(0, min(100, calculation))) # 0-100にクリップ
-
-    return final_score, breakdown
-
-def predict_constitution(answers):
-    # 体質予測ロジック（そのまま維持）
-    heavy_carbs = answers.get("carbs") in ["多い(毎日大盛り)", "過剰(菓子パン等含む)"]
-    heavy_gluten = answers.get("gluten") in ["週3-5回", "ほぼ毎日"]
-    heavy_fastfood = answers.get("fastfood") in ["週3回以上"]
-    heavy_procmeat = answers.get("processed_meat") in ["週3-5回", "ほぼ毎日"]
-    low_protein = answers.get("protein") in ["1日1食", "それ以下"]
-    low_fish = answers.get("fish") in ["月1-3回", "ほとんど食べない"]
-
-    if heavy_carbs or heavy_gluten:
-        return {"type": "糖質依存・血糖値スパイク型", "desc": "血糖値の乱高下により、気分の波が不安定になりやすい体質"}
-    elif heavy_fastfood or heavy_procmeat:
-        return {"type": "慢性炎症・内臓疲労型", "desc": "腸内環境が乱れやすく、慢性的な疲労感を感じやすい体質"}
-    elif low_protein or low_fish:
-        return {"type": "タンパク質不足・エネルギー欠乏型", "desc": "意欲低下や集中力不足に陥りやすい体質"}
-    else:
-        return {"type": "バランス維持型", "desc": "比較的良好なバランスですが、油断は禁物な体質"}
+    key = (image.key, api_token) if image and api_token else None
+    if st.session_state['speculative_key'] == key:
+        return
+    cancel_speculative_analysis()
+    if key is None:
+        return
+    from analysis_worker import WorkerBusyError
+    try:
+        job = get_analysis_worker().submit(image, api_token, speculative=True)
+    except WorkerBusyError:
+        return  # 混雑時は先読みせず、ボタンを押したときに改めて依頼する
+    get_session_store().track_job(st.session_state['session_id'], job)
+    st.session_state['speculative_job'] = job
+    st.session_state['speculative_key'] = key
+    metrics.count_speculative('started')
+
+def cancel_speculative_analysis():
+    job = st.session_state['speculative_job']
+    if job is not None and job.cancel():
+        metrics.count_speculative('cancelled')
+    st.session_state['speculative_job'] = None
+    st.session_state['speculative_key'] = None
+
+def take_speculative_analysis():
+    # 先読みしたジョブを解析ボタンの結果として引き取る (取り消さない)。なければ (期限切れを含む) None
+    job = st.session_state['speculative_job']
+    if job is not None and not get_analysis_worker().claim(job):
+        job = None
+    if job is not None:
+        metrics.count_speculative('used_done' if job.done else 'used_running')
+    st.session_state['speculative_job'] = None
+    st.session_state['speculative_key'] = None
+    return job
+
+def collect_analysis():
+    """
+    バックグラウンド解析の結果を受け取る
+    未完了なら進捗を表示して False を返す (完了するとフラグメントが画面全体を再実行する)
+    """
+    job = st.session_state['analysis_job']
+    if not job.done:
+        show_analysis_progress()
+        return False
+
+    from analysis_worker import DEMO_INGREDIENTS
+    from ingredients import IngredientTable
+
+    st.session_state['analysis_job'] = None
+    rows = job.result()
+    for level, message in job.messages:
+        getattr(st, level)(message)
+    set_ingredients(IngredientTable.from_rows(rows if rows is not None else DEMO_INGREDIENTS))
+    return True
+
+@st.fragment(run_every=0.5)
+def show_analysis_progress():
+    metrics.start_run('analysis_progress')
+    job = st.session_state['analysis_job']
+    if job is None or job.done:
+        rerun('analysis_done')
+    st.info(f"⏳ {job.status_label}")
 
 # --- グラフ描画関数 ---
 
-def draw_pfc_balance(protein, fat, carbs):
-    labels = ['タンパク質', '脂質', '炭水化物']
-    values = [protein, fat, carbs]
-    if sum(values) == 0: return None
-    fig = go.Figure(data=[go.Pie(
-        labels=labels, values=values, hole=.4,
-        marker=dict(colors=['#1f77b4', '#ff7f0e', '#2ca02c']),
-        textinfo='label+percent'
-    )])
-    fig.update_layout(margin=dict(l=0, r=0, t=0, b=0), height=150, showlegend=False)
-    return fig
-
-def draw_score_gauge(score):
-    fig = go.Figure(go.Indicator(
-        mode = "gauge+number", value = score,
-        domain = {'x': [0, 1], 'y': [0, 1]},
-        title = {'text': "NNBI総合スコア"},
-        gauge = {
-            'axis': {'range': [None, 100]},
-            'bar': {'color': "darkblue"},
-            'steps': [
-                {'range': [0, 60], 'color': "lightgray"},
-                {'range': [60, 80], 'color': "gray"},
-                {'range': [80, 100], 'color': "lightblue"}],
-            'threshold': {'line': {'color': "red", 'width': 4}, 'thickness': 0.75, 'value': score}}))
-    fig.update_layout(height=250, margin=dict(l=20, r=20, t=30, b=20))
-    return fig
+def show_chart(chart):
+    # chart は Plotly の図、または軽量表示用の HTML
+    if chart is None:  # 食材がすべて削除された場合など
+        return
+    if isinstance(chart, str):
+        st.markdown(chart, unsafe_allow_html=True)
+    else:
+        st.plotly_chart(chart, width="stretch")
 
 # --- ページ定義: 入力画面 (Page 1: 分割ステップ) ---
 
@@ -320,19 +219,19 @@ def page_input_screen():
             col1, col2 = st.columns(2)
             with col1:
                 st.markdown("##### 基礎栄養バランス")
-                q_gluten = st.radio("1. グルテン(小麦)", ["週1回未満", "週1-2回", "週3-5回", "ほぼ毎日"], index=None)
-                q_prot = st.radio("2. タンパク質摂取", ["毎食摂取", "1日2食", "1日1食", "それ以下"], index=None)
-                q_fiber = st.radio("3. 食物繊維(野菜)", ["1日3皿分以上", "1日2皿分", "1日1皿分", "それ以下"], index=None)
-                q_carbs = st.radio("4. 糖質(ご飯・パン等)", ["適量(茶碗1杯/食)", "やや多い(時々大盛り)", "多い(毎日大盛り)", "過剰(菓子パン等含む)"], index=None)
-                q_fish = st.radio("5. 魚全般", ["週3回以上", "週1-2回", "月1-3回", "ほとんど食べない"], index=None)
+                q_gluten = st.radio("1. グルテン(小麦)", HABIT_OPTIONS["gluten"], index=None)
+                q_prot = st.radio("2. タンパク質摂取", HABIT_OPTIONS["protein"], index=None)
+                q_fiber = st.radio("3. 食物繊維(野菜)", HABIT_OPTIONS["fiber"], index=None)
+                q_carbs = st.radio("4. 糖質(ご飯・パン等)", HABIT_OPTIONS["carbs"], index=None)
+                q_fish = st.radio("5. 魚全般", HABIT_OPTIONS["fish"], index=None)
             
             with col2:
                 st.markdown("##### 食品の質")
-                q_chicken = st.radio("6. 鶏肉", ["週3回以上", "週1-2回", "月1-3回", "ほとんど食べない"], index=None)
-                q_fastfood = st.radio("7. ファストフード", ["月1回未満", "月2-3回", "週1-2回", "週3回以上"], index=None)
-                q_procmeat = st.radio("8. 加工肉(ハム等)", ["週1回未満", "週1-2回", "週3-5回", "ほぼ毎日"], index=None)
-                q_fermented = st.radio("9. 発酵食品(納豆・キムチ)", ["ほぼ毎日", "週3-4回", "週1-2回", "それ以下"], index=None)
-                q_bluefish = st.radio("10. 青魚(Omega-3)", ["週2回以上", "週1回", "月1-3回", "ほとんど食べない"], index=None)
+                q_chicken = st.radio("6. 鶏肉", HABIT_OPTIONS["chicken"], index=None)
+                q_fastfood = st.radio("7. ファストフード", HABIT_OPTIONS["fastfood"], index=None)
+                q_procmeat = st.radio("8. 加工肉(ハム等)", HABIT_OPTIONS["processed_meat"], index=None)
+                q_fermented = st.radio("9. 発酵食品(納豆・キムチ)", HABIT_OPTIONS["fermented"], index=None)
+                q_bluefish = st.radio("10. 青魚(Omega-3)", HABIT_OPTIONS["bluefish"], index=None)
             
             submitted_1 = st.form_submit_button("次へ (質問 11-20へ)", type="primary")
             
@@ -341,12 +240,12 @@ def page_input_screen():
                 if any(x is None for x in required):
                     st.error("すべての項目に回答してください。")
                 else:
-                    st.session_state['habit_answers'].update({
+                    session_data().update_answers({
                         "gluten": q_gluten, "protein": q_prot, "fiber": q_fiber, "carbs": q_carbs, "fish": q_fish,
                         "chicken": q_chicken, "fastfood": q_fastfood, "processed_meat": q_procmeat, "fermented": q_fermented, "bluefish": q_bluefish
                     })
                     st.session_state['input_step'] = 2
-                    st.rerun()
+                    rerun('input_step')
 
     # --- Step 2: 質問 11-20 & プロフィール ---
     elif step == 2:
@@ -357,26 +256,26 @@ def page_input_screen():
             col1, col2 = st.columns(2)
             with col1:
                 st.markdown("##### 生活リズム・水分")
-                q_water = st.radio("11. 1日の水分摂取量(水・茶)", ["1.5L以上", "1.0L-1.5L", "1.0L未満", "あまり飲まない"], index=None)
-                q_caffeine = st.radio("12. カフェイン(コーヒー等)", ["飲まない", "1日1-2杯", "1日3-4杯", "1日5杯以上"], index=None)
-                q_alcohol = st.radio("13. アルコール頻度", ["飲まない", "週1-2回", "週3-5回", "ほぼ毎日"], index=None)
-                q_eat_speed = st.radio("14. 食べる速さ", ["ゆっくり(20分以上)", "普通(10-20分)", "早い(10分未満)", "極めて早い"], index=None)
-                q_breakfast = st.radio("15. 朝食の習慣", ["毎日食べる", "週3-4回", "週1-2回", "食べない"], index=None)
+                q_water = st.radio("11. 1日の水分摂取量(水・茶)", HABIT_OPTIONS["water"], index=None)
+                q_caffeine = st.radio("12. カフェイン(コーヒー等)", HABIT_OPTIONS["caffeine"], index=None)
+                q_alcohol = st.radio("13. アルコール頻度", HABIT_OPTIONS["alcohol"], index=None)
+                q_eat_speed = st.radio("14. 食べる速さ", HABIT_OPTIONS["eat_speed"], index=None)
+                q_breakfast = st.radio("15. 朝食の習慣", HABIT_OPTIONS["breakfast"], index=None)
             
             with col2:
                 st.markdown("##### 間食・嗜好")
-                q_late_night = st.radio("16. 就寝前の食事", ["寝る3時間前まで", "寝る2時間前", "寝る1時間前", "寝る直前が多い"], index=None)
-                q_veg_variety = st.radio("17. 1日の野菜の種類", ["5種類以上", "3-4種類", "1-2種類", "ほぼ食べない"], index=None)
-                q_dairy = st.radio("18. 乳製品(牛乳・チーズ)", ["適度(1日1杯/個)", "飲まない/食べない", "やや多い", "過剰に摂る"], index=None)
-                q_snack = st.radio("19. 甘いおやつ・間食", ["ほとんど食べない", "週1-2回", "週3-4回", "毎日甘いもの"], index=None)
-                q_oil = st.radio("20. 油の質(主に使用するもの)", ["オリーブ/アマニ油中心", "サラダ油/キャノーラ油", "動物性油脂", "揚げ物が多い"], index=None)
+                q_late_night = st.radio("16. 就寝前の食事", HABIT_OPTIONS["late_night"], index=None)
+                q_veg_variety = st.radio("17. 1日の野菜の種類", HABIT_OPTIONS["veg_variety"], index=None)
+                q_dairy = st.radio("18. 乳製品(牛乳・チーズ)", HABIT_OPTIONS["dairy"], index=None)
+                q_snack = st.radio("19. 甘いおやつ・間食", HABIT_OPTIONS["snack"], index=None)
+                q_oil = st.radio("20. 油の質(主に使用するもの)", HABIT_OPTIONS["oil"], index=None)
             
             st.markdown("---")
             st.markdown("**👤 プロフィール**")
-            stress_level = st.select_slider("直近のストレスレベル", options=["Low", "Medium", "High"])
-            selected_allergies = st.multiselect("アレルギー・除去対象", ["グルテン", "カゼイン", "卵", "乳製品", "そば", "落花生", "えび", "かに"])
+            stress_level = st.select_slider("直近のストレスレベル", options=STRESS_LEVELS)
+            selected_allergies = st.multiselect("アレルギー・除去対象", ALLERGY_OPTIONS)
             medical_history = st.text_input("既往歴 (任意)", placeholder="例: 糖尿病、高血圧、貧血など")
-            selected_supplements = st.multiselect("サプリメント摂取状況 (任意)", ["ビタミンD", "亜鉛", "ケルセチン", "乳酸菌"])
+            selected_supplements = st.multiselect("サプリメント摂取状況 (任意)", SUPPLEMENT_OPTIONS)
 
             submitted_2 = st.form_submit_button("次へ (画像アップロードへ)", type="primary")
             
@@ -385,17 +284,17 @@ def page_input_screen():
                 if any(x is None for x in required):
                     st.error("すべての項目に回答してください。")
                 else:
-                    st.session_state['habit_answers'].update({
+                    session_data().update_answers({
                         "water": q_water, "caffeine": q_caffeine, "alcohol": q_alcohol, "eat_speed": q_eat_speed,
                         "breakfast": q_breakfast, "late_night": q_late_night, "veg_variety": q_veg_variety,
                         "dairy": q_dairy, "snack": q_snack, "oil": q_oil
                     })
-                    st.session_state['user_profile'] = {
+                    session_data().user_profile = {
                         "stress_level": stress_level, "allergies": selected_allergies,
                         "medical_history": medical_history, "supplements": selected_supplements
                     }
                     st.session_state['input_step'] = 3
-                    st.rerun()
+                    rerun('input_step')
 
     # --- Step 3: 画像アップロード & 解析開始 ---
     elif step == 3:
@@ -404,63 +303,234 @@ def page_input_screen():
         
         with st.expander("▶ 開発者オプション: LogMeal API設定"):
             api_token = st.text_input("LogMeal API Token (空欄の場合はデモモード)", type="password")
+            cache_stats = get_analysis_worker().cache.stats()
+            st.caption(f"認識結果キャッシュ: ヒット {cache_stats['total_hits']} / ミス {cache_stats['total_misses']} "
+                       f"({cache_stats['entries']}件, {cache_stats['bytes'] / 1024:.0f} KB)")
+            footprint = get_session_store().footprint()
+            own = footprint['per_session'].get(st.session_state['session_id'], 0)
+            st.caption(f"セッションデータ: {footprint['sessions']}件, 常駐 {footprint['resident_bytes'] / 1024:.0f} KB "
+                       f"(このセッション {own / 1024:.1f} KB), 退避画像 {footprint['spilled_bytes'] / 1024:.0f} KB, "
+                       f"破棄 {footprint['evicted']}件")
 
         uploaded_file = st.file_uploader("写真を選択", type=["jpg", "png", "jpeg"])
         
         if uploaded_file:
-            st.image(uploaded_file, width=300)
-            st.session_state['uploaded_file'] = uploaded_file
+            # 同じファイルの再実行ではデコードし直さない
+            if st.session_state['uploaded_file_id'] != uploaded_file.file_id:
+                from image_prep import prepare_image
+                try:
+                    # 送信用 JPEG は一時ファイルへ退避し、メモリにはサムネイルだけを残す
+                    get_session_store().set_image(st.session_state['session_id'], prepare_image(uploaded_file.getvalue()))
+                    st.session_state['uploaded_file_id'] = uploaded_file.file_id
+                except OSError:
+                    get_session_store().set_image(st.session_state['session_id'], None)
+                    st.session_state['uploaded_file_id'] = None
+                    st.error("画像を読み込めませんでした。別の写真を選択してください。")
+        image = session_data().image if uploaded_file else None
+        # 写真が決まった時点で解析を始めておく (ボタンを押す頃には終わっていることが多い)
+        start_speculative_analysis(image, api_token)
+
+        if image:
+            st.image(image.thumbnail_bytes, width=300)
             
             if st.button("分析を開始する", type="primary"):
-                st.session_state['ingredients_df'] = analyze_image(uploaded_file, api_token)
-                st.session_state['page'] = 'result'
-                st.rerun()
+                from analysis_worker import WorkerBusyError
+                try:
+                    job = take_speculative_analysis()
+                    if job is None:
+                        job = get_analysis_worker().submit(image, api_token)
+                        get_session_store().track_job(st.session_state['session_id'], job)
+                    st.session_state['analysis_job'] = job
+                except WorkerBusyError:
+                    st.error("現在解析が混み合っています。しばらくしてから再度お試しください。")
+                else:
+                    set_ingredients(None)
+                    st.session_state['page'] = 'result'
+                    rerun('analysis_start')
         
         if st.button("← アンケートに戻る"):
+            cancel_speculative_analysis()
             st.session_state['input_step'] = 2
-            st.rerun()
+            rerun('input_step')
+
+# --- 改善シミュレーション ---
+
+def show_improvements(habit_answers, user_profile, nutrients, final_score):
+    """回答 (習慣) を変えた場合にスコアが上がる変更の一覧"""
+    import pandas as pd
+    from scoring import HABIT_LABELS
+    from what_if import MAX_CHANGES, improvements
+
+    max_changes = st.radio("同時に見直す習慣の数", list(range(1, MAX_CHANGES + 1)), index=1, horizontal=True,
+                           format_func=lambda k: f"{k}つまで")
+    ranked = improvements(habit_answers, user_profile, nutrients, max_changes=max_changes)
+    if not ranked:
+        st.info("今回の食事では、回答を変えてもスコアは上がりません。")
+        return
+    st.caption(f"現在のスコア {final_score} 点から、上がり幅の大きい順 (今回の食事内容のまま習慣だけを変えた場合)")
+    st.dataframe(pd.DataFrame([
+        {
+            "見直す習慣": " / ".join(f"{HABIT_LABELS[q]}: {before or '未回答'} → {after}" for q, before, after in r["changes"]),
+            "スコア": r["score"],
+            "上昇幅": f"+{r['delta']}",
+        }
+        for r in ranked
+    ]), hide_index=True, width="stretch")
+
+# --- 食事記録 ---
+
+def diary_owner():
+    """
+    食事記録の持ち主を (user_id, URL に載せる鍵) で返す。記録を始めていなければ (None, None)
+    ログイン中 (st.login) はそのアカウント、それ以外はサーバーで発行した推測できない鍵で区別する
+    """
+    from meal_diary import account_user_id, token_user_id
+
+    if st.user.get("is_logged_in"):
+        return account_user_id(st.user.get("sub") or st.user.get("email")), None
+    for token in (st.session_state['diary_token'], st.query_params.get("diary")):
+        user_id = token_user_id(token)
+        if user_id is not None:
+            st.session_state['diary_token'] = token
+            return user_id, token
+    return None, None
+
+def show_meal_diary(edited_df, final_score, partial):
+    """今回の食事の記録ボタンと、今日・直近7日間の集計"""
+    import datetime
+    import pandas as pd
+    from ingredients import IngredientTable
+    from meal_diary import average_nutrients, new_diary_token
+    from scoring import score_with_partial
+
+    user_id, token = diary_owner()
+    if user_id is None:
+        st.caption("記録を始めると、この食事を記録して1日・1週間単位で採点できます。")
+        if st.button("食事の記録を始める"):
+            st.session_state['diary_token'] = new_diary_token()
+            rerun('start_diary')
+        return
+    if token is not None:
+        st.query_params["diary"] = token  # 再読み込み・ブックマークで同じ記録を開く
+        st.caption("このページのURLが食事記録の鍵です。他の人に共有しないでください。")
+    diary = get_meal_diary()
+
+    recorded = st.session_state['recorded_meal'] == (user_id, st.session_state['ingredients_version'])
+    if st.button("この食事を記録する", disabled=recorded or len(edited_df) == 0):
+        # 編集後の食材表を記録する
+        diary.add_meal(user_id, IngredientTable.from_frame(edited_df), score=final_score)
+        st.session_state['recorded_meal'] = (user_id, st.session_state['ingredients_version'])
+        rerun('record_meal')
+    if recorded:
+        st.success("この食事を記録しました。")
+
+    # 1日・1週間の摂取量は1食あたりの平均で採点する (採点ルールは1食分の量が前提)
+    today = datetime.date.today()
+    d_col, w_col = st.columns(2)
+    for col, label, rolling in ((d_col, "今日", False), (w_col, "直近7日間", True)):
+        meals, totals = diary.day_totals(user_id, today, rolling=rolling)
+        with col:
+            if meals:
+                score, _ = score_with_partial(partial, average_nutrients(meals, totals))
+                st.metric(f"{label}のスコア ({meals}食の平均)", score)
+            else:
+                st.metric(f"{label}のスコア", "-")
+
+    daily = diary.daily_totals(user_id, today - datetime.timedelta(days=6), today)
+    if daily:
+        st.dataframe(pd.DataFrame([
+            {"日付": day, "食事数": meals, **{label: round(totals[label], 1) for label in
+                                              ("カロリー(kcal)", "タンパク質(g)", "脂質(g)", "炭水化物(g)")}}
+            for day, meals, totals in daily
+        ]), hide_index=True, width="stretch")
 
 # --- ページ定義: 結果画面 (Page 2) ---
 
 def page_result_screen():
+    import pandas as pd
+    from charts import pfc_chart, score_chart
+    from incremental import IncrementalScorer, IncrementalTotals
+    from ingredients import CATEGORIES, NUTRIENT_LABELS, IngredientTable, describe_problems
+
     st.title("分析結果レポート (NNBI Model)")
     if st.button("← 入力画面へ戻る"):
-        st.session_state['page'] = 'input'
-        st.session_state['input_step'] = 1 # 最初からやり直す場合
-        st.session_state['uploaded_file'] = None
-        st.rerun()
+        restart_input() # 最初からやり直す場合
+        rerun('restart')
+    # ウィジェットの状態はページ移動で消えるため、選択は lite_charts に保持する
+    st.session_state['lite_charts'] = st.toggle(
+        "軽量表示 (通信量の少ない簡易グラフ)", value=st.session_state['lite_charts'], key='lite_charts_toggle')
     st.divider()
 
+    if st.session_state['analysis_job'] is not None and not collect_analysis():
+        return
+
+    data = session_data()
+    table = data.ingredients if data.ingredients is not None else IngredientTable.from_rows([])
+
     # --- 1. 今回の食事データ詳細 (編集・確認) ---
     st.header("1. 今回の食事データ詳細")
     
     col_img, col_data = st.columns([1, 2], gap="large")
     
     with col_img:
-        if st.session_state['uploaded_file']:
-            st.image(st.session_state['uploaded_file'], caption="解析画像", width=250)
+        if data.image:
+            st.image(data.image.thumbnail_bytes, caption="解析画像", width=250)
     
     with col_data:
         st.subheader("解析データ編集")
         st.info("食材や分量が異なる場合は修正してください。下の栄養素とスコアに即座に反映されます。")
+        # 編集内容は元の表との差分として data_editor が保持する。再実行はせず、差分をそのまま合計に反映する
+        editor_key = f"ingredient_editor_{st.session_state['ingredients_version']}"
+        # 入力できる値を列の型で制限する (数値は0以上、カテゴリは選択式)
+        column_config = {label: st.column_config.NumberColumn(min_value=0.0, step=0.01) for label in NUTRIENT_LABELS}
+        column_config["カテゴリ"] = st.column_config.SelectboxColumn(options=CATEGORIES)
         edited_df = st.data_editor(
-            st.session_state['ingredients_df'],
+            table.to_frame(),
             num_rows="dynamic",
-            use_container_width=True,
-            key="ingredient_editor"
+            width="stretch",
+            column_config=column_config,
+            key=editor_key
         )
-        if not edited_df.equals(st.session_state['ingredients_df']):
-            st.session_state['ingredients_df'] = edited_df
-            st.rerun()
-
-    nutrients = calculate_total_nutrients(st.session_state['ingredients_df'])
+        food_db = get_food_db()
+        # 全件を選択肢に送らず、入力した文字列の候補だけを表示する
+        query = st.text_input("食品データベースから追加", placeholder="食品名を入力して検索 (例: ほうれん草)")
+        if food_db.demo:
+            st.caption("デモ用の食品データベース (数件) です。NNBI_FOODS_CSV で成分表の CSV を指定してください。")
+        if query:
+            candidates = food_db.suggest(query)
+            add_col, add_btn_col = st.columns([3, 1], vertical_alignment="bottom")
+            with add_col:
+                new_food = st.selectbox("候補", candidates, index=0 if candidates else None,
+                                        placeholder="該当する食品がありません")
+            with add_btn_col:
+                if st.button("追加", disabled=new_food is None):
+                    new_row = pd.DataFrame([food_db.lookup(new_food)])
+                    set_ingredients(IngredientTable.from_frame(pd.concat([edited_df, new_row], ignore_index=True)))
+                    rerun('add_food')
+
+    if st.session_state['ingredient_totals'] is None:
+        st.session_state['ingredient_totals'] = IncrementalTotals(table)
+    totals = st.session_state['ingredient_totals']
+    edit_state = st.session_state.get(editor_key)
+    # 同じ表の編集状態が前回の実行から変わっていれば、この実行は食材表の編集による再実行
+    signature = (editor_key, repr(edit_state))
+    previous = st.session_state['editor_signature']
+    if previous is not None and previous[0] == editor_key and previous != signature:
+        metrics.count_rerun('ingredient_editor')
+    st.session_state['editor_signature'] = signature
+    with metrics.span('ingredient_totals'):
+        nutrients = totals.nutrients(edit_state)
+    if totals.problems:
+        st.warning(f"数値として読めない値を 0 として計算しています: {describe_problems(totals.problems)}")
 
     st.subheader("詳細栄養バランスとメンタルヘルス解説")
     n_col1, n_col2, n_col3 = st.columns(3)
     
     with n_col1:
         st.markdown("**基本栄養素 & PFC**")
-        st.plotly_chart(draw_pfc_balance(nutrients['protein'], nutrients['fat'], nutrients['carbs']), use_container_width=True)
+        with metrics.span('pfc_chart'):
+            show_chart(pfc_chart(nutrients['protein'], nutrients['fat'], nutrients['carbs'],
+                                 lite=st.session_state['lite_charts']))
         st.write(f"**🥩 タンパク質**: {nutrients['protein']} g")
         st.write(f"**🍚 糖質**: {nutrients['carbs']} g")
         st.write(f"**💧 脂質**: {nutrients['fat']} g")
@@ -484,17 +554,25 @@ def page_result_screen():
     # --- 2. メンタルヘルス総合スコア ---
     st.header("2. メンタルヘルス総合スコア (NNBI)")
 
-    constitution = predict_constitution(st.session_state['habit_answers'])
-    final_score, score_breakdown = calculate_comprehensive_score(
-        st.session_state['habit_answers'],
-        st.session_state['user_profile'],
-        nutrients,
-        constitution
-    )
+    if st.session_state['nnbi_scorer'] is None:
+        st.session_state['nnbi_scorer'] = IncrementalScorer()
+    scorer = st.session_state['nnbi_scorer']
+    # 習慣部分と体質タイプは回答・プロフィールが同じならキャッシュを使う
+    habit_answers, user_profile = data.habit_answers, data.user_profile
+    with metrics.span('scoring'):
+        partial = scorer.partial(habit_answers, user_profile)
+        constitution = partial['constitution']
+        # 入力 (栄養素・回答) が変わったサブスコアだけ再計算
+        final_score, score_breakdown = scorer.score(
+            habit_answers,
+            user_profile,
+            nutrients
+        )
 
     col_gauge, col_desc = st.columns([1, 1.5])
     with col_gauge:
-        st.plotly_chart(draw_score_gauge(final_score), use_container_width=True)
+        with metrics.span('score_chart'):
+            show_chart(score_chart(final_score, lite=st.session_state['lite_charts']))
     with col_desc:
         st.markdown(f"### あなたの体質タイプ: **{constitution['type']}**")
         st.info(constitution['desc'])
@@ -507,28 +585,28 @@ def page_result_screen():
 
     with b_col1:
         st.markdown("#### $X_{diet}$ 食事質")
-        st.metric("Weight: 35%", f"{score_breakdown['diet']['score']}")
+        st.metric(f"Weight: {W_DIET:.0%}", f"{score_breakdown['diet']['score']}")
         st.caption("野菜・魚・油などの食事パターン")
         for r in score_breakdown['diet']['reasons']:
             st.write(r)
 
     with b_col2:
         st.markdown("#### $X_{bio}$ 腸内環境")
-        st.metric("Weight: 25%", f"{score_breakdown['bio']['score']}")
+        st.metric(f"Weight: {W_BIO:.0%}", f"{score_breakdown['bio']['score']}")
         st.caption("食物繊維・発酵食品・腸脳相関")
         for r in score_breakdown['bio']['reasons']:
             st.write(r)
 
     with b_col3:
         st.markdown("#### $X_{dop}$ 脳内物質")
-        st.metric("Weight: 20%", f"{score_breakdown['dop']['score']}")
+        st.metric(f"Weight: {W_DOP:.0%}", f"{score_breakdown['dop']['score']}")
         st.caption("タンパク質・ミネラル・神経伝達")
         for r in score_breakdown['dop']['reasons']:
             st.write(r)
 
     with b_col4:
         st.markdown("#### $X_{risk}$ リスク")
-        st.metric("Weight: -20%", f"{score_breakdown['risk']['score']}")
+        st.metric(f"Weight: -{W_RISK:.0%}", f"{score_breakdown['risk']['score']}")
         st.caption("炎症・糖質・ストレス負荷")
         for r in score_breakdown['risk']['reasons']:
             st.write(r)
@@ -536,16 +614,43 @@ def page_result_screen():
     # 数式の表示更新
     st.success(f"""
     **最終スコア算出式 (NNBI Model):**
-    $$ M = 20(Base) + 0.35({score_breakdown['diet']['score']}) + 0.25({score_breakdown['bio']['score']}) + 0.20({score_breakdown['dop']['score']}) - 0.20({score_breakdown['risk']['score']}) $$
+    $$ M = {ALPHA:g}(Base) + {W_DIET:.2f}({score_breakdown['diet']['score']}) + {W_BIO:.2f}({score_breakdown['bio']['score']}) + {W_DOP:.2f}({score_breakdown['dop']['score']}) - {W_RISK:.2f}({score_breakdown['risk']['score']}) $$
     $$ \\approx \mathbf{{ {final_score} 点 }} $$
     """)
+    st.caption(f"係数の版: {WEIGHTS_VERSION}")
+
+    # --- 3. 改善シミュレーション ---
+    st.divider()
+    st.header("3. 改善シミュレーション")
+    with metrics.span('what_if'):
+        show_improvements(habit_answers, user_profile, nutrients, final_score)
+
+    # --- 4. 食事記録 ---
+    st.divider()
+    st.header("4. 食事記録")
+    with metrics.span('meal_diary'):
+        show_meal_diary(edited_df, final_score, partial)
 
 # --- メインルーティング ---
 
-if st.session_state['page'] == 'input':
-    page_input_screen()
-elif st.session_state['page'] == 'result':
-    page_result_screen()
+# 長時間操作がなくセッションデータが破棄されていたら、最初からやり直してもらう
+if not session_data().answers and (st.session_state['page'] != 'input' or st.session_state['input_step'] > 1):
+    restart_input()
+    st.warning("一定時間操作がなかったため、入力内容を破棄しました。お手数ですが最初から入力してください。")
+
+# 段階ごとの所要時間は NNBI_METRICS_SAMPLE_RATE の割合の実行だけで記録する (metrics.py)
+start_metrics_server()
+metrics.start_run(st.session_state['page'])
+with metrics.span('script_run'):
+    if st.session_state['page'] == 'input':
+        page_input_screen()
+    elif st.session_state['page'] == 'result':
+        page_result_screen()
+metrics.export_periodically()
+
+def weighted_term(weight, name, label):
+    # 理論式の1項 (係数・変数・割合の注記) の LaTeX
+    return rf"\underbrace{{{weight:.2f} \cdot X_{{{name}}}}}_{{\text{{{label}({weight * 100:.0f}\%)}}}}"
 
 # フッター
 st.markdown("---")
@@ -586,10 +691,16 @@ with st.expander("▼ 研究背景と数理モデル (NNBIの理論構成)"):
 
     ### ※ 重み付けの理論式 (実装済)
     各要素がメンタルヘルスに与える影響度を係数として定義。
-
-    $$
-    \text{NNBI} = \underbrace{0.35 \cdot X_{diet}}_{\text{食事パターン(35\%٪)}} + \underbrace{0.25 \cdot X_{bio}}_{\text{腸内環境(25\%٪)}} + \underbrace{0.20 \cdot X_{dop}}_{\text{ドーパミン(20\%٪)}} - \underbrace{0.20 \cdot X_{risk}}_{\text{リスク因子(20\%٪)}} + \alpha
-    $$
     """)
 
+    # 係数は採点に使っている重みファイルの値を表示する (校正で変わるため固定の数値を書かない)
+    st.markdown(
+        "$$\n"
+        rf"\text{{NNBI}} = {weighted_term(W_DIET, 'diet', '食事パターン')} + {weighted_term(W_BIO, 'bio', '腸内環境')}"
+        rf" + {weighted_term(W_DOP, 'dop', 'ドーパミン')} - {weighted_term(W_RISK, 'risk', 'リスク因子')}"
+        rf" + \underbrace{{{ALPHA:g}}}_{{\alpha}}"
+        "\n$$"
+    )
+    st.caption(f"係数の版: {WEIGHTS_VERSION}")
+
 st.caption("Developed for Nakazawa Okoshi Laboratory / WellComp B2 Research Demo")
\ No newline at end of file
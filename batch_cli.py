@@ -0,0 +1,212 @@
+# --- ヘッドレス一括採点CLI (Streamlit UI を経由しない) ---
+# 過去のアンケート・食材記録を数百万件単位で再採点するためのエントリポイント。
+# 入力はチャンク単位で読み込み、結果も逐次書き出すため、メモリ使用量はチャンクサイズで決まる。
+# Streamlit / Plotly は import しない。
+#
+# 使い方:
+#   python batch_cli.py questionnaires.csv ingredients.csv -o scores.parquet
+#   --cubes を付けると、運用ダッシュボード (dashboard.py) の集計キューブにも結果を足し込む
+#
+# 入力ファイルはどちらも回答者ID列で昇順ソートされていること (マージ結合のため)。
+#   questionnaires: 回答者ID, 20問の回答列 (scoring.HABIT_OPTIONS のキー), stress_level, allergies
+#   ingredients:    回答者ID, 食材表と同じ栄養素列 (1行=1食材)
+# 出力の各行には採点に使った係数 (weights_version と alpha, w_diet, w_bio, w_dop, w_risk の列) も書く。
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from batch_scoring import (
+    calculate_comprehensive_score_batch, calculate_total_nutrients_batch, predict_constitution_batch,
+)
+from ingredients import NUTRIENT_LABELS, TOTAL_DIGITS, nutrient_values
+from scoring import WEIGHT_KEYS, WEIGHTS
+DEFAULT_CHUNKSIZE = 100_000
+
+
+def read_chunks(path, chunksize, columns=None):
+    """CSV / Parquet をチャンク単位の DataFrame として読み込む"""
+    if os.path.splitext(path)[1].lower() == ".parquet":
+        import pyarrow.parquet as pq  # Parquet 入力時のみ必要
+
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, usecols=columns)
+
+
+def _check_sorted(ids, last_id, path, unique=False):
+    """
+    unique: 同じIDの重複も認めない (アンケートは1回答者1行。チャンク境界をまたぐ重複も二重採点になる)
+    """
+    if not ids.is_monotonic_increasing or (last_id is not None and ids.iloc[0] < last_id):
+        raise ValueError(f"{path}: 回答者IDが昇順にソートされていません")
+    if unique and (not ids.is_unique or (last_id is not None and ids.iloc[0] == last_id)):
+        raise ValueError(f"{path}: 回答者IDが重複しています")
+
+
+def iter_nutrient_totals(chunks, id_column, path="ingredients"):
+    """
+    食材チャンクを回答者ごとに合計し、確定した回答者分から順に返す
+    チャンク境界をまたぐ回答者は次のチャンクと合算してから返す
+    """
+    carry = None
+    last_id = None
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        _check_sorted(chunk[id_column], last_id, path)
+        last_id = chunk[id_column].iloc[-1]
+
+        # アプリの食材表と同じ変換 (負の値・数値にできない値は 0、float32 に丸めてから float64 で合計)
+        values, _ = nutrient_values(chunk)
+        values = pd.DataFrame(values.astype(np.float64), columns=NUTRIENT_LABELS, index=chunk.index)
+        values[id_column] = chunk[id_column]
+        totals = values.groupby(id_column, sort=False).sum()
+        if carry is not None:
+            totals = pd.concat([carry, totals]).groupby(level=0, sort=False).sum()
+        carry = totals.iloc[-1:]
+        if len(totals) > 1:
+            yield totals.iloc[:-1].round(TOTAL_DIGITS)
+    if carry is not None:
+        yield carry.round(TOTAL_DIGITS)
+
+
+class _TotalsCursor:
+    """昇順の合計ストリームから、指定IDまでの分を切り出す"""
+
+    def __init__(self, totals_iter):
+        self._iter = totals_iter
+        self._pending = None
+
+    def upto(self, max_id):
+        parts = []
+        while True:
+            if self._pending is None:
+                self._pending = next(self._iter, None)
+                if self._pending is None:
+                    break
+            cut = self._pending.index.searchsorted(max_id, side="right")
+            parts.append(self._pending.iloc[:cut])
+            if cut < len(self._pending):
+                self._pending = self._pending.iloc[cut:]
+                break
+            self._pending = None
+        if not parts:
+            return pd.DataFrame(columns=NUTRIENT_LABELS)
+        return pd.concat(parts)
+
+
+def score_chunk(answers, totals, reason_mask=False):
+    """
+    1チャンク分の採点
+    answers: 回答者ID を index とするアンケート
+    totals:  回答者ID を index とする栄養素合計 (食材記録のない回答者は 0 扱い)
+    """
+    totals = totals.reindex(answers.index).fillna(0)
+    nutrients = calculate_total_nutrients_batch(totals)
+    frame = pd.concat([answers, nutrients], axis=1)
+    scores = calculate_comprehensive_score_batch(frame, reason_mask=reason_mask)
+    constitution = predict_constitution_batch(frame).astype(str)
+    return pd.concat([nutrients, constitution, scores], axis=1)
+
+
+class _ResultWriter:
+    """
+    CSV / Parquet への逐次書き出し
+    各行に採点に使った係数を付ける (レポートは現在の係数ではなくこの値を載せる。係数の異なる結果を結合しても区別できる)
+    """
+
+    def __init__(self, path, weights=WEIGHTS):
+        self.path = path
+        self.parquet = os.path.splitext(path)[1].lower() == ".parquet"
+        self._weights = {"weights_version": str(weights["version"]),
+                         **{key: float(weights[key]) for key in WEIGHT_KEYS}}
+        self._writer = None
+        self._wrote_header = False
+
+    def write(self, df):
+        df = df.assign(**self._weights)
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            df.to_csv(self.path, mode="a" if self._wrote_header else "w",
+                      header=not self._wrote_header, index=False)
+            self._wrote_header = True
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def run(questionnaire_path, ingredients_path, output_path,
+        id_column="respondent_id", chunksize=DEFAULT_CHUNKSIZE, reason_mask=False, cubes=None):
+    """
+    一括採点を実行し、処理した回答者数を返す
+    cubes: ScoreCubes を渡すと、チャンクごとの結果をその集計に足し込む
+    """
+    totals = _TotalsCursor(iter_nutrient_totals(
+        read_chunks(ingredients_path, chunksize), id_column, ingredients_path))
+    writer = _ResultWriter(output_path)
+    count = 0
+    last_id = None
+    try:
+        for chunk in read_chunks(questionnaire_path, chunksize):
+            if chunk.empty:
+                continue
+            _check_sorted(chunk[id_column], last_id, questionnaire_path, unique=True)
+            last_id = chunk[id_column].iloc[-1]
+
+            answers = chunk.set_index(id_column)
+            result = score_chunk(answers, totals.upto(last_id), reason_mask=reason_mask)
+            writer.write(result.rename_axis(id_column).reset_index())
+            if cubes is not None:
+                cubes.add(answers, result)
+            count += len(result)
+    finally:
+        writer.close()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NNBIスコアの一括採点 (ヘッドレス)")
+    parser.add_argument("questionnaires", help="アンケート回答 (CSV / Parquet)")
+    parser.add_argument("ingredients", help="食材記録 (CSV / Parquet)")
+    parser.add_argument("-o", "--output", required=True, help="出力先 (CSV / Parquet)")
+    parser.add_argument("--id-column", default="respondent_id", help="回答者ID列名")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="1チャンクの行数")
+    parser.add_argument("--reasons", action="store_true", help="理由ビットマスク列を出力する")
+    parser.add_argument("--cubes", nargs="?", const="", default=None,
+                        help="集計キューブ (npz) に結果を足し込む。パス省略時は NNBI_CUBES_PATH / NNBI_DATA_DIR")
+    args = parser.parse_args(argv)
+
+    cubes = None
+    if args.cubes is not None:
+        from score_cubes import ScoreCubes
+
+        cubes = ScoreCubes.load(args.cubes or None, missing_ok=True)
+
+    start = time.perf_counter()
+    count = run(args.questionnaires, args.ingredients, args.output,
+                id_column=args.id_column, chunksize=args.chunksize, reason_mask=args.reasons, cubes=cubes)
+    if cubes is not None:
+        # 途中で失敗した場合は保存しない (再実行で二重に数えないため)
+        cubes.save(args.cubes or None)
+    elapsed = time.perf_counter() - start
+    print(f"{count} 件を採点しました ({elapsed:.1f} 秒)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+# --- NNBIスコア一括算出 (NumPyベクトル化版) ---
+# 保存済みアンケートの再採点など、数万件単位の採点を1回の配列演算で行う。
+# 採点ルールは scoring.py の加点表・係数を共有し、スカラー版と同じ値を返す。
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from scoring import (
+    ALLERGY_OPTIONS, ALPHA, CONSTITUTION_RULES, CONSTITUTIONS, HABIT_OPTIONS, HABIT_POINTS,
+    NUTRIENT_COLUMNS, W_BIO, W_DIET, W_DOP, W_RISK,
+)
+
+# 複数選択の値を文字列で保存したときの区切り
+_ALLERGY_SEPARATOR = re.compile(r"[;,、]")
+
+# --- 理由のビットマスク定義 ---
+# 文字列を大量生成せずに済むよう、理由はビットの組み合わせで返す
+# (ビット, サブスコア, 表示文言)
+
+REASON_DIET_PFC = 1 << 0
+REASON_DIET_VIT_C = 1 << 1
+REASON_DIET_MEDITERRANEAN = 1 << 2
+REASON_BIO_FIBER = 1 << 3
+REASON_BIO_MAGNESIUM = 1 << 4
+REASON_DOP_MATERIALS = 1 << 5
+REASON_RISK_STRESS = 1 << 6
+REASON_RISK_ALLERGY = 1 << 7
+
+REASONS = [
+    (REASON_DIET_PFC, "diet", "・PFCバランスが良好"),
+    (REASON_DIET_VIT_C, "diet", "・十分なビタミンC (抗酸化作用)"),
+    (REASON_DIET_MEDITERRANEAN, "diet", "・地中海式に近い良質な食習慣"),
+    (REASON_BIO_FIBER, "bio", "・1食で十分な食物繊維 ({total_fiber}g)"),
+    (REASON_BIO_MAGNESIUM, "bio", "・マグネシウムによる代謝補助"),
+    (REASON_DOP_MATERIALS, "dop", "・神経伝達物質の原料が豊富"),
+    (REASON_RISK_STRESS, "risk", "・高ストレスによるコルチゾール負荷"),
+    (REASON_RISK_ALLERGY, "risk", "・アレルギー物質の摂取リスク"),
+]
+
+
+def encode_answers(df):
+    """
+    回答列を選択肢番号(int8)に変換する
+    未回答・選択肢外は -1
+    """
+    codes = {}
+    for question, options in HABIT_OPTIONS.items():
+        if question in df.columns:
+            codes[question] = pd.Categorical(df[question], categories=options).codes.astype(np.int8)
+        else:
+            codes[question] = np.full(len(df), -1, dtype=np.int8)
+    return codes
+
+
+def _points_table(question, points):
+    # 末尾に 0 を置き、コード -1 (未回答) がそのまま末尾を引くようにする
+    return np.array([points.get(o, 0) for o in HABIT_OPTIONS[question]] + [0], dtype=np.int16)
+
+
+POINT_TABLES = {
+    subscore: {q: _points_table(q, points) for q, points in rules.items()}
+    for subscore, rules in HABIT_POINTS.items()
+}
+
+
+def habit_points_batch(subscore, codes):
+    """加点表を選択肢番号で引いて、習慣部分の合計点を配列で返す"""
+    n = len(next(iter(codes.values())))
+    total = np.zeros(n, dtype=np.int16)
+    for question, table in POINT_TABLES[subscore].items():
+        total += table[codes[question]]
+    return total
+
+
+def _nutrient_array(df, key):
+    column = NUTRIENT_COLUMNS[key][0]
+    if column not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[column], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+
+
+def _allergy_tokens(value):
+    """複数選択の値 (リスト、または "グルテン;卵" 形式の文字列) -> 選択肢の集合"""
+    if isinstance(value, str):
+        value = _ALLERGY_SEPARATOR.split(value)
+    return frozenset(str(token).strip() for token in value)
+
+
+def _allergy_matrix(allergies):
+    """
+    (行数, ALLERGY_OPTIONS) の bool 配列。リスト・"グルテン;卵" 形式の文字列・bool (グルテンのみ) に対応
+    区切り文字で分けた値と選択肢の完全一致で照合する (スカラー版のリストの所属判定と同じ。
+    部分一致だと「グルテンフリー食品」のような自由記述や別の選択肢を取り違える)
+    """
+    matrix = np.zeros((len(allergies), len(ALLERGY_OPTIONS)), dtype=bool)
+    if allergies.dtype == bool:
+        matrix[:, ALLERGY_OPTIONS.index("グルテン")] = allergies.to_numpy()
+        return matrix
+    # 値の種類は少ないため、異なる値ごとに1回だけ照合する (欠損は code -1 -> 末尾の全 False 行)
+    try:
+        codes, uniques = pd.factorize(allergies)
+    except TypeError:  # リストはハッシュできないため、選択肢の集合にしてからまとめる
+        codes, uniques = pd.factorize(allergies.map(_allergy_tokens, na_action="ignore"))
+    table = np.zeros((len(uniques) + 1, len(ALLERGY_OPTIONS)), dtype=bool)
+    for u, value in enumerate(uniques):
+        tokens = _allergy_tokens(value)
+        table[u] = [option in tokens for option in ALLERGY_OPTIONS]
+    matrix[:] = table[codes]
+    return matrix
+
+
+def _has_gluten_allergy(df):
+    if "allergies" not in df.columns:
+        return np.zeros(len(df), dtype=bool)
+    return _allergy_matrix(df["allergies"])[:, ALLERGY_OPTIONS.index("グルテン")]
+
+
+def calculate_total_nutrients_batch(totals):
+    """
+    calculate_total_nutrients の一括版
+    totals: 1行=1回答者の栄養素合計 (食材表と同じ列名)
+    スカラー版と同じ桁で丸めた値を同じ列名で返す
+    """
+    rounded = {}
+    for key, (column, digits) in NUTRIENT_COLUMNS.items():
+        values = _nutrient_array(totals, key)
+        rounded[column] = np.trunc(values).astype(np.int64) if digits is None else np.round(values, digits)
+    return pd.DataFrame(rounded, index=totals.index)
+
+
+def predict_constitution_batch(df):
+    """predict_constitution の一括版。体質タイプ名を Categorical で返す"""
+    codes = encode_answers(df)
+    flags = {}
+    for name, (question, options) in CONSTITUTION_RULES.items():
+        matched = [HABIT_OPTIONS[question].index(o) for o in options]
+        flags[name] = np.isin(codes[question], matched)
+    choice = np.select(
+        [
+            flags["heavy_carbs"] | flags["heavy_gluten"],
+            flags["heavy_fastfood"] | flags["heavy_procmeat"],
+            flags["low_protein"] | flags["low_fish"],
+        ],
+        [0, 1, 2],
+        default=3,
+    )
+    types = [c["type"] for c in CONSTITUTIONS]
+    return pd.Series(pd.Categorical.from_codes(choice, categories=types), index=df.index, name="constitution")
+
+
+def calculate_comprehensive_score_batch(df, reason_mask=False):
+    """
+    calculate_comprehensive_score の一括版
+    df: 1行=1回答者。20問の回答列 (HABIT_OPTIONS のキー)、
+        プロフィール列 (stress_level, allergies)、栄養素合計列 (食材表と同じ列名)
+    戻り値: diet / bio / dop / risk / score 列の DataFrame (index は df と同じ)
+            reason_mask=True の場合は reasons 列 (uint16 ビットマスク) を追加
+    """
+    n = len(df)
+    codes = encode_answers(df)
+    nut = {key: _nutrient_array(df, key) for key in NUTRIENT_COLUMNS}
+    mask = np.zeros(n, dtype=np.uint16)
+
+    # 1. X_diet
+    xd = habit_points_batch("diet", codes)
+    p, f, c = nut["protein"], nut["fat"], nut["carbs"]
+    total_g = p + f + c
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p_ratio = np.where(total_g > 0, p / total_g, 0.0)
+    pfc_ok = (total_g > 0) & (p_ratio >= 0.15) & (p_ratio <= 0.35)
+    vit_c_ok = nut["vit_c"] > 30
+    xd = np.minimum(100, xd + 20 * pfc_ok + 20 * vit_c_ok)
+    mask |= np.where(pfc_ok, REASON_DIET_PFC, 0).astype(np.uint16)
+    mask |= np.where(vit_c_ok, REASON_DIET_VIT_C, 0).astype(np.uint16)
+    mask |= np.where(xd >= 80, REASON_DIET_MEDITERRANEAN, 0).astype(np.uint16)
+
+    # 2. X_bio
+    xb = habit_points_batch("bio", codes)
+    total_fiber = nut["fiber_sol"] + nut["fiber_insol"]
+    fiber_high = total_fiber >= 5.0
+    fiber_mid = ~fiber_high & (total_fiber >= 2.0)
+    mg_ok = nut["magnesium"] >= 30
+    xb = np.minimum(100, xb + 30 * fiber_high + 10 * fiber_mid + 20 * mg_ok)
+    mask |= np.where(fiber_high, REASON_BIO_FIBER, 0).astype(np.uint16)
+    mask |= np.where(mg_ok, REASON_BIO_MAGNESIUM, 0).astype(np.uint16)
+
+    # 3. X_dop
+    xdo = habit_points_batch("dop", codes)
+    protein = nut["protein"]
+    mat = np.where(protein >= 20, 20, np.where(protein >= 10, 10, 0))
+    mat = mat + 10 * (nut["iron"] >= 2.0) + 10 * (nut["zinc"] >= 3.0)
+    mat = mat + 10 * (nut["vit_b1"] >= 0.1) + 10 * (nut["vit_d"] >= 5.0)
+    xdo = np.minimum(100, xdo + mat)
+    mask |= np.where(mat >= 40, REASON_DOP_MATERIALS, 0).astype(np.uint16)
+
+    # 4. X_risk
+    xr = habit_points_batch("risk", codes)
+    if "stress_level" in df.columns:
+        high_stress = (df["stress_level"] == "High").to_numpy()
+    else:
+        high_stress = np.zeros(n, dtype=bool)
+    rare_gluten = codes["gluten"] == HABIT_OPTIONS["gluten"].index("週1回未満")
+    allergy_risk = _has_gluten_allergy(df) & ~rare_gluten
+    xr = np.minimum(100, xr + 20 * high_stress + 20 * allergy_risk)
+    mask |= np.where(high_stress, REASON_RISK_STRESS, 0).astype(np.uint16)
+    mask |= np.where(allergy_risk, REASON_RISK_ALLERGY, 0).astype(np.uint16)
+
+    # NNBI式 (スカラー版と同じ演算順序で浮動小数点の結果を一致させる)
+    calculation = ALPHA + (xd * W_DIET) + (xb * W_BIO) + (xdo * W_DOP) - (xr * W_RISK)
+    final = np.clip(calculation, 0, 100).astype(np.int64)
+
+    result = pd.DataFrame({
+        "diet": xd.astype(np.int64),
+        "bio": xb.astype(np.int64),
+        "dop": xdo.astype(np.int64),
+        "risk": xr.astype(np.int64),
+        "score": final,
+    }, index=df.index)
+    if reason_mask:
+        result["reasons"] = mask
+    return result
+
+
+def decode_reasons(mask, nutrients=None):
+    """
+    ビットマスクを calculate_comprehensive_score と同じ形式の理由リストに戻す
+    食物繊維の理由文には合計量が入るため、必要なら nutrients を渡す
+    """
+    total_fiber = None
+    if nutrients is not None:
+        total_fiber = nutrients['fiber_sol'] + nutrients['fiber_insol']
+    reasons = {"diet": [], "bio": [], "dop": [], "risk": []}
+    for bit, subscore, text in REASONS:
+        if int(mask) & bit:
+            reasons[subscore].append(text.format(total_fiber=total_fiber))
+    return reasons
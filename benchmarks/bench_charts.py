@@ -0,0 +1,89 @@
+# --- ベンチマーク: 結果ページのグラフの送信量と描画時間 ---
+# 入力が変わらない再実行 (無関係なウィジェット操作など) を想定し、1回の再実行あたりの
+# グラフの組み立て + シリアライズ時間とブラウザへ送る要素のバイト数を比較する。
+#   before: 毎回 Plotly の図を作り直す (キャッシュ導入前)
+#   cached: 図をキャッシュし、シリアライズのみ行う
+#   lite:   軽量表示 (事前に組み立てた HTML)
+# --apptest を付けると、AppTest で結果ページ全体を再実行したときの要素サイズと所要時間も測る。
+#
+# 使い方 (リポジトリ直下で):
+#   python -m benchmarks.bench_charts --repeat 200 --apptest
+
+import argparse
+import statistics
+import time
+
+import plotly.io
+
+from charts import draw_pfc_balance, draw_score_gauge, figure_cache, pfc_chart, score_chart
+
+PFC = (47.0, 31.7, 78.5)
+SCORE = 72
+
+
+def _payload(chart):
+    # st.plotly_chart は図を JSON に、軽量表示は HTML をそのまま送る
+    if isinstance(chart, str):
+        return chart
+    return plotly.io.to_json(chart, validate=False)
+
+
+def bench_render(repeat=200):
+    modes = {
+        "before": lambda: (draw_pfc_balance(*PFC), draw_score_gauge(SCORE)),
+        "cached": lambda: (pfc_chart(*PFC), score_chart(SCORE)),
+        "lite": lambda: (pfc_chart(*PFC, lite=True), score_chart(SCORE, lite=True)),
+    }
+    results = {}
+    for mode, build in modes.items():
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            size = sum(len(_payload(chart).encode("utf-8")) for chart in build())
+            samples.append(time.perf_counter() - start)
+        results[mode] = (size, statistics.median(samples) * 1000)
+    return results
+
+
+def bench_apptest(repeat=10):
+    from benchmarks.pages import result_page
+
+    results = {}
+    for lite in (False, True):
+        at = result_page(lite=lite)
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            at.run()
+            samples.append(time.perf_counter() - start)
+        results["lite" if lite else "plotly"] = (_tree_bytes(at._tree), statistics.median(samples) * 1000)
+    return results
+
+
+def _tree_bytes(node):
+    proto = getattr(node, "proto", None)
+    size = proto.ByteSize() if hasattr(proto, "ByteSize") else 0
+    return size + sum(_tree_bytes(child) for child in getattr(node, "children", {}).values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="結果ページのグラフの送信量と描画時間")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--apptest", action="store_true", help="AppTest で結果ページ全体も測る")
+    args = parser.parse_args(argv)
+
+    print("グラフ2枚 (PFC + ゲージ) / 再実行1回あたり")
+    print(f"{'mode':<8} {'payload':>10} {'time':>10}")
+    for mode, (size, ms) in bench_render(args.repeat).items():
+        print(f"{mode:<8} {size:>8} B {ms:>7.2f} ms")
+
+    if args.apptest:
+        print("\n結果ページ全体 (AppTest) / 再実行1回あたり")
+        print(f"{'mode':<8} {'elements':>10} {'time':>10}")
+        for mode, (size, ms) in bench_apptest().items():
+            print(f"{mode:<8} {size:>8} B {ms:>7.2f} ms")
+    print(f"\nfigure cache: hits={figure_cache.hits} misses={figure_cache.misses}")
+
+
+if __name__ == "__main__":
+    main()
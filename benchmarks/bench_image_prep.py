@@ -0,0 +1,74 @@
+# --- ベンチマーク: 画像前処理あり/なしの送信量と所要時間 ---
+# スマホ写真相当の合成画像を fake_logmeal.py のスタブサーバーへ送り、
+# 元画像をそのまま送る場合 (前処理なし) と prepare_image 後に送る場合を比較する。
+#
+# 使い方 (リポジトリ直下で):
+#   python -m benchmarks.bench_image_prep --uplink-mbps 10 --repeat 5
+
+import argparse
+import io
+import statistics
+import time
+
+import numpy as np
+from PIL import Image
+
+from fake_logmeal import FakeLogMealServer
+from image_prep import prepare_image
+from logmeal_client import LogMealClient
+
+
+def synthetic_photo(width=4032, height=3024, seed=0):
+    """グラデーション + ノイズで圧縮しにくい、スマホ写真程度のサイズの JPEG を作る"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    noise = rng.integers(-40, 40, size=(height, width, 3))
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def _median_ms(samples):
+    return statistics.median(samples) * 1000
+
+
+def run(uplink_mbps=10.0, latency=0.2, repeat=5):
+    photo = synthetic_photo()
+    server = FakeLogMealServer(latency=latency, uplink_mbps=uplink_mbps).start()
+    client = LogMealClient(server.url, retries=0)
+    try:
+        before, after, prep = [], [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            client.recognize_dish(photo, "bench")
+            before.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            image = prepare_image(photo)
+            prep.append(time.perf_counter() - start)
+            client.recognize_dish(image.upload_bytes, "bench")
+            after.append(time.perf_counter() - start)
+    finally:
+        client.close()
+        server.stop()
+
+    print(f"上り帯域 {uplink_mbps} Mbps / 応答遅延 {latency * 1000:.0f} ms / {repeat} 回の中央値")
+    print(f"{'':18}{'送信バイト':>12}{'セッション保持':>14}{'所要時間(ms)':>14}")
+    print(f"{'前処理なし':14}{len(photo):>14,}{len(photo):>16,}{_median_ms(before):>16.0f}")
+    print(f"{'前処理あり':14}{len(image.upload_bytes):>14,}{image.nbytes:>16,}{_median_ms(after):>16.0f}")
+    print(f"  うち前処理 {_median_ms(prep):.0f} ms (サムネイル {len(image.thumbnail_bytes):,} bytes)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="画像前処理のベンチマーク")
+    parser.add_argument("--uplink-mbps", type=float, default=10.0)
+    parser.add_argument("--latency", type=float, default=0.2, help="スタブサーバーの応答遅延 (秒)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    run(args.uplink_mbps, args.latency, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# --- ベンチマーク: 起動時間と入力画面の初回表示 ---
+# 新しいプロセスごとに、import streamlit の時間と、AppTest で app.py を初めて実行して
+# 入力画面 (page_input_screen の Step 1) が出るまでの時間を測る。
+# --eager は遅延 import 導入前と同じく、重いモジュールを先頭でまとめて読み込んだ場合を再現する。
+#
+# 使い方 (リポジトリ直下で):
+#   python -m benchmarks.bench_startup --repeat 5
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["pandas", "numpy", "requests", "plotly", "PIL.Image", "pyarrow"]
+# 遅延 import 導入前の app.py が先頭で読み込んでいたモジュール
+EAGER_IMPORTS = ["pandas", "numpy", "plotly.graph_objects", "requests", "PIL.Image"]
+
+_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import streamlit
+from streamlit.testing.v1 import AppTest
+imported = time.perf_counter()
+for name in {eager!r}:
+    __import__(name)
+at = AppTest.from_file({app!r}, default_timeout=60)
+at.run()
+rendered = time.perf_counter()
+assert not at.exception, at.exception
+assert at.session_state["input_step"] == 1 and len(at.radio) == 10
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "first_render_ms": (rendered - imported) * 1000,
+    "loaded": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure(eager=False):
+    code = _CHILD.format(eager=EAGER_IMPORTS if eager else [], app=os.path.join(REPO_DIR, "app.py"),
+                         heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, capture_output=True,
+                            text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="起動時間と入力画面の初回表示")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"{'mode':<6} {'import streamlit':>17} {'first render':>13}  loaded")
+    for mode in ("eager", "lazy"):
+        runs = [measure(eager=mode == "eager") for _ in range(args.repeat)]
+        import_ms = statistics.median(r["import_ms"] for r in runs)
+        render_ms = statistics.median(r["first_render_ms"] for r in runs)
+        print(f"{mode:<6} {import_ms:>14.0f} ms {render_ms:>10.0f} ms  {', '.join(runs[-1]['loaded'])}")
+
+
+if __name__ == "__main__":
+    main()
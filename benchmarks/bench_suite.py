@@ -0,0 +1,340 @@
+# --- ベンチマーク: 採点・集計・ページ表示の主要経路 ---
+# 合成データ (benchmarks/synthetic.py) を 1 / 1k / 1M 行で作り、各関数と AppTest での
+# 入力画面・結果画面の表示を測る。ケースごとに 1回あたりの所要時間の分位点 (p50/p95/p99)、
+# スループット (行/秒)、ピークメモリを出し、保存したベースラインと比べる。
+# ピークメモリは Linux では実行中の RSS の最大値の増分 (計測時間に影響しない)、それ以外では tracemalloc で測る。
+#
+# スカラー版 (1件ずつ呼ぶ関数) は行数分だけ呼び出すため、--full を付けない限りケースごとの上限
+# (採点は 100k 行、改善シミュレーションは 1k 人) を超えるサイズは省く。
+# ページ表示とグラフはサイズに依存しないため 1 でのみ測る。
+#
+# 使い方 (リポジトリ直下で):
+#   python -m benchmarks.bench_suite --save benchmarks/baseline.json      # ベースラインを保存
+#   python -m benchmarks.bench_suite --compare benchmarks/baseline.json   # 比較 (悪化があれば終了コード 1)
+#   python -m benchmarks.bench_suite --sizes 1,1000 --cases score        # 一部だけ
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks import pages, synthetic
+
+DEFAULT_SIZES = (1, 1_000, 1_000_000)
+SCALAR_MAX_SIZE = 100_000
+WHAT_IF_MAX_SIZE = 1_000
+MIN_TIME = 1.0  # 1ケースあたりの最低計測時間 (秒)
+MIN_RUNS = 3
+MAX_RUNS = 1000
+DEFAULT_THRESHOLD = 0.2  # p50 / ピークメモリがベースラインよりこの割合以上悪化したら報告する
+
+
+# --- ケース定義 ---
+# setup(n) は計測対象の引数なし関数を返す (データの生成は計測に含めない)
+
+def _total_nutrients(n):
+    from scoring import calculate_total_nutrients
+
+    frame = synthetic.meals(n)
+    return lambda: calculate_total_nutrients(frame)
+
+
+def _ingredient_totals(n):
+    from ingredients import IngredientTable
+
+    table = IngredientTable.from_frame(synthetic.meals(n))
+    return table.totals
+
+
+def _comprehensive_score(n):
+    from ingredients import IngredientTable
+    from scoring import calculate_comprehensive_score, predict_constitution
+
+    pairs = synthetic.profiles(n)
+    nutrients = IngredientTable.from_frame(synthetic.meals(5)).nutrients()
+    constitution = predict_constitution(pairs[0][0])
+
+    def run():
+        for answers, profile in pairs:
+            calculate_comprehensive_score(answers, profile, nutrients, constitution)
+    return run
+
+
+def _comprehensive_score_batch(n):
+    import pandas as pd
+
+    from batch_scoring import calculate_comprehensive_score_batch, calculate_total_nutrients_batch
+
+    answers = synthetic.respondents(n).set_index("respondent_id")
+    frame = pd.concat([answers, calculate_total_nutrients_batch(synthetic.nutrient_totals(n))], axis=1)
+    return lambda: calculate_comprehensive_score_batch(frame)
+
+
+def _predict_constitution(n):
+    from scoring import predict_constitution
+
+    answers = [a for a, _ in synthetic.profiles(n)]
+
+    def run():
+        for a in answers:
+            predict_constitution(a)
+    return run
+
+
+def _predict_constitution_batch(n):
+    from batch_scoring import predict_constitution_batch
+
+    frame = synthetic.respondents(n)
+    return lambda: predict_constitution_batch(frame)
+
+
+def _score_chunk(n):
+    from batch_cli import score_chunk
+
+    answers = synthetic.respondents(n).set_index("respondent_id")
+    totals = synthetic.nutrient_totals(n)
+    return lambda: score_chunk(answers, totals)
+
+
+def _score_cubes_add(n):
+    from batch_cli import score_chunk
+    from score_cubes import ScoreCubes
+
+    answers = synthetic.respondents(n).set_index("respondent_id")
+    results = score_chunk(answers, synthetic.nutrient_totals(n))
+    return lambda: ScoreCubes().add(answers, results)
+
+
+def _what_if(n):
+    from ingredients import IngredientTable
+    from what_if import improvements
+
+    pairs = synthetic.profiles(n)
+    nutrients = IngredientTable.from_frame(synthetic.meals(5)).nutrients()
+
+    def run():
+        for answers, profile in pairs:
+            improvements(answers, profile, nutrients, max_changes=2)
+    return run
+
+
+def _charts(builder):
+    def setup(n):
+        from charts import (
+            draw_pfc_balance, draw_score_gauge, pfc_balance_html, pfc_chart, score_chart, score_gauge_html,
+        )
+
+        builds = {
+            "plotly": lambda: (draw_pfc_balance(47.0, 31.7, 78.5), draw_score_gauge(72)),
+            "cached": lambda: (pfc_chart(47.0, 31.7, 78.5), score_chart(72)),
+            "lite": lambda: (pfc_balance_html(47.0, 31.7, 78.5), score_gauge_html(72)),
+        }
+        return builds[builder]
+    return setup
+
+
+def _page_input_first(n):
+    # 新しいセッションで入力画面を初めて表示する (スクリプトの実行 + 要素の組み立て)
+    return pages.input_page
+
+
+def _page_input_rerun(n):
+    at = pages.input_page()
+    return at.run
+
+
+def _page_result_rerun(lite):
+    def setup(n):
+        at = pages.result_page(lite=lite)
+        return at.run
+    return setup
+
+
+# (名前, setup, サイズに依存するか, --full なしで測る最大サイズ)
+CASES = [
+    ("total_nutrients", _total_nutrients, True, None),
+    ("ingredient_totals", _ingredient_totals, True, None),
+    ("comprehensive_score", _comprehensive_score, True, SCALAR_MAX_SIZE),
+    ("comprehensive_score_batch", _comprehensive_score_batch, True, None),
+    ("predict_constitution", _predict_constitution, True, SCALAR_MAX_SIZE),
+    ("predict_constitution_batch", _predict_constitution_batch, True, None),
+    ("score_chunk", _score_chunk, True, None),
+    ("score_cubes_add", _score_cubes_add, True, None),
+    ("what_if", _what_if, True, WHAT_IF_MAX_SIZE),
+    ("charts_plotly", _charts("plotly"), False, None),
+    ("charts_cached", _charts("cached"), False, None),
+    ("charts_lite", _charts("lite"), False, None),
+    ("page_input_first", _page_input_first, False, None),
+    ("page_input_rerun", _page_input_rerun, False, None),
+    ("page_result_rerun", _page_result_rerun(False), False, None),
+    ("page_result_rerun_lite", _page_result_rerun(True), False, None),
+]
+
+
+# --- 計測 ---
+
+def _status_kb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise OSError(field)
+
+
+def _reset_peak_rss():
+    # VmHWM (RSS の最大値) を現在の RSS に戻す。使えなければ False
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def _timed_with_peak(fn):
+    """(所要時間, ピークメモリのバイト数, 所要時間を計測値に使えるか)"""
+    gc.collect()
+    if _reset_peak_rss():
+        before = _status_kb("VmRSS")
+        elapsed = _timed(fn)
+        return elapsed, max(_status_kb("VmHWM") - before, 0) * 1024, True
+    # tracemalloc は実行を大きく遅くするため、この回の所要時間は使わない
+    tracemalloc.start()
+    elapsed = _timed(fn)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, False
+
+
+def measure(fn, rows, min_time=MIN_TIME):
+    """fn を繰り返し実行し、所要時間の分位点・スループット・ピークメモリを返す"""
+    # ウォームアップ (キャッシュ・遅延 import を計測から外す)。1回が min_time を超える大きなサイズでは
+    # 初回の影響は誤差に収まるため、そのまま計測値に含める
+    first = _timed(fn)
+    samples = [first] if first >= min_time else []
+    elapsed, peak, usable = _timed_with_peak(fn)
+    if usable:
+        samples.append(elapsed)
+    start = time.perf_counter()
+    while len(samples) < MAX_RUNS and (len(samples) < MIN_RUNS or time.perf_counter() - start < min_time):
+        samples.append(_timed(fn))
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+    return {
+        "runs": len(samples),
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "rows_per_s": round(rows / float(np.median(samples)), 1),
+        "peak_mb": round(peak / 2**20, 3),
+    }
+
+
+def run_suite(sizes, case_filter=None, full=False, min_time=MIN_TIME, log=print):
+    results = {}
+    for name, setup, sized, max_size in CASES:
+        if case_filter and not any(f in name for f in case_filter):
+            continue
+        for n in sizes if sized else (1,):
+            if max_size is not None and n > max_size and not full:
+                continue
+            fn = setup(n)
+            result = measure(fn, n, min_time)
+            del fn
+            results[f"{name}@{n}"] = result
+            log(_format_row(f"{name}@{n}", result))
+    return results
+
+
+def _environment():
+    import pandas as pd
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+# --- 表示・比較 ---
+
+_HEADER = f"{'case':<34} {'runs':>5} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'rows/s':>12} {'peak MB':>9}"
+
+
+def _format_row(key, r):
+    return (f"{key:<34} {r['runs']:>5} {r['p50_ms']:>10.3f} {r['p95_ms']:>10.3f} {r['p99_ms']:>10.3f}"
+            f" {r['rows_per_s']:>12,.0f} {r['peak_mb']:>9.2f}")
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """ベースラインとの比較。(キー, p50 の比, ピークメモリの比, 悪化したか) のリスト"""
+    rows = []
+    for key, r in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        time_ratio = r["p50_ms"] / base["p50_ms"] if base["p50_ms"] else 1.0
+        # 1MB 未満のピークメモリは誤差が大きいため比較しない
+        memory_ratio = r["peak_mb"] / base["peak_mb"] if base["peak_mb"] >= 1 else 1.0
+        regressed = time_ratio > 1 + threshold or memory_ratio > 1 + threshold
+        rows.append((key, time_ratio, memory_ratio, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="採点・集計・ページ表示のベンチマーク")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="行数 (カンマ区切り)")
+    parser.add_argument("--cases", help="ケース名の一部 (カンマ区切り)。一致するケースだけ測る")
+    parser.add_argument("--full", action="store_true", help="スカラー版もサイズの上限を超えて測る")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="1ケースあたりの最低計測時間 (秒)")
+    parser.add_argument("--save", help="結果をベースラインとして保存する (JSON)")
+    parser.add_argument("--compare", help="比較するベースライン (JSON)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="悪化とみなす割合 (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    case_filter = args.cases.split(",") if args.cases else None
+    print(_HEADER)
+    results = run_suite(sizes, case_filter, args.full, args.min_time)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"environment": _environment(), "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"\nベースラインを保存しました: {args.save}")
+
+    if args.compare:
+        if not os.path.exists(args.compare):
+            print(f"\nベースラインがありません: {args.compare}", file=sys.stderr)
+            return 2
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nベースライン比較 ({baseline['environment']['created_at']}, しきい値 +{args.threshold:.0%})")
+        print(f"{'case':<34} {'p50':>8} {'peak':>8}")
+        regressions = 0
+        for key, time_ratio, memory_ratio, regressed in compare(results, baseline["results"], args.threshold):
+            regressions += regressed
+            mark = "  <-- 悪化" if regressed else ""
+            print(f"{key:<34} {time_ratio:>7.2f}x {memory_ratio:>7.2f}x{mark}")
+        if regressions:
+            print(f"\n{regressions} 件のケースがベースラインより悪化しています", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
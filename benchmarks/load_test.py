@@ -0,0 +1,325 @@
+# --- 負荷試験: 1プロセスで同時に扱えるセッション数 ---
+# streamlit run と同じく、1つのプロセスの中で app.py の複数セッション (AppTest) をスレッドで同時に動かし、
+# 各セッションにアンケート2ステップ・画像アップロード・解析・結果画面の操作を順に行わせる。
+# セッション間ではプロセス共有のリソース (解析ワーカー・セッションデータ・食品DB) を共有する。
+# LogMeal API は別プロセスのスタブサーバー (fake_logmeal.py) で置き換えるため、ネットワークは使わない。
+#
+# 同時セッション数ごとに、スループット (完了したフロー/秒)、操作ごとの応答時間の分位点、
+# 1セッションあたりのメモリ (RSS) の増分を出し、応答時間またはスループットが頭打ちになった
+# 同時セッション数を飽和点として報告する。
+# 応答時間は1回のスクリプト実行 (ブラウザとの通信を除く) で、analysis はボタンを押してから解析が終わるまで。
+# AppTest はスクリプトを実行するたびにプロセス全体の Runtime を差し替えるため、スクリプトの実行は
+# ロックで1つずつにする (ロック待ちも応答時間に含める)。Streamlit サーバーでも各セッションの
+# スクリプトは GIL を取り合うため、CPU が中心の実行では直列に近い。解析 (LogMeal の待ち) は並行に進む。
+# 食材表の直接編集 (st.data_editor) は AppTest から操作できないため、結果画面の操作は
+# 軽量表示の切り替え・食品DBからの追加・改善シミュレーションの条件変更で代える。
+#
+# 使い方 (リポジトリ直下で):
+#   python -m benchmarks.load_test --sessions 1,2,4,8,16 --latency 0.5 --error-rate 0.05
+#   python -m benchmarks.load_test --sessions 8 --flows 3 --save /tmp/load.json
+
+import argparse
+import gc
+import io
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from itertools import count
+
+import numpy as np
+
+from benchmarks.pages import APP, REPO_DIR
+
+DEFAULT_SESSIONS = (1, 2, 4, 8, 16)
+STEPS = ("open", "step1", "step2", "upload", "analysis", "result", "edit")
+INTERACTIVE_STEPS = tuple(step for step in STEPS if step != "analysis")  # 画面操作への応答
+DEFAULT_P99_LIMIT = 1.0  # 画面操作の p99 がこの秒数を超えたら飽和とみなす
+MIN_GAIN = 0.05  # 同時セッション数を増やしてもスループットがこの割合しか伸びなければ飽和とみなす
+API_TOKEN = "load-test"
+_script_lock = threading.Lock()
+_photo_seeds = count()  # 写真はすべてのフローで別にする (認識結果のキャッシュに当たらないように)
+RUN_TIMEOUT = 300  # 1回のスクリプト実行の上限 (秒)。高負荷時にも AppTest がタイムアウトしないように長めにする
+
+
+# --- LogMeal スタブサーバー (別プロセス) ---
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_logmeal(latency, error_rate, uplink_mbps=None):
+    """fake_logmeal.py を別プロセスで起動し、(プロセス, URL) を返す"""
+    port = _free_port()
+    command = [sys.executable, os.path.join(REPO_DIR, "fake_logmeal.py"), "--port", str(port),
+               "--latency", str(latency), "--error-rate", str(error_rate)]
+    if uplink_mbps:
+        command += ["--uplink-mbps", str(uplink_mbps)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("LogMeal スタブサーバーを起動できませんでした")
+            time.sleep(0.05)
+
+
+# --- 1セッションの操作 ---
+
+def _photo(seed, size):
+    """食事写真の代わり (滑らかな色むらの JPEG)"""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(0, 256, (24, 32, 3), dtype=np.uint8)
+    image = Image.fromarray(noise).resize(size, Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def _check(at):
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return at
+
+
+def _run(at):
+    with _script_lock:
+        return _check(at.run(timeout=RUN_TIMEOUT))
+
+
+def _timed_run(timings, step, at):
+    start = time.perf_counter()
+    _run(at)
+    timings[step].append(time.perf_counter() - start)
+
+
+def _widget(widgets, label):
+    return next(w for w in widgets if w.label.startswith(label))
+
+
+def _pick(selectbox, rng):
+    return selectbox.select_index(int(rng.integers(len(selectbox.options))))
+
+
+def run_flow(at, seed, photo, timings, think_time=0.0):
+    """
+    入力画面の最初から結果画面の操作までを1回行う (at は入力画面の Step 1 を表示した AppTest)
+    戻り値: 解析が API ではなくデモデータで終わったか (スタブのエラーで API 解析に失敗した)
+    """
+    rng = np.random.default_rng(seed)
+    for step in ("step1", "step2"):
+        for radio in at.radio:
+            radio.set_value(radio.options[rng.integers(len(radio.options))])
+        time.sleep(think_time)
+        at.button[0].click()
+        _timed_run(timings, step, at)
+
+    at.text_input[0].set_value(API_TOKEN)
+    at.file_uploader[0].set_value(("meal.jpg", photo, "image/jpeg"))
+    time.sleep(think_time)
+    _timed_run(timings, "upload", at)
+
+    start = time.perf_counter()
+    _widget(at.button, "分析を開始する").click()
+    _run(at)
+    job = at.session_state["analysis_job"]
+    if job is not None:  # 解析がボタンを押した回の実行中に終わっていれば、結果画面はもう表示されている
+        job.future.result(timeout=RUN_TIMEOUT)
+        timings["analysis"].append(time.perf_counter() - start)
+        _timed_run(timings, "result", at)
+    else:
+        timings["analysis"].append(time.perf_counter() - start)
+    fallback = any("デモデータ" in warning.value for warning in at.warning)
+
+    # 結果画面の操作 (1つごとに再実行される)
+    edits = [
+        lambda: at.toggle[0].set_value(not at.toggle[0].value),
+        lambda: _pick(_widget(at.selectbox, "食品データベース"), rng),
+        lambda: _widget(at.button, "追加").click(),
+        lambda: _widget(at.radio, "同時に").set_value(int(rng.integers(1, 4))),  # 見直す習慣の数 (1-3)
+    ]
+    for edit in edits:
+        time.sleep(think_time)
+        edit()
+        _timed_run(timings, "edit", at)
+
+    # 次のフローのために入力画面へ戻る
+    _widget(at.button, "← 入力画面へ戻る").click()
+    _run(at)
+    return fallback
+
+
+def run_session(index, flows, image_size, think_time, barrier, out):
+    """1セッション分のスレッド。結果は out[index] に入れる"""
+    from streamlit.testing.v1 import AppTest
+
+    timings = {step: [] for step in STEPS}
+    photos = [_photo(next(_photo_seeds), image_size) for _ in range(flows)]
+    result = {"timings": timings, "flows": 0, "fallbacks": 0, "error": None, "app": None}
+    out[index] = result
+    barrier.wait()
+    try:
+        at = AppTest.from_file(APP, default_timeout=RUN_TIMEOUT)
+        result["app"] = at  # メモリの計測が終わるまでセッションを残す
+        _timed_run(timings, "open", at)
+        for k in range(flows):
+            result["fallbacks"] += run_flow(at, index * 1000 + k, photos[k], timings, think_time)
+            result["flows"] += 1
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+
+# --- 同時セッション数ごとの計測 ---
+
+def _rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    raise OSError("VmRSS")
+
+
+def _percentiles(samples):
+    if not samples:
+        return None
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+    return {"n": len(samples), "p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1),
+            "p99_ms": round(float(p99), 1)}
+
+
+def run_level(sessions, flows=1, image_size=(1280, 960), think_time=0.0):
+    gc.collect()
+    rss_before = _rss_mb()
+    out = [None] * sessions
+    # 写真の生成を待ってから全セッションを同時に始める
+    barrier = threading.Barrier(sessions + 1)
+    threads = [threading.Thread(target=run_session, args=(i, flows, image_size, think_time, barrier, out),
+                                name=f"load-session-{i}") for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    gc.collect()
+    rss_after = _rss_mb()
+
+    steps = {step: [t for r in out for t in r["timings"][step]] for step in STEPS}
+    completed = sum(r["flows"] for r in out)
+    errors = [r["error"] for r in out if r["error"]]
+    interactive = [t for step in INTERACTIVE_STEPS for t in steps[step]]
+    for r in out:
+        r["app"] = None
+    return {
+        "sessions": sessions,
+        "flows": completed,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "fallbacks": sum(r["fallbacks"] for r in out),
+        "wall_s": round(wall, 3),
+        "flows_per_s": round(completed / wall, 3),
+        "interactive": _percentiles(interactive),
+        "steps": {step: _percentiles(samples) for step, samples in steps.items()},
+        "rss_per_session_mb": round((rss_after - rss_before) / sessions, 2),
+    }
+
+
+def saturation(levels, p99_limit=DEFAULT_P99_LIMIT, min_gain=MIN_GAIN):
+    """(飽和した同時セッション数, 理由)。飽和していなければ (None, None)"""
+    best = 0.0
+    for level in levels:
+        if level["errors"]:
+            return level["sessions"], "エラー発生"
+        if level["interactive"] and level["interactive"]["p99_ms"] > p99_limit * 1000:
+            return level["sessions"], f"画面操作の p99 が {p99_limit:g} 秒を超過"
+        if best and level["flows_per_s"] < best * (1 + min_gain):
+            return level["sessions"], f"スループットの伸びが {min_gain:.0%} 未満"
+        best = max(best, level["flows_per_s"])
+    return None, None
+
+
+# --- 表示 ---
+
+def _format_level(level):
+    interactive = level["interactive"] or {"p50_ms": 0, "p99_ms": 0}
+    analysis = level["steps"]["analysis"] or {"p50_ms": 0, "p99_ms": 0}
+    return (f"{level['sessions']:>8} {level['flows']:>6} {level['flows_per_s']:>9.2f}"
+            f" {interactive['p50_ms']:>9.0f} {interactive['p99_ms']:>9.0f}"
+            f" {analysis['p50_ms']:>9.0f} {analysis['p99_ms']:>9.0f}"
+            f" {level['rss_per_session_mb']:>10.2f} {level['fallbacks']:>6} {level['errors']:>6}")
+
+
+def _format_steps(level):
+    return "  ".join(f"{step} {r['p50_ms']:.0f}/{r['p99_ms']:.0f}" for step, r in level["steps"].items() if r)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="同時セッション数ごとの負荷試験 (LogMeal はスタブ)")
+    parser.add_argument("--sessions", default=",".join(map(str, DEFAULT_SESSIONS)),
+                        help="同時セッション数 (カンマ区切り、小さい順に試す)")
+    parser.add_argument("--flows", type=int, default=1, help="1セッションが繰り返すフローの回数")
+    parser.add_argument("--latency", type=float, default=0.5, help="スタブの応答遅延 (秒/リクエスト)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="スタブが 503 を返す確率")
+    parser.add_argument("--uplink-mbps", type=float, default=None, help="スタブで模擬する上り帯域 (Mbps)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="操作の間の待ち時間 (秒)")
+    parser.add_argument("--image-size", default="1280x960", help="アップロードする写真の大きさ (幅x高さ)")
+    parser.add_argument("--p99-limit", type=float, default=DEFAULT_P99_LIMIT,
+                        help="飽和とみなす画面操作の p99 (秒)")
+    parser.add_argument("--save", help="結果を JSON で保存する")
+    args = parser.parse_args(argv)
+    # 実行ごとに出る警告 (非推奨の引数・スクリプト外からのセッション状態の参照) で結果が埋もれないようにする。
+    # AppTest は実行のたびに Streamlit のログレベルを設定し直すため、logging 全体で止める
+    logging.disable(logging.WARNING)
+    image_size = tuple(int(v) for v in args.image_size.split("x"))
+
+    server, url = start_fake_logmeal(args.latency, args.error_rate, args.uplink_mbps)
+    workdir = tempfile.TemporaryDirectory(prefix="nnbi-load-")
+    # app.py のプロセス共有リソースが作られる前に、接続先と保存先を差し替える
+    os.environ["LOGMEAL_BASE_URL"] = url
+    for name in ("LOGMEAL_CACHE_DIR", "NNBI_SPILL_DIR", "NNBI_DATA_DIR", "NNBI_FOOD_DB_DIR"):
+        os.environ[name] = os.path.join(workdir.name, name.lower())
+    print(f"LogMeal スタブ: {url} (遅延 {args.latency:g} 秒, エラー率 {args.error_rate:.0%})")
+    print(f"{'sessions':>8} {'flows':>6} {'flows/s':>9} {'ui p50':>9} {'ui p99':>9}"
+          f" {'解析 p50':>7} {'解析 p99':>7} {'MB/session':>10} {'demo':>6} {'errors':>6}  (時間は ms)")
+    levels = []
+    try:
+        # 初回の import・プロセス共有リソースの作成を計測から外す
+        run_level(1, 1, image_size)
+        for sessions in (int(n) for n in args.sessions.split(",")):
+            level = run_level(sessions, args.flows, image_size, args.think_time)
+            levels.append(level)
+            print(_format_level(level))
+            print(f"{'':>8} {_format_steps(level)}")
+            if level["first_error"]:
+                print(f"{'':>8} error: {level['first_error']}")
+    finally:
+        server.terminate()
+        server.wait()
+        workdir.cleanup()
+
+    point, reason = saturation(levels, args.p99_limit)
+    if point is None:
+        print("飽和点: 試した範囲では飽和していません")
+    else:
+        print(f"飽和点: {point} セッション ({reason})")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "levels": levels, "saturation": point}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
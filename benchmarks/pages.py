@@ -0,0 +1,56 @@
+# --- ベンチマーク用: AppTest で各ページを開く ---
+# 入力画面は app.py をそのまま実行し、結果画面はアンケートの2ステップを回答してから
+# デモモードの解析ジョブ (待ち時間なし) の結果を表示した状態にする。
+
+import io
+import os
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(REPO_DIR, "app.py")
+
+_worker = None
+
+
+def _demo_image():
+    from PIL import Image
+
+    from image_prep import prepare_image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), (200, 120, 40)).save(buffer, format="PNG")
+    return prepare_image(buffer.getvalue())
+
+
+def _check(at):
+    assert not at.exception, at.exception
+    return at
+
+
+def input_page():
+    """入力画面 (Step 1) を表示した AppTest"""
+    from streamlit.testing.v1 import AppTest
+
+    return _check(AppTest.from_file(APP, default_timeout=60).run())
+
+
+def result_page(lite=False):
+    """アンケートに回答し、デモの食材表で結果画面を表示した AppTest"""
+    global _worker
+    from analysis_worker import AnalysisWorker
+
+    if _worker is None:
+        _worker = AnalysisWorker(demo_delay=0)
+    at = input_page()
+    for step in (0, 1):
+        for radio in at.radio:
+            radio.set_value(radio.options[step])
+        _check(at.button[0].click().run())
+    assert at.session_state["input_step"] == 3
+    job = _worker.submit(_demo_image())
+    job.future.result(timeout=30)
+    at.session_state["analysis_job"] = job
+    at.session_state["page"] = "result"
+    at.session_state["lite_charts"] = lite
+    _check(at.run())
+    assert at.session_state["analysis_job"] is None
+    return at
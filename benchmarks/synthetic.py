@@ -0,0 +1,74 @@
+# --- ベンチマーク用の合成データ ---
+# 回答者 (20問の回答・ストレスレベル・アレルギー) と食事 (食材表の行) を乱数で作る。
+# 同じ seed なら同じデータになるため、ベースラインとの比較に使える。
+
+import numpy as np
+import pandas as pd
+
+from analysis_worker import DEMO_INGREDIENTS
+from ingredients import CATEGORIES, NUTRIENT_LABELS
+from scoring import ALLERGY_OPTIONS, HABIT_OPTIONS, STRESS_LEVELS, SUPPLEMENT_OPTIONS
+
+UNANSWERED_RATE = 0.02  # 未回答の割合
+
+
+def respondents(n, seed=0):
+    """
+    回答者 n 人分の DataFrame (batch_cli のアンケート入力と同じ形)
+    列: respondent_id, 20問の回答, stress_level, allergies ("グルテン;卵" 形式)
+    """
+    rng = np.random.default_rng(seed)
+    data = {"respondent_id": np.arange(n)}
+    for question, options in HABIT_OPTIONS.items():
+        answers = np.asarray(options, dtype=object)[rng.integers(0, len(options), n)]
+        answers[rng.random(n) < UNANSWERED_RATE] = None
+        data[question] = answers
+    data["stress_level"] = np.asarray(STRESS_LEVELS, dtype=object)[rng.integers(0, len(STRESS_LEVELS), n)]
+    # 7割はアレルギーなし、残りは1-2種類
+    counts = np.where(rng.random(n) < 0.7, 0, rng.integers(1, 3, n))
+    picks = rng.integers(0, len(ALLERGY_OPTIONS), (n, 2))
+    data["allergies"] = [
+        ";".join(dict.fromkeys(ALLERGY_OPTIONS[j] for j in row[:k])) for row, k in zip(picks.tolist(), counts)
+    ]
+    return pd.DataFrame(data)
+
+
+def profiles(n, seed=0):
+    """スカラー版の採点に渡す (habit_answers, user_profile) の組を n 人分"""
+    frame = respondents(n, seed)
+    rng = np.random.default_rng(seed + 1)
+    pairs = []
+    for row in frame.to_dict("records"):
+        answers = {question: row[question] for question in HABIT_OPTIONS if row[question] is not None}
+        profile = {
+            "stress_level": row["stress_level"],
+            "allergies": row["allergies"].split(";") if row["allergies"] else [],
+            "medical_history": "",
+            "supplements": [s for s in SUPPLEMENT_OPTIONS if rng.random() < 0.2],
+        }
+        pairs.append((answers, profile))
+    return pairs
+
+
+def meals(n_rows, n_respondents=None, seed=0):
+    """
+    食材表の行を n_rows 行 (デモの食材をランダムな分量で並べる)
+    n_respondents を指定すると respondent_id 列 (昇順) を付け、batch_cli の食材記録の形にする
+    """
+    rng = np.random.default_rng(seed)
+    pool = pd.DataFrame(DEMO_INGREDIENTS)
+    picks = rng.integers(0, len(pool), n_rows)
+    portions = rng.uniform(0.5, 1.5, (n_rows, 1))
+    values = pool[NUTRIENT_LABELS].to_numpy(dtype=np.float64)[picks] * portions
+    frame = pd.DataFrame(values.round(2), columns=NUTRIENT_LABELS)
+    frame.insert(0, "食材名", pool["食材名"].to_numpy()[picks])
+    frame["カテゴリ"] = pd.Categorical(pool["カテゴリ"].to_numpy()[picks], categories=CATEGORIES)
+    if n_respondents is not None:
+        frame.insert(0, "respondent_id", np.sort(rng.integers(0, n_respondents, n_rows)))
+    return frame
+
+
+def nutrient_totals(n, seed=0):
+    """回答者 n 人分の1食の栄養素合計 (respondent_id を index とする)"""
+    rows = meals(n * 3, n, seed)
+    return rows.groupby("respondent_id")[NUTRIENT_LABELS].sum().reindex(range(n), fill_value=0)
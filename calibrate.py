@@ -0,0 +1,185 @@
+# --- NNBI式の係数の校正 (ヘッドレス) ---
+# アンケート・食材記録・メンタルヘルスの結果指標から、NNBI式の係数 (α, w_diet, w_bio, w_dop, w_risk) を求め、
+# アプリが起動時に読み込む重みファイル (JSON) に書き出す。
+# サブスコアは batch_cli と同じチャンク単位の一括採点で求め、最小二乗の正規方程式 (5x5) だけを足し込むため、
+# メモリ使用量はデータ件数によらずチャンクサイズで決まる。
+# リッジ正則化は現在の係数に向けて掛ける (データが少ないうちは既定の係数から大きく離れない)。
+#
+# 使い方:
+#   python calibrate.py questionnaires.csv ingredients.csv --outcomes outcomes.csv -o weights.json
+#   NNBI_WEIGHTS=weights.json streamlit run app.py
+#
+# 入力ファイルはすべて回答者ID列で昇順ソートされていること (batch_cli と同じ)。
+#   outcomes: 回答者ID, 結果指標の列 (--outcome-column, NNBIスコアと同じ 0-100 の尺度で、高いほど良好)
+#   --outcomes を省くと、アンケート側の結果指標の列を使う
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from batch_cli import (
+    DEFAULT_CHUNKSIZE, _check_sorted, _TotalsCursor, iter_nutrient_totals, read_chunks, score_chunk,
+)
+from scoring import WEIGHT_KEYS, WEIGHTS, WEIGHTS_FORMAT
+
+# 説明変数の並び (w_risk は引く項なので符号を反転したサブスコアに掛ける)
+_FEATURES = ("diet", "bio", "dop", "risk")
+_SIGNS = np.array([1.0, 1.0, 1.0, -1.0])
+
+
+class NormalEquations:
+    """
+    y ≈ α + w_diet*diet + w_bio*bio + w_dop*dop - w_risk*risk の正規方程式を逐次に足し込む
+    保持するのは X'X (5x5)・X'y・y'y・件数だけ
+    """
+
+    def __init__(self):
+        size = len(WEIGHT_KEYS)
+        self.xtx = np.zeros((size, size))
+        self.xty = np.zeros(size)
+        self.yty = 0.0
+        self.count = 0
+
+    def add(self, subscores, outcome):
+        """subscores: (行数, 4) の diet / bio / dop / risk、outcome: (行数,)"""
+        x = np.empty((len(outcome), len(WEIGHT_KEYS)))
+        x[:, 0] = 1.0
+        x[:, 1:] = subscores * _SIGNS
+        y = np.asarray(outcome, dtype=np.float64)
+        self.xtx += x.T @ x
+        self.xty += x.T @ y
+        self.yty += float(y @ y)
+        self.count += len(y)
+
+    def merge(self, other):
+        self.xtx += other.xtx
+        self.xty += other.xty
+        self.yty += other.yty
+        self.count += other.count
+
+    def sse(self, coef):
+        """係数 coef (WEIGHT_KEYS 順) での残差平方和"""
+        return float(self.yty - 2 * coef @ self.xty + coef @ self.xtx @ coef)
+
+    def solve(self, ridge=0.0, prior=None):
+        """
+        係数 (WEIGHT_KEYS 順) を求める
+        ridge: 正則化の強さ (件数あたり)。切片 α には掛けない
+        prior: 正則化で寄せる係数 (省略時は 0)
+        """
+        if self.count == 0:
+            raise ValueError("校正に使える行がありません")
+        prior = np.zeros(len(WEIGHT_KEYS)) if prior is None else np.asarray(prior, dtype=np.float64)
+        penalty = np.diag([0.0] + [ridge * self.count] * (len(WEIGHT_KEYS) - 1))
+        return np.linalg.solve(self.xtx + penalty, self.xty + penalty @ prior)
+
+
+def _outcome_chunks(path, id_column, column, chunksize):
+    # 結果指標を回答者ID を index とするチャンクとして返す (_TotalsCursor で切り出すため)
+    last_id = None
+    for chunk in read_chunks(path, chunksize, columns=[id_column, column]):
+        if chunk.empty:
+            continue
+        _check_sorted(chunk[id_column], last_id, path, unique=True)
+        last_id = chunk[id_column].iloc[-1]
+        yield chunk.set_index(id_column)
+
+
+def accumulate(questionnaire_path, ingredients_path, outcomes_path=None, outcome_column="outcome",
+               id_column="respondent_id", chunksize=DEFAULT_CHUNKSIZE):
+    """データをチャンク単位で採点し、正規方程式と読み飛ばした行数 (結果指標の欠損) を返す"""
+    totals = _TotalsCursor(iter_nutrient_totals(
+        read_chunks(ingredients_path, chunksize), id_column, ingredients_path))
+    outcomes = None
+    if outcomes_path is not None:
+        outcomes = _TotalsCursor(_outcome_chunks(outcomes_path, id_column, outcome_column, chunksize))
+    equations = NormalEquations()
+    skipped = 0
+    last_id = None
+    for chunk in read_chunks(questionnaire_path, chunksize):
+        if chunk.empty:
+            continue
+        _check_sorted(chunk[id_column], last_id, questionnaire_path, unique=True)
+        last_id = chunk[id_column].iloc[-1]
+
+        answers = chunk.set_index(id_column)
+        if outcomes is not None:
+            outcome = outcomes.upto(last_id).reindex(index=answers.index, columns=[outcome_column])[outcome_column]
+        else:
+            outcome = answers[outcome_column]
+        result = score_chunk(answers, totals.upto(last_id))
+        y = outcome.to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = np.isfinite(y)
+        skipped += int((~valid).sum())
+        equations.add(result[list(_FEATURES)].to_numpy(dtype=np.float64)[valid], y[valid])
+    return equations, skipped
+
+
+def weights_document(coef, equations, ridge, base):
+    """重みファイルの内容 (version は係数と作成日から決める)"""
+    values = {key: round(float(v), 6) for key, v in zip(WEIGHT_KEYS, coef)}
+    digest = hashlib.sha1(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+    today = datetime.date.today().strftime("%Y%m%d")
+    rmse = (max(equations.sse(coef), 0.0) / equations.count) ** 0.5
+    base_coef = np.array([base[key] for key in WEIGHT_KEYS], dtype=np.float64)
+    base_rmse = (max(equations.sse(base_coef), 0.0) / equations.count) ** 0.5
+    return {
+        "format": WEIGHTS_FORMAT,
+        "version": f"{today}-{digest}",
+        **values,
+        "fit": {
+            "rows": equations.count,
+            "ridge": ridge,
+            "rmse": round(rmse, 4),
+            "base_version": base["version"],
+            "base_rmse": round(base_rmse, 4),
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        },
+    }
+
+
+def write_weights(document, path):
+    """書き込み途中のファイルを読まれないよう、一時ファイルから置き換える"""
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    os.replace(path + ".tmp", path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NNBI式の係数の校正 (ヘッドレス)")
+    parser.add_argument("questionnaires", help="アンケート回答 (CSV / Parquet)")
+    parser.add_argument("ingredients", help="食材記録 (CSV / Parquet)")
+    parser.add_argument("--outcomes", help="結果指標 (CSV / Parquet)。省略時はアンケート側の列を使う")
+    parser.add_argument("--outcome-column", default="outcome", help="結果指標の列名")
+    parser.add_argument("-o", "--output", required=True, help="重みファイルの出力先 (JSON)")
+    parser.add_argument("--id-column", default="respondent_id", help="回答者ID列名")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="1チャンクの行数")
+    parser.add_argument("--ridge", type=float, default=0.0, help="現在の係数に寄せるリッジ正則化の強さ")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    equations, skipped = accumulate(args.questionnaires, args.ingredients, args.outcomes,
+                                    outcome_column=args.outcome_column, id_column=args.id_column,
+                                    chunksize=args.chunksize)
+    prior = [WEIGHTS[key] for key in WEIGHT_KEYS]
+    document = weights_document(equations.solve(args.ridge, prior), equations, args.ridge, WEIGHTS)
+    write_weights(document, args.output)
+    elapsed = time.perf_counter() - start
+
+    print(f"{equations.count} 件で校正しました (結果指標なし {skipped} 件を除外, {elapsed:.1f} 秒)", file=sys.stderr)
+    for key in WEIGHT_KEYS:
+        print(f"  {key:<7} {WEIGHTS[key]:>8.4f} -> {document[key]:>8.4f}", file=sys.stderr)
+    fit = document["fit"]
+    print(f"  RMSE    {fit['base_rmse']:>8.4f} -> {fit['rmse']:>8.4f}  ({document['version']})", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# --- 結果ページのグラフ ---
+# Plotly の図は入力 (丸めた値) をキーに LRU キャッシュし、値が変わらない再実行では作り直さない。
+# 軽量表示では Plotly を使わず、あらかじめ組み立てた小さな HTML を送る (1回あたりの送信量を抑える)。
+
+import threading
+from collections import OrderedDict
+
+import plotly.graph_objects as go
+
+FIGURE_CACHE_SIZE = 256  # 保持する図の数 (プロセス内の全セッション合計)
+
+PFC_LABELS = ['タンパク質', '脂質', '炭水化物']
+PFC_COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c']
+GAUGE_STEPS = [(0, 60, "lightgray"), (60, 80, "gray"), (80, 100, "lightblue")]
+
+
+def draw_pfc_balance(protein, fat, carbs):
+    values = [protein, fat, carbs]
+    if sum(values) == 0: return None
+    fig = go.Figure(data=[go.Pie(
+        labels=PFC_LABELS, values=values, hole=.4,
+        marker=dict(colors=PFC_COLORS),
+        textinfo='label+percent'
+    )])
+    fig.update_layout(margin=dict(l=0, r=0, t=0, b=0), height=150, showlegend=False)
+    return fig
+
+
+def draw_score_gauge(score):
+    fig = go.Figure(go.Indicator(
+        mode = "gauge+number", value = score,
+        domain = {'x': [0, 1], 'y': [0, 1]},
+        title = {'text': "NNBI総合スコア"},
+        gauge = {
+            'axis': {'range': [None, 100]},
+            'bar': {'color': "darkblue"},
+            'steps': [{'range': [low, high], 'color': color} for low, high, color in GAUGE_STEPS],
+            'threshold': {'line': {'color': "red", 'width': 4}, 'thickness': 0.75, 'value': score}}))
+    fig.update_layout(height=250, margin=dict(l=20, r=20, t=30, b=20))
+    return fig
+
+
+def pfc_balance_html(protein, fat, carbs):
+    """PFC比率を横帯で表す HTML (軽量表示用)"""
+    values = [protein, fat, carbs]
+    total = sum(values)
+    if total == 0: return None
+    segments = "".join(
+        f'<div style="width:{v / total * 100:.1f}%;background:{color};color:white;'
+        f'text-align:center;white-space:nowrap;overflow:hidden">{label} {v / total:.0%}</div>'
+        for label, v, color in zip(PFC_LABELS, values, PFC_COLORS) if v > 0
+    )
+    return f'<div style="display:flex;height:2em;line-height:2em;font-size:0.8em">{segments}</div>'
+
+
+def score_gauge_html(score):
+    """スコアを目盛り付きの横棒で表す HTML (軽量表示用)"""
+    steps = "".join(
+        f'<div style="position:absolute;left:{low}%;width:{high - low}%;height:100%;background:{color}"></div>'
+        for low, high, color in GAUGE_STEPS
+    )
+    return (
+        f'<div style="text-align:center">NNBI総合スコア<div style="font-size:2.5em">{score}</div></div>'
+        f'<div style="position:relative;height:1.5em">{steps}'
+        f'<div style="position:absolute;top:25%;height:50%;width:{score}%;background:darkblue"></div></div>'
+    )
+
+
+class FigureCache:
+    """
+    (種類, 丸めた入力) -> 図 の LRU キャッシュ (スレッドセーフ)
+    キャッシュした図は複数セッションで共有するため、呼び出し側で変更しないこと
+    """
+
+    def __init__(self, maxsize=FIGURE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, builder, *inputs):
+        key = (builder.__name__,) + inputs
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        figure = builder(*inputs)
+        with self._lock:
+            self._entries[key] = figure
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return figure
+
+
+# プロセス内で共有する既定のキャッシュ
+figure_cache = FigureCache()
+
+
+def pfc_chart(protein, fat, carbs, lite=False):
+    """PFCバランスの図 (lite なら HTML)。栄養素がすべて 0 なら None"""
+    builder = pfc_balance_html if lite else draw_pfc_balance
+    return figure_cache.get(builder, round(protein, 1), round(fat, 1), round(carbs, 1))
+
+
+def score_chart(score, lite=False):
+    """総合スコアのゲージ (lite なら HTML)"""
+    builder = score_gauge_html if lite else draw_score_gauge
+    return figure_cache.get(builder, int(score))
@@ -0,0 +1,100 @@
+# --- 運用ダッシュボード (集団のスコア分布) ---
+# 集計キューブ (score_cubes.py) だけを読み、スコア分布・サブスコアのヒストグラム・体質タイプの件数を
+# ストレス段階・アレルギー・設問の回答で絞り込んで表示する。採点結果の再計算や全件読み込みはしない。
+# 集計に入るのは batch_cli.py --cubes で取り込んだ結果だけで、アプリ (app.py) で採点した結果は含まれない。
+#
+# 使い方 (集計は batch_cli.py --cubes で作る):
+#   streamlit run dashboard.py
+
+import datetime
+import os
+import time
+
+import pandas as pd
+import streamlit as st
+
+from score_cubes import MEASURES, NO_ALLERGY, QUESTIONS, UNANSWERED, ScoreCubes, default_path
+from scoring import ALLERGY_OPTIONS, HABIT_LABELS, HABIT_OPTIONS, STRESS_LEVELS
+
+ALL = "すべて"
+MEASURE_LABELS = {"score": "NNBIスコア", "diet": "X_diet", "bio": "X_bio", "dop": "X_dop", "risk": "X_risk"}
+
+st.set_page_config(page_title="NNBI 運用ダッシュボード", layout="wide")
+
+
+@st.cache_resource(max_entries=1)
+def load_cubes(path, mtime):
+    # mtime をキーに含め、集計ファイルが更新されたら読み直す
+    return ScoreCubes.load(path)
+
+
+def _choice(value):
+    return None if value == ALL else value
+
+
+def _question_label(question):
+    return HABIT_LABELS.get(question, question)
+
+
+path = default_path()
+if not os.path.exists(path):
+    st.title("NNBI 運用ダッシュボード")
+    st.info(f"集計ファイルがありません: {path}\n\n`python batch_cli.py ... --cubes` で作成してください。")
+    st.stop()
+cubes = load_cubes(path, os.path.getmtime(path))
+
+# --- 絞り込み ---
+with st.sidebar:
+    st.header("絞り込み")
+    stress = st.selectbox("ストレスレベル", [ALL, *STRESS_LEVELS, UNANSWERED])
+    allergy = st.selectbox("アレルギー", [ALL, *ALLERGY_OPTIONS, NO_ALLERGY])
+    question = st.selectbox("設問", [ALL, *QUESTIONS], format_func=_question_label)
+    answer = ALL
+    if question != ALL:
+        answer = st.selectbox("回答", [ALL, *HABIT_OPTIONS[question], UNANSWERED])
+    width = st.select_slider("ヒストグラムの階級幅", options=[1, 5, 10], value=5)
+
+start = time.perf_counter()
+view = cubes.slice(_choice(stress), _choice(allergy), _choice(question), _choice(answer))
+elapsed = (time.perf_counter() - start) * 1000
+
+st.title("NNBI 運用ダッシュボード")
+updated = datetime.datetime.fromtimestamp(cubes.updated_at).strftime("%Y-%m-%d %H:%M") if cubes.updated_at else "-"
+st.caption(f"集計件数 {cubes.total:,} 件 / 最終更新 {updated} / 絞り込み {elapsed:.1f} ms")
+st.caption("集計は batch_cli.py --cubes で取り込んだ結果のみです。アプリで採点した結果は含まれません"
+           " (最終更新より後の結果は次回のバッチ実行で反映されます)。")
+
+count, mean, median = view.summary()
+col1, col2, col3 = st.columns(3)
+col1.metric("該当件数", f"{count:,}")
+col2.metric("平均スコア", "-" if mean is None else f"{mean:.1f}")
+col3.metric("中央値", "-" if median is None else median)
+
+if count == 0:
+    st.warning("条件に該当する結果がありません")
+    st.stop()
+
+# --- スコア分布 ---
+st.subheader("NNBIスコアの分布")
+st.bar_chart(view.binned("score", width), x_label="スコア", y_label="件数")
+
+st.subheader("サブスコアのヒストグラム")
+columns = st.columns(len(MEASURES) - 1)
+for column, measure in zip(columns, MEASURES[1:]):
+    with column:
+        _, sub_mean, _ = view.summary(measure)
+        st.markdown(f"**{MEASURE_LABELS[measure]}** (平均 {sub_mean:.1f})")
+        st.bar_chart(view.binned(measure, width), height=220)
+
+# --- 体質タイプ ---
+st.subheader("体質タイプ")
+constitutions = pd.Series(view.constitutions, name="件数")
+st.bar_chart(constitutions, horizontal=True)
+
+if view.by_answer is not None:
+    st.subheader(f"回答別のスコア ({_question_label(question)})")
+    rows = [
+        {"回答": option, "件数": n, "平均スコア": None if m is None else round(m, 1), "中央値": med}
+        for option, (n, m, med) in view.by_answer.items()
+    ]
+    st.dataframe(pd.DataFrame(rows), hide_index=True)
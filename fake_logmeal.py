@@ -0,0 +1,214 @@
+# --- ローカル用 LogMeal スタブサーバー ---
+# 実APIやネットワークなしで LogMealClient を動かすための簡易HTTPサーバー。
+# 応答遅延・上り帯域・エラー率 (返すステータスと Retry-After も指定可) を指定でき、
+# 受け付けたリクエスト数と受信バイト数を数える。属性は実行中に書き換えてもよい (テスト用)。
+#
+# 使い方:
+#   python fake_logmeal.py --port 8765 --latency 0.3 --error-rate 0.1
+#   LOGMEAL_BASE_URL=http://127.0.0.1:8765 streamlit run app.py
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 料理ごとの栄養素 (LogMeal の栄養素コード、1皿あたり)
+DISHES = [
+    {"id": 1, "name": "白米", "ENERC_KCAL": 250, "PROCNT": 4, "FAT": 0.5, "CHOCDF": 55, "FIBTG": 0.3,
+     "THIA": 0.02, "VITC": 0, "VITD": 0, "FE": 0.1, "ZN": 0.6, "MG": 7},
+    {"id": 2, "name": "味噌汁", "ENERC_KCAL": 40, "PROCNT": 2, "FAT": 1, "CHOCDF": 5, "FIBTG": 1.5,
+     "THIA": 0.04, "VITC": 0, "VITD": 0, "FE": 0.8, "ZN": 0.2, "MG": 15},
+    {"id": 3, "name": "焼き魚", "ENERC_KCAL": 200, "PROCNT": 20, "FAT": 12, "CHOCDF": 0.5, "FIBTG": 0,
+     "THIA": 0.1, "VITC": 0, "VITD": 15, "FE": 0.3, "ZN": 1.2, "MG": 30},
+    {"id": 4, "name": "ほうれん草のお浸し", "ENERC_KCAL": 25, "PROCNT": 2, "FAT": 0.2, "CHOCDF": 3, "FIBTG": 2.2,
+     "THIA": 0.05, "VITC": 15, "VITD": 0, "FE": 2.0, "ZN": 0.4, "MG": 40},
+    {"id": 5, "name": "納豆", "ENERC_KCAL": 100, "PROCNT": 8, "FAT": 5, "CHOCDF": 6, "FIBTG": 6.0,
+     "THIA": 0.07, "VITC": 0, "VITD": 0, "FE": 1.5, "ZN": 1.0, "MG": 50},
+    {"id": 6, "name": "サラダ", "ENERC_KCAL": 50, "PROCNT": 1, "FAT": 3, "CHOCDF": 5, "FIBTG": 2.5,
+     "THIA": 0.05, "VITC": 20, "VITD": 0, "FE": 0.5, "ZN": 0.2, "MG": 10},
+    {"id": 7, "name": "卵焼き", "ENERC_KCAL": 150, "PROCNT": 10, "FAT": 10, "CHOCDF": 4, "FIBTG": 0,
+     "THIA": 0.03, "VITC": 0, "VITD": 1.5, "FE": 0.9, "ZN": 0.7, "MG": 6},
+]
+NUTRIENT_UNITS = {"ENERC_KCAL": "kcal", "VITD": "µg", "THIA": "mg", "VITC": "mg", "FE": "mg", "ZN": "mg", "MG": "mg"}
+
+
+class FakeLogMealServer(ThreadingHTTPServer):
+    """
+    latency: 1リクエストあたりの応答遅延 (秒)
+    error_rate: エラーを返す確率 (0.0-1.0)
+    error_status: エラー時のステータス (既定 503)
+    retry_after: 指定時はエラー応答に Retry-After ヘッダー (秒) を付ける
+    malformed: True なら 200 で JSON として壊れた本文を返す
+    uplink_mbps: 指定時は受信サイズに応じた転送時間を遅延に加える (回線の模擬)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, error_rate=0.0, uplink_mbps=None, seed=None,
+                 error_status=503, retry_after=None, malformed=False):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.malformed = malformed
+        self.uplink_mbps = uplink_mbps
+        self.request_count = 0
+        self.bytes_received = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def next_request(self, body_size):
+        """リクエスト数を数え、エラーを返すべきかを決める"""
+        with self._lock:
+            self.request_count += 1
+            self.bytes_received += body_size
+            return self._random.random() < self.error_rate
+
+    def delay_for(self, body_size):
+        delay = self.latency
+        if self.uplink_mbps:
+            delay += body_size * 8 / (self.uplink_mbps * 1_000_000)
+        return delay
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)  # stop() を待たせない
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def _image_id(body):
+    return int.from_bytes(hashlib.sha256(body).digest()[:4], "big")
+
+
+def meal_for_image(image_id):
+    """画像IDから決まる料理の組み合わせ (同じ画像には同じ結果を返す)"""
+    rng = random.Random(image_id)
+    dishes = rng.sample(DISHES, rng.randint(2, 4))
+    return [(dish, round(rng.uniform(0.2, 0.95), 2)) for dish in dishes]
+
+
+def recognition_response(body):
+    dish, prob = meal_for_image(_image_id(body))[0]
+    return {"recognition_results": [{"id": dish["id"], "name": dish["name"], "prob": prob}]}
+
+
+def segmentation_response(body):
+    image_id = _image_id(body)
+    return {
+        "imageId": image_id,
+        "segmentation_results": [
+            {"food_item_position": i + 1,
+             "recognition_results": [{"id": dish["id"], "name": dish["name"], "prob": prob}]}
+            for i, (dish, prob) in enumerate(meal_for_image(image_id))
+        ],
+    }
+
+
+def nutrition_response(body):
+    """imageId と food_item_position (1始まり) で指定された料理の栄養素"""
+    request = json.loads(body or b"{}")
+    meal = meal_for_image(request.get("imageId", 0))
+    positions = request.get("food_item_position") or [1]
+    if not 1 <= positions[0] <= len(meal):
+        return None
+    dish, _ = meal[positions[0] - 1]
+    nutrients = {
+        code: {"quantity": value, "unit": NUTRIENT_UNITS.get(code, "g")}
+        for code, value in dish.items() if code not in ("id", "name")
+    }
+    return {
+        "foodName": [dish["name"]],
+        "nutritional_info": {"calories": dish["ENERC_KCAL"], "totalNutrients": nutrients},
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        if status == 200 and self.server.malformed:
+            body = body[:len(body) // 2]
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _image_body(self, body):
+        # multipart の境界文字列はリクエストごとに変わるため、除いてから画像IDを決める
+        content_type = self.headers.get("Content-Type", "")
+        if "boundary=" in content_type:
+            return body.replace(content_type.split("boundary=", 1)[1].encode(), b"")
+        return body
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        failed = self.server.next_request(len(body))
+        delay = self.server.delay_for(len(body))
+        if delay:
+            time.sleep(delay)
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self._send_json(401, {"message": "missing token"})
+        elif failed:
+            retry_after = self.server.retry_after
+            self._send_json(self.server.error_status, {"message": "upstream error"},
+                            None if retry_after is None else {"Retry-After": str(retry_after)})
+        elif self.path == "/v2/image/recognition/dish":
+            self._send_json(200, recognition_response(self._image_body(body)))
+        elif self.path == "/v2/image/segmentation/complete":
+            self._send_json(200, segmentation_response(self._image_body(body)))
+        elif self.path == "/v2/recipe/nutritionalInfo":
+            payload = nutrition_response(body)
+            if payload is None:
+                self._send_json(400, {"message": "invalid food_item_position"})
+            else:
+                self._send_json(200, payload)
+        else:
+            self._send_json(404, {"message": "not found"})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LogMeal スタブサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="応答遅延 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="エラーを返す確率")
+    parser.add_argument("--error-status", type=int, default=503, help="エラー時のステータス")
+    parser.add_argument("--retry-after", type=int, default=None, help="エラー応答の Retry-After (秒)")
+    parser.add_argument("--uplink-mbps", type=float, default=None, help="模擬する上り帯域 (Mbps)")
+    args = parser.parse_args(argv)
+
+    server = FakeLogMealServer(args.host, args.port, latency=args.latency, error_rate=args.error_rate,
+                               uplink_mbps=args.uplink_mbps, error_status=args.error_status,
+                               retry_after=args.retry_after)
+    print(f"fake LogMeal listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
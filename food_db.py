@@ -0,0 +1,209 @@
+# --- 食品成分データベース (ローカル) ---
+# 料理名・食品名から食材表の12栄養素を引く。
+# 栄養素は float32 の行優先の配列 (.npy) としてメモリマップで開くため、
+# 各ワーカーのヒープに表全体を読み込まない。名前の索引 (完全一致・かな正規化・あいまい一致) のみ常駐する。
+#
+# 元データは CSV (列: 食品名, よみ, カテゴリ, 食材表と同じ栄養素列)。
+# 同梱の data/foods.csv はデモ用の最小セットで、日本食品標準成分表などから作った CSV を
+# NNBI_FOODS_CSV で指定して使う。デモ用のままなら、認識した料理の栄養素を置き換えには使わない (demo 属性)。
+# ビルド結果の置き場所は NNBI_FOOD_DB_DIR (既定: ~/.cache/nnbi/food_db)。パッケージ内には書き込まない。
+#   python food_db.py build path/to/foods.csv
+#   python food_db.py lookup ほうれんそう
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import unicodedata
+
+import numpy as np
+
+from scoring import NUTRIENT_COLUMNS
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DEMO_SOURCE = os.path.join(DATA_DIR, "foods.csv")
+DEFAULT_SOURCE = os.environ.get("NNBI_FOODS_CSV", DEMO_SOURCE)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "nnbi")
+DEFAULT_PATH = os.environ.get("NNBI_FOOD_DB_DIR", os.path.join(DEFAULT_CACHE_DIR, "food_db"))
+
+NUTRIENT_LABELS = [column for column, _ in NUTRIENT_COLUMNS.values()]
+FUZZY_MIN_SCORE = 0.5
+
+_IGNORED = re.compile(r"[\s・、,，.()（）\[\]「」『』/／\-‐－]")
+
+
+def normalize_name(name):
+    """全角半角・大文字小文字・カタカナ/ひらがなの違いと記号を吸収した検索キー"""
+    text = unicodedata.normalize("NFKC", str(name)).lower()
+    text = _IGNORED.sub("", text)
+    # カタカナ -> ひらがな (長音記号はそのまま)
+    return "".join(chr(ord(ch) - 0x60) if "ァ" <= ch <= "ヶ" else ch for ch in text)
+
+
+def _bigrams(key):
+    if len(key) < 2:
+        return {key} if key else set()
+    return {key[i:i + 2] for i in range(len(key) - 1)}
+
+
+def build_database(source=DEFAULT_SOURCE, path=DEFAULT_PATH):
+    """CSV から栄養素配列 (nutrients.npy) と名前表 (foods.json) を作る"""
+    names, readings, categories, values = [], [], [], []
+    with open(source, newline="", encoding="utf-8-sig") as f:
+        for row in csv.DictReader(f):
+            names.append(row["食品名"])
+            readings.append(row.get("よみ") or "")
+            categories.append(row.get("カテゴリ") or "その他")
+            values.append([float(row.get(label) or 0) for label in NUTRIENT_LABELS])
+
+    os.makedirs(path, exist_ok=True)
+    matrix = np.asarray(values, dtype=np.float32).reshape(-1, len(NUTRIENT_LABELS))
+    source = os.path.abspath(source)
+    meta = {
+        "source": source,
+        "demo": source == DEMO_SOURCE,
+        "columns": NUTRIENT_LABELS,
+        "names": names,
+        "readings": readings,
+        "categories": categories,
+    }
+    # 複数ワーカーが同時にビルドしても壊れないよう、一時ファイルに書いてから置き換える
+    suffix = f".{os.getpid()}.tmp"
+    with open(os.path.join(path, "nutrients.npy" + suffix), "wb") as f:
+        # lookup は1食品 (1行) 単位で読むため、行ごとに連続させて保存する (1行の参照が1ページで済む)
+        np.save(f, np.ascontiguousarray(matrix))
+    with open(os.path.join(path, "foods.json" + suffix), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(os.path.join(path, "nutrients.npy" + suffix), os.path.join(path, "nutrients.npy"))
+    os.replace(os.path.join(path, "foods.json" + suffix), os.path.join(path, "foods.json"))
+    return len(names)
+
+
+def _read_meta(meta_path):
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class FoodDatabase:
+    """
+    メモリマップした食品成分表と名前索引
+    source を指定すると、ビルド済みデータが無いか古い (または別の CSV から作った) 場合に自動でビルドする
+    demo: 同梱のデモ用 CSV から作ったデータか (料理名の一致だけで API の栄養素を置き換えてはいけない)
+    """
+
+    def __init__(self, path=DEFAULT_PATH, source=DEFAULT_SOURCE):
+        meta_path = os.path.join(path, "foods.json")
+        meta = _read_meta(meta_path)
+        if source and os.path.exists(source):
+            stale = (meta is None or meta.get("source") != os.path.abspath(source)
+                     or os.path.getmtime(meta_path) < os.path.getmtime(source))
+            if stale:
+                build_database(source, path)
+                meta = _read_meta(meta_path)
+        if meta is None:
+            raise FileNotFoundError(f"{path}: 食品データベースがありません。python food_db.py build で作ってください")
+        if meta["columns"] != NUTRIENT_LABELS:
+            raise ValueError(f"{path}: 栄養素列が食材表と一致しません。再ビルドしてください")
+        self.demo = meta.get("demo", False)
+        self.names = meta["names"]
+        self.categories = meta["categories"]
+        self.nutrients = np.load(os.path.join(path, "nutrients.npy"), mmap_mode="r")
+
+        # 名前・よみの正規化キー -> 行番号
+        self._exact = {}
+        self._normalized = {}
+        self._bigram_index = {}
+        self._keys = []
+        self._gram_counts = []
+        for i, (name, reading) in enumerate(zip(self.names, meta["readings"])):
+            self._exact.setdefault(name, i)
+            for key in {normalize_name(name), normalize_name(reading)} - {""}:
+                self._normalized.setdefault(key, i)
+                self._keys.append((key, i))
+        for k, (key, _) in enumerate(self._keys):
+            grams = _bigrams(key)
+            self._gram_counts.append(len(grams))
+            for gram in grams:
+                self._bigram_index.setdefault(gram, []).append(k)
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, name, limit=5, min_score=FUZZY_MIN_SCORE):
+        """
+        名前に一致する食品を (行番号, スコア, 一致の種類) のリストで返す
+        一致の種類: "exact" / "normalized" / "fuzzy" (スコアは文字bigramのDice係数)
+        """
+        if name in self._exact:
+            return [(self._exact[name], 1.0, "exact")]
+        key = normalize_name(name)
+        if key in self._normalized:
+            return [(self._normalized[key], 1.0, "normalized")]
+
+        grams = _bigrams(key)
+        if not grams:
+            return []
+        overlaps = {}
+        for gram in grams:
+            for k in self._bigram_index.get(gram, ()):
+                overlaps[k] = overlaps.get(k, 0) + 1
+        best = {}
+        for k, overlap in overlaps.items():
+            row = self._keys[k][1]
+            score = 2 * overlap / (len(grams) + self._gram_counts[k])
+            if score >= min_score and score > best.get(row, 0):
+                best[row] = score
+        ranked = sorted(best.items(), key=lambda item: -item[1])[:limit]
+        return [(row, score, "fuzzy") for row, score in ranked]
+
+    def row(self, index, name=None):
+        """食材表の1行 (dict) を返す"""
+        values = self.nutrients[index]
+        row = {"食材名": name or self.names[index]}
+        row.update({label: round(float(v), 2) for label, v in zip(NUTRIENT_LABELS, values)})
+        row["カテゴリ"] = self.categories[index]
+        return row
+
+    def lookup(self, name, min_score=FUZZY_MIN_SCORE):
+        """最もよく一致する食品の食材表の行。見つからなければ None"""
+        matches = self.match(name, limit=1, min_score=min_score)
+        if not matches:
+            return None
+        return self.row(matches[0][0])
+
+    def suggest(self, text, limit=10):
+        """入力途中の文字列に対する候補名 (オートコンプリート用)"""
+        key = normalize_name(text)
+        if not key:
+            return []
+        prefixed = [self.names[i] for k, i in self._keys if k.startswith(key)]
+        fuzzy = [self.names[i] for i, _, _ in self.match(text, limit=limit)]
+        return list(dict.fromkeys(prefixed + fuzzy))[:limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="食品成分データベース")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="CSV からデータベースを作る")
+    build.add_argument("source", nargs="?", default=DEFAULT_SOURCE)
+    build.add_argument("-o", "--output", default=DEFAULT_PATH)
+    lookup = sub.add_parser("lookup", help="名前で検索する")
+    lookup.add_argument("name")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        count = build_database(args.source, args.output)
+        print(f"{count} 件の食品を登録しました: {args.output}")
+    else:
+        db = FoodDatabase()
+        for index, score, kind in db.match(args.name):
+            print(f"{db.names[index]}\t{kind}\t{score:.2f}\t{db.row(index)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
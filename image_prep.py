@@ -0,0 +1,58 @@
+# --- アップロード画像の前処理 ---
+# スマホ写真 (4-12MB) を1回だけデコードし、認識API送信用の縮小JPEGと
+# 画面表示用サムネイルを作る。セッションにはこの2つの派生バッファだけを保持する。
+
+import io
+from dataclasses import dataclass
+
+from PIL import Image, ImageOps
+
+from logmeal_cache import image_key
+
+UPLOAD_MAX_SIDE = 1024  # 認識には長辺1024pxで十分
+UPLOAD_QUALITY = 85
+THUMBNAIL_MAX_SIDE = 320
+THUMBNAIL_QUALITY = 75
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    key: str  # 元画像バイト列のキャッシュキー
+    upload_bytes: bytes  # 認識API送信用 JPEG
+    thumbnail_bytes: bytes  # 表示用 JPEG
+    original_size: int  # 元ファイルのバイト数
+    width: int
+    height: int
+
+    @property
+    def nbytes(self):
+        return len(self.upload_bytes) + len(self.thumbnail_bytes)
+
+
+def _encode_jpeg(image, max_side, quality):
+    resized = image.copy()
+    resized.thumbnail((max_side, max_side), Image.LANCZOS)
+    buffer = io.BytesIO()
+    resized.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def prepare_image(image_bytes, upload_max_side=UPLOAD_MAX_SIDE, thumbnail_max_side=THUMBNAIL_MAX_SIDE):
+    """画像バイト列を1回デコードし、送信用・表示用の JPEG を作る"""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        # 大きな JPEG はデコード時点で縮小しておく (draft はJPEGのみ有効)
+        image.draft("RGB", (upload_max_side, upload_max_side))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        upload = _encode_jpeg(image, upload_max_side, UPLOAD_QUALITY)
+        thumbnail = _encode_jpeg(image, thumbnail_max_side, THUMBNAIL_QUALITY)
+        width, height = image.size
+    return PreparedImage(
+        key=image_key(image_bytes),
+        upload_bytes=upload,
+        thumbnail_bytes=thumbnail,
+        original_size=len(image_bytes),
+        width=width,
+        height=height,
+    )
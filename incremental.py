@@ -0,0 +1,146 @@
+# --- 食材編集の差分反映 ---
+# st.data_editor の編集状態 (edited_rows / added_rows / deleted_rows) だけを使って
+# 栄養素合計を更新し、入力が変わったサブスコアだけを再計算する。
+# 回答・プロフィールだけで決まる習慣部分は profile_key をキーにキャッシュし、再実行のたびに評価しない。
+# 編集のたびに表全体を合計し直したり、画面全体を再実行したりしない。
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from ingredients import NUTRIENT_LABELS, TOTAL_DIGITS, coerce_nutrient
+from scoring import (
+    MEAL_PARTS, SUBSCORE_INPUTS, habit_partial, nnbi_score, nutrients_from_totals,
+    profile_key, score_subscore,
+)
+
+_LABEL_INDEX = {label: j for j, label in enumerate(NUTRIENT_LABELS)}
+PARTIAL_CACHE_SIZE = 1024  # 保持する回答パターン数
+
+
+class IncrementalTotals:
+    """
+    data_editor に渡した元の表 (IngredientTable) の合計を1回だけ求めておき、
+    編集状態の差分を足し引きして現在の合計を返す (計算量は編集件数に比例)
+    problems: 直近の集計で 0 として扱った不正な値の (行番号, 列名, 値) のリスト
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.values = table.values
+        self.base_sum = self.values.sum(axis=0, dtype=np.float64)
+        self.problems = list(table.problems)
+
+    def delta(self, edit_state):
+        delta = np.zeros(len(NUTRIENT_LABELS))
+        if not edit_state:
+            self.problems = list(self.table.problems)
+            return delta
+        problems = []
+        deleted = set(edit_state.get("deleted_rows", []))
+        edited = set()
+        for pos in deleted:
+            delta -= self.values[pos]
+        for pos, changes in edit_state.get("edited_rows", {}).items():
+            pos = int(pos)
+            if pos in deleted:
+                continue
+            for column, value in changes.items():
+                j = _LABEL_INDEX.get(column)
+                if j is not None:
+                    edited.add((pos, column))
+                    number, ok = coerce_nutrient(value)
+                    if not ok:
+                        problems.append((pos, column, value))
+                    delta[j] += number - self.values[pos, j]
+        for k, row in enumerate(edit_state.get("added_rows", [])):
+            for column, value in row.items():
+                j = _LABEL_INDEX.get(column)
+                if j is not None:
+                    number, ok = coerce_nutrient(value)
+                    if not ok:
+                        problems.append((len(self.values) + k, column, value))
+                    delta[j] += number
+        # 元の表の不正な値は、その行が削除されるかセルが修正されるまで報告し続ける
+        self.problems = [
+            (pos, column, value) for pos, column, value in self.table.problems
+            if pos not in deleted and (pos, column) not in edited
+        ] + problems
+        return delta
+
+    def totals(self, edit_state=None):
+        """列名 -> 合計値"""
+        total = (self.base_sum + self.delta(edit_state)).round(TOTAL_DIGITS)
+        return dict(zip(NUTRIENT_LABELS, total.tolist()))
+
+    def nutrients(self, edit_state=None):
+        """calculate_total_nutrients と同じ形式の nutrients 辞書"""
+        return nutrients_from_totals(self.totals(edit_state))
+
+
+class HabitPartialCache:
+    """
+    habit_partial の結果を profile_key で保持する LRU キャッシュ (スレッドセーフ)
+    同じ回答で食材を編集し直しても、習慣部分と体質判定は1回だけ計算する
+    """
+
+    def __init__(self, maxsize=PARTIAL_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, habit_answers, user_profile):
+        key = profile_key(habit_answers, user_profile)
+        with self._lock:
+            partial = self._entries.get(key)
+            if partial is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return partial
+            self.misses += 1
+        partial = habit_partial(habit_answers, user_profile)
+        with self._lock:
+            self._entries[key] = partial
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return partial
+
+
+# プロセス内で共有する既定のキャッシュ
+partial_cache = HabitPartialCache()
+
+
+class IncrementalScorer:
+    """
+    前回の入力を覚えておき、参照する栄養素・回答が変わったサブスコアだけ再計算する
+    習慣部分は partials (HabitPartialCache) から取得する
+    last_recomputed: 直近の呼び出しで再計算したサブスコア名
+    """
+
+    def __init__(self, partials=None):
+        self.partials = partials or partial_cache
+        self._cache = {}
+        self.last_recomputed = []
+
+    def partial(self, habit_answers, user_profile):
+        """回答・プロフィールだけで決まる部分 (体質タイプを含む)"""
+        return self.partials.get(habit_answers, user_profile)
+
+    def score(self, habit_answers, user_profile, nutrients):
+        """calculate_comprehensive_score と同じ (final_score, breakdown) を返す"""
+        partial = self.partial(habit_answers, user_profile)
+        breakdown = {}
+        self.last_recomputed = []
+        for name in MEAL_PARTS:
+            key = (partial["key"], tuple(nutrients[k] for k in SUBSCORE_INPUTS[name]))
+            cached = self._cache.get(name)
+            if cached is None or cached[0] != key:
+                cached = (key, score_subscore(partial, name, nutrients))
+                self._cache[name] = cached
+                self.last_recomputed.append(name)
+            score, reasons = cached[1]
+            breakdown[name] = {"score": score, "reasons": list(reasons)}
+        return nnbi_score(breakdown), breakdown
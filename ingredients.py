@@ -0,0 +1,148 @@
+# --- 食材表の型 ---
+# 列の順序と型を固定した食材表。栄養素は (行数 x 12) の float32 配列 (列ごとに連続)、カテゴリは Categorical で持つ。
+# data_editor など外部からの値はここで検証・変換する。数値にできない値は合計から黙って落とさず、
+# 0 として扱ったうえで problems に記録する (画面で警告する)。
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from scoring import NUTRIENT_COLUMNS, nutrients_from_totals
+
+NUTRIENT_LABELS = [column for column, _ in NUTRIENT_COLUMNS.values()]
+INGREDIENT_COLUMNS = ["食材名", *NUTRIENT_LABELS, "カテゴリ"]
+CATEGORIES = ["主食", "主菜", "副菜", "汁物", "その他"]
+DEFAULT_CATEGORY = "その他"
+CATEGORY_DTYPE = pd.CategoricalDtype(CATEGORIES)
+TOTAL_DIGITS = 4  # float32 の丸め誤差を合計に持ち込まないための桁
+
+
+def coerce_nutrient(value):
+    """
+    栄養素の値を float に変換する。戻り値は (値, 正常か)
+    空欄は 0 (正常)、数値にできない値・負の値・無限大は 0 (異常) として扱う
+    """
+    if value is None or value is pd.NA:
+        return 0.0, True
+    if isinstance(value, str):
+        value = value.strip().replace(",", "")
+        if not value:
+            return 0.0, True
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0, False
+    if math.isnan(number):
+        return 0.0, True
+    if math.isinf(number) or number < 0:
+        return 0.0, False
+    return number, True
+
+
+def coerce_category(value):
+    return value if value in CATEGORIES else DEFAULT_CATEGORY
+
+
+def nutrient_values(df):
+    """
+    DataFrame の栄養素列を (行数, 栄養素列) の float32 配列 (Fortran 順) に変換する
+    変換規則は coerce_nutrient と同じ (列が足りなければ空欄扱い)。戻り値は (配列, problems)
+    アプリの食材表と一括採点 (batch_cli) の両方がこの変換を通る
+    """
+    n = 0 if df is None else len(df)
+    values = np.zeros((n, len(NUTRIENT_LABELS)), dtype=np.float32, order="F")
+    problems = []
+    if n == 0:
+        return values, problems
+    for j, label in enumerate(NUTRIENT_LABELS):
+        if label not in df.columns:
+            continue
+        column = df[label]
+        if column.dtype.kind in "fiub":
+            numbers = column.to_numpy(dtype=np.float64, na_value=np.nan)
+            bad = (np.isinf(numbers) | (numbers < 0)) & ~np.isnan(numbers)
+            numbers = np.where(bad | np.isnan(numbers), 0, numbers)
+        else:
+            coerced = [coerce_nutrient(v) for v in column]
+            numbers = np.fromiter((number for number, _ in coerced), dtype=np.float64, count=n)
+            bad = np.fromiter((not ok for _, ok in coerced), dtype=bool, count=n)
+        for i in np.flatnonzero(bad):
+            problems.append((int(i), label, column.iloc[i]))
+        values[:, j] = numbers
+    return values, problems
+
+
+class IngredientTable:
+    """
+    食材表 (食材名, 栄養素12列, カテゴリ)
+    problems: 変換できなかったセルの (行番号, 列名, 元の値) のリスト
+    """
+
+    __slots__ = ("names", "category_codes", "values", "problems")
+
+    def __init__(self, names, category_codes, values, problems=()):
+        self.names = names
+        self.category_codes = category_codes  # CATEGORIES の番号 (int8)
+        self.values = values  # (行数, 栄養素列) の float32 配列。列ごとの集計が連続アクセスになるよう Fortran 順
+        self.problems = list(problems)
+
+    @classmethod
+    def from_frame(cls, df):
+        """DataFrame から作る (列が足りなければ空欄扱い、余分な列は無視する)"""
+        n = 0 if df is None else len(df)
+        values, problems = nutrient_values(df)
+        if n == 0:
+            return cls((), np.zeros(0, dtype=np.int8), values, problems)
+        names = df["食材名"] if "食材名" in df.columns else pd.Series([""] * n)
+        names = tuple("" if pd.isna(name) else str(name) for name in names)
+        if "カテゴリ" in df.columns:
+            categories = pd.Categorical(df["カテゴリ"].map(coerce_category), dtype=CATEGORY_DTYPE)
+            codes = categories.codes.astype(np.int8)
+        else:
+            codes = np.full(n, CATEGORIES.index(DEFAULT_CATEGORY), dtype=np.int8)
+        return cls(names, codes, values, problems)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """dict の行のリスト (API・食品DBの行) から作る"""
+        return cls.from_frame(pd.DataFrame(list(rows), columns=INGREDIENT_COLUMNS))
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def nbytes(self):
+        # 食材名の文字列は含めない概算
+        return self.values.nbytes + self.category_codes.nbytes + 8 * len(self.names)
+
+    def to_frame(self):
+        """列順・型 (float32, Categorical) を固定した DataFrame"""
+        df = pd.DataFrame(self.values, columns=NUTRIENT_LABELS)
+        df.insert(0, "食材名", pd.Series(self.names, dtype=object))
+        df["カテゴリ"] = pd.Categorical.from_codes(self.category_codes, dtype=CATEGORY_DTYPE)
+        return df
+
+    def to_rows(self):
+        """食材表の行 (dict) のリスト (JSON に保存できる形)"""
+        return [
+            {"食材名": name, **{label: round(v, TOTAL_DIGITS) for label, v in zip(NUTRIENT_LABELS, values)},
+             "カテゴリ": CATEGORIES[code]}
+            for name, values, code in zip(self.names, self.values.tolist(), self.category_codes.tolist())
+        ]
+
+    def totals(self):
+        """列名 -> 合計値 (列ごとに連続した配列を1回で集計する)"""
+        total = self.values.sum(axis=0, dtype=np.float64).round(TOTAL_DIGITS)
+        return dict(zip(NUTRIENT_LABELS, total.tolist()))
+
+    def nutrients(self):
+        """calculate_total_nutrients と同じ形式の nutrients 辞書"""
+        return nutrients_from_totals(self.totals())
+
+
+def describe_problems(problems, limit=3):
+    """problems を画面表示用の短い文にする"""
+    cells = [f"{row + 1}行目の{column}「{value}」" for row, column, value in problems[:limit]]
+    more = f" ほか{len(problems) - limit}件" if len(problems) > limit else ""
+    return "、".join(cells) + more
@@ -0,0 +1,136 @@
+# --- LogMeal 認識結果のディスクキャッシュ ---
+# 画像バイト列のハッシュをキーに、認識・栄養素APIの結果(JSON)を保存する。
+# 同じ写真の再アップロードではネットワークにもAPIクォータにも触れずに結果を返す。
+# SQLite (WALモード) を使うため、同一ホスト上の複数 Streamlit ワーカーから共有できる。
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "nnbi")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256MB
+DEFAULT_TTL = 30 * 24 * 3600  # 30日
+STATS_FLUSH_INTERVAL = 30.0  # ヒット/ミス数を共有テーブルへ書き出す間隔 (秒)
+
+
+def image_key(image_bytes, namespace="meal"):
+    """
+    画像内容から決まるキャッシュキー
+    namespace は保存する値の形式ごとに変える (既定: 料理ごとの食材表の行)
+    """
+    return namespace + ":" + hashlib.sha256(image_bytes).hexdigest()
+
+
+class LogMealCache:
+    """
+    サイズ上限 (max_bytes) と有効期限 (ttl 秒) 付きの永続キャッシュ
+    上限超過時は最終アクセスが古いものから削除する
+    """
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        if path is None:
+            cache_dir = os.environ.get("LOGMEAL_CACHE_DIR", DEFAULT_CACHE_DIR)
+            os.makedirs(cache_dir, exist_ok=True)
+            path = os.path.join(cache_dir, "logmeal_cache.sqlite3")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # 読み出しのたびに書き込まないよう、共有テーブルへの加算はまとめて行う
+        self._unflushed = {"hits": 0, "misses": 0}
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+        # 全ワーカー合算のヒット/ミス数
+        self._conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0)")
+
+    def get(self, key):
+        """キャッシュ済みのレスポンスを返す。なければ None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                self._unflushed["misses"] += 1
+                self._flush_stats()
+                return None
+            self.hits += 1
+            self._unflushed["hits"] += 1
+            self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self._flush_stats()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        blob = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now),
+            )
+            self._evict(now)
+            self._flush_stats(force=True)
+
+    def _flush_stats(self, force=False):
+        # ロックを持った状態で呼ぶ
+        if not force and time.monotonic() - self._flushed_at < STATS_FLUSH_INTERVAL:
+            return
+        self._flushed_at = time.monotonic()
+        if not any(self._unflushed.values()):
+            return
+        self._conn.executemany("UPDATE stats SET value = value + ? WHERE name = ?",
+                               [(count, name) for name, count in self._unflushed.items()])
+        self._unflushed = {"hits": 0, "misses": 0}
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 古いものから上限内に収まるまで削除
+        removed = 0
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+            if total - removed <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            removed += size
+
+    def stats(self):
+        """ヒット/ミス数 (このプロセス分と全ワーカー合算) と使用量"""
+        with self._lock:
+            self._flush_stats(force=True)
+            shared = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": shared.get("hits", 0),
+            "total_misses": shared.get("misses", 0),
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+
+    def close(self):
+        with self._lock:
+            self._flush_stats(force=True)
+        self._conn.close()
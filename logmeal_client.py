@@ -0,0 +1,255 @@
+# --- LogMeal API クライアント ---
+# keep-alive の接続プールを全セッションで共有し、接続/読み取りタイムアウト・
+# バックオフ付きリトライ・サーキットブレーカーで上流の遅延や障害から画面スレッドを守る。
+# 接続先は LOGMEAL_BASE_URL で差し替え可能 (fake_logmeal.py のスタブサーバー等)。
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from scoring import NUTRIENT_COLUMNS
+
+DEFAULT_BASE_URL = "https://api.logmeal.es"
+PATH_RECOGNITION = "/v2/image/recognition/dish"
+PATH_SEGMENTATION = "/v2/image/segmentation/complete"
+PATH_NUTRITION = "/v2/recipe/nutritionalInfo"
+
+MIN_CONFIDENCE = 0.3  # これ未満の認識候補は捨てる
+LOOKUP_PARALLELISM = 4  # 料理ごとの栄養素取得の同時実行数
+
+# LogMeal の栄養素コード -> 食材表の列名
+NUTRIENT_CODES = {
+    "ENERC_KCAL": "カロリー(kcal)",
+    "PROCNT": "タンパク質(g)",
+    "FAT": "脂質(g)",
+    "CHOCDF": "炭水化物(g)",
+    "THIA": "ビタミンB1(mg)",
+    "VITC": "ビタミンC(mg)",
+    "VITD": "ビタミンD(μg)",
+    "FE": "鉄分(mg)",
+    "ZN": "亜鉛(mg)",
+    "MG": "マグネシウム(mg)",
+}
+# LogMeal は食物繊維の総量 (FIBTG) のみ返すため、一般的な比率で水溶性/不溶性に按分する
+FIBER_SOLUBLE_RATIO = 0.3
+# 栄養素を取得できなかった料理の行に付ける印 (食材表の列ではないため表示・採点では無視される)
+NUTRITION_MISSING = "栄養素未取得"
+
+
+class CircuitOpenError(Exception):
+    """サーキットブレーカーが開いており、上流への呼び出しを行わなかった"""
+
+
+class CircuitBreaker:
+    """
+    連続失敗が failure_threshold 回に達したら reset_timeout 秒間呼び出しを遮断する
+    遮断明けの最初の1回 (half-open) が成功すれば復帰、失敗すれば再び遮断
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                return False
+            self._probing = True  # 試行は1件だけ通す
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class _PostSafeRetry(Retry):
+    """
+    POST (認識・栄養素APIはどれも課金される非冪等な呼び出し) は、リクエストが届いていない接続エラーと
+    Retry-After 付きの 429 だけ再試行する。読み取りタイムアウトや 5xx では上流で処理済みの可能性があるため再送しない
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method and method.upper() == "POST":
+            return bool(self.total and self.respect_retry_after_header and has_retry_after and status_code == 429)
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class LogMealClient:
+    """
+    LogMeal API 呼び出し用クライアント (スレッドセーフ)
+    timeout: (接続, 読み取り) 秒
+    retries: 再試行回数 (backoff_factor による指数バックオフ)。
+             冪等なメソッドは接続/読み取りエラー・429/5xx、POST は接続エラーと Retry-After 付きの 429 のみ
+    """
+
+    def __init__(self, base_url=None, connect_timeout=3.05, read_timeout=20.0,
+                 retries=2, backoff_factor=0.5, pool_maxsize=20, breaker=None,
+                 lookup_parallelism=LOOKUP_PARALLELISM):
+        self.base_url = (base_url or os.environ.get("LOGMEAL_BASE_URL", DEFAULT_BASE_URL)).rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = breaker or CircuitBreaker()
+        # 栄養素取得用のスレッドは全セッションで共有し、同時実行数を抑える
+        self._lookups = ThreadPoolExecutor(max_workers=lookup_parallelism, thread_name_prefix="logmeal")
+        retry = _PostSafeRetry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,  # POST を含まない (読み取りエラーで再送しない)
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _request(self, method, path, api_token, **kwargs):
+        if not self.breaker.allow():
+            raise CircuitOpenError("LogMeal API への接続を一時停止中です")
+        headers = {'Authorization': 'Bearer ' + api_token}
+        try:
+            response = self.session.request(method, self.base_url + path, headers=headers,
+                                            timeout=self.timeout, **kwargs)
+            if response.status_code >= 500 or response.status_code == 429:
+                response.raise_for_status()
+            data = response.json() if response.ok else None
+        except BaseException:
+            # 通信エラー・5xx/429・壊れた応答など、どの例外でも失敗として数える
+            # (half-open の試行中に記録し損ねると、遮断が解けなくなるため)
+            self.breaker.record_failure()
+            raise
+        # 4xx (トークン不正など) は上流の劣化ではないので遮断の対象外
+        self.breaker.record_success()
+        response.raise_for_status()
+        return data
+
+    def recognize_dish(self, image_bytes, api_token):
+        """料理認識APIのレスポンス(JSON)を返す"""
+        return self._request("POST", PATH_RECOGNITION, api_token, files={'image': image_bytes})
+
+    def segment_meal(self, image_bytes, api_token):
+        """複数料理の認識APIのレスポンス(JSON)を返す"""
+        return self._request("POST", PATH_SEGMENTATION, api_token, files={'image': image_bytes})
+
+    def nutritional_info(self, image_id, position, api_token):
+        """認識済み画像の1料理分の栄養素(JSON)を返す"""
+        payload = {"imageId": image_id, "food_item_position": [position]}
+        return self._request("POST", PATH_NUTRITION, api_token, json=payload)
+
+    def analyze_meal(self, image_bytes, api_token, min_confidence=MIN_CONFIDENCE, resolve=None, cancelled=None):
+        """
+        画像内の料理をすべて認識し、料理ごとの栄養素を並行して取得する
+        resolve: 料理名 -> 食材表の行 (なければ None)。ローカルで解決できた料理はAPIを呼ばない
+        cancelled: 認識後に呼び、True なら栄養素APIを呼ばずに None を返す (取り消された解析でAPIを使わないため)
+        戻り値: 食材表の行 (dict) のリスト。認識できなければ空リスト
+        栄養素を取得できなかった料理は、料理名だけの空の行 (NUTRITION_MISSING 付き) にする
+        """
+        data = self.segment_meal(image_bytes, api_token)
+        if cancelled is not None and cancelled():
+            return None
+        dishes = detected_dishes(data, min_confidence)
+        rows = [resolve(dish["name"]) if resolve else None for dish in dishes]
+        futures = [
+            None if row is not None else
+            self._lookups.submit(self.nutritional_info, data.get("imageId"), dish["position"], api_token)
+            for dish, row in zip(dishes, rows)
+        ]
+        # 全体の所要時間は最も遅い1件程度に収まる
+        try:
+            for i, (dish, future) in enumerate(zip(dishes, futures)):
+                if future is None:
+                    continue
+                try:
+                    rows[i] = nutrition_row(dish, future.result())
+                except Exception:
+                    # 1件の失敗で他の料理の結果まで捨てない
+                    rows[i] = missing_nutrition_row(dish)
+        except BaseException:
+            # 中断時は待ち行列に残った取得を取り消し、クォータを使わない
+            for future in futures:
+                if future is not None:
+                    future.cancel()
+            raise
+        return rows
+
+    def close(self):
+        self._lookups.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+
+def detected_dishes(data, min_confidence=MIN_CONFIDENCE):
+    """認識結果から、信頼度が閾値以上の料理 (各領域の第1候補) を取り出す"""
+    dishes = []
+    for i, segment in enumerate(data.get("segmentation_results", [])):
+        candidates = segment.get("recognition_results", [])
+        if not candidates:
+            continue
+        best = candidates[0]
+        if best.get("prob", 0) < min_confidence:
+            continue
+        dishes.append({
+            "position": segment.get("food_item_position", i + 1),
+            "id": best.get("id"),
+            "name": best["name"],
+            "prob": best.get("prob", 0),
+        })
+    return dishes
+
+
+def nutrition_row(dish, info):
+    """栄養素APIのレスポンスを食材表の1行に変換する"""
+    nutrients = (info.get("nutritional_info") or {}).get("totalNutrients") or {}
+
+    def quantity(code):
+        return round(float((nutrients.get(code) or {}).get("quantity") or 0), 2)
+
+    values = {column: quantity(code) for code, column in NUTRIENT_CODES.items()}
+    fiber = quantity("FIBTG")
+    values["水溶性食物繊維(g)"] = round(fiber * FIBER_SOLUBLE_RATIO, 2)
+    values["不溶性食物繊維(g)"] = round(fiber - values["水溶性食物繊維(g)"], 2)
+
+    row = {"食材名": dish["name"]}
+    row.update({column: values[column] for column, _ in NUTRIENT_COLUMNS.values()})
+    row["カテゴリ"] = "その他"
+    return row
+
+
+def missing_nutrition_row(dish):
+    """栄養素を取得できなかった料理の行 (栄養素は空欄。食材表で入力してもらう)"""
+    row = {"食材名": dish["name"]}
+    row.update({column: None for column, _ in NUTRIENT_COLUMNS.values()})
+    row["カテゴリ"] = "その他"
+    row[NUTRITION_MISSING] = True
+    return row
@@ -0,0 +1,232 @@
+# --- 食事記録 (ユーザーごとの食事履歴) ---
+# 解析・編集した食材表をユーザーごとに SQLite へ保存する。
+# 日別合計 (daily_totals) と直近7日間の合計 (rolling_totals) は食事の追加・削除時に差分で更新するため、
+# 1日分・1週間分の摂取量の採点や1年分の推移の表示で履歴全体を読み直さない。
+# 保存先は NNBI_DATA_DIR (既定: ~/.local/share/nnbi) の diary.sqlite3。
+# 記録の持ち主 (user_id) は利用者が入力した名前ではなく、ログイン中のアカウントか、サーバーで発行した
+# 推測できない鍵 (new_diary_token) から作る。どちらもハッシュにしてから保存する (鍵そのものは残さない)。
+
+import datetime
+import hashlib
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+
+from scoring import NUTRIENT_COLUMNS, nutrients_from_totals
+
+DEFAULT_DATA_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "nnbi")
+ROLLING_DAYS = 7
+TOKEN_BYTES = 16  # 記録の鍵の乱数バイト数 (base64url で22文字)
+_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_-]{22,64}")
+
+NUTRIENT_KEYS = list(NUTRIENT_COLUMNS)
+NUTRIENT_LABELS = [column for column, _ in NUTRIENT_COLUMNS.values()]
+_COLUMNS_SQL = ", ".join(f"{key} REAL NOT NULL DEFAULT 0" for key in NUTRIENT_KEYS)
+_KEYS_SQL = ", ".join(NUTRIENT_KEYS)
+
+
+def day_number(timestamp):
+    """UNIX時刻 -> ローカル日付の通し番号 (date.toordinal)"""
+    return datetime.date.fromtimestamp(timestamp).toordinal()
+
+
+def day_of(number):
+    return datetime.date.fromordinal(number)
+
+
+def new_diary_token():
+    """新しい記録の鍵 (推測できない乱数)"""
+    return secrets.token_urlsafe(TOKEN_BYTES)
+
+
+def token_user_id(token):
+    """記録の鍵 -> 保存に使う user_id。鍵の形式でなければ (手入力の名前など) None"""
+    if not token or not _TOKEN_PATTERN.fullmatch(token):
+        return None
+    return "token:" + hashlib.sha256(token.encode("ascii")).hexdigest()
+
+
+def account_user_id(subject):
+    """ログイン中のアカウント (OIDC の sub など) -> 保存に使う user_id"""
+    return "account:" + hashlib.sha256(str(subject).encode("utf-8")).hexdigest()
+
+
+def _row_totals(row, offset):
+    # SELECT 結果の栄養素列 (NUTRIENT_KEYS 順) を 列名 -> 合計値 の辞書にする
+    return dict(zip(NUTRIENT_LABELS, row[offset:offset + len(NUTRIENT_KEYS)]))
+
+
+class MealDiary:
+    """
+    ユーザーごとの食事履歴と日別・7日間の集計 (スレッドセーフ)
+    集計値はすべて 列名 -> 合計値 の辞書 (nutrients_from_totals にそのまま渡せる形) で返す
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            data_dir = os.environ.get("NNBI_DATA_DIR", DEFAULT_DATA_DIR)
+            os.makedirs(data_dir, exist_ok=True)
+            path = os.path.join(data_dir, "diary.sqlite3")
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meals ("
+            " id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, eaten_at REAL NOT NULL, day INTEGER NOT NULL,"
+            f" score INTEGER, names TEXT NOT NULL, ingredients TEXT NOT NULL, {_COLUMNS_SQL})"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS meals_user_time ON meals(user_id, eaten_at)")
+        for table in ("daily_totals", "rolling_totals"):
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                f" user_id TEXT NOT NULL, day INTEGER NOT NULL, meals INTEGER NOT NULL DEFAULT 0, {_COLUMNS_SQL},"
+                " PRIMARY KEY (user_id, day)) WITHOUT ROWID"
+            )
+
+    def add_meal(self, user_id, table, eaten_at=None, score=None):
+        """食材表 (IngredientTable) を1食分として記録し、食事IDを返す"""
+        eaten_at = time.time() if eaten_at is None else eaten_at
+        totals = table.totals()
+        values = [totals[label] for label in NUTRIENT_LABELS]
+        names = json.dumps(list(table.names), ensure_ascii=False)
+        rows = json.dumps(table.to_rows(), ensure_ascii=False)
+        day = day_number(eaten_at)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.execute(
+                    f"INSERT INTO meals (user_id, eaten_at, day, score, names, ingredients, {_KEYS_SQL})"
+                    f" VALUES (?, ?, ?, ?, ?, ?, {', '.join('?' * len(values))})",
+                    (user_id, eaten_at, day, score, names, rows, *values),
+                )
+                self._apply(user_id, day, 1, values)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.lastrowid
+
+    def delete_meal(self, user_id, meal_id):
+        """記録を削除する。削除できたら True"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    f"SELECT day, {_KEYS_SQL} FROM meals WHERE id = ? AND user_id = ?", (meal_id, user_id)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute("DELETE FROM meals WHERE id = ?", (meal_id,))
+                    self._apply(user_id, row[0], -1, [-v for v in row[1:]])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row is not None
+
+    def _apply(self, user_id, day, meals, values):
+        # 日別合計と、その日を含む7日間の合計 (day .. day+6 を末日とする行) に差分を足す (ロック・トランザクション内で呼ぶ)
+        updates = ", ".join(f"{key} = {key} + excluded.{key}" for key in NUTRIENT_KEYS)
+        params = ", ".join("?" * len(values))
+        for table, days in (("daily_totals", [day]), ("rolling_totals", range(day, day + ROLLING_DAYS))):
+            self._conn.executemany(
+                f"INSERT INTO {table} (user_id, day, meals, {_KEYS_SQL}) VALUES (?, ?, ?, {params})"
+                f" ON CONFLICT (user_id, day) DO UPDATE SET meals = meals + excluded.meals, {updates}",
+                [(user_id, d, meals, *values) for d in days],
+            )
+            if meals < 0:
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE user_id = ? AND day BETWEEN ? AND ? AND meals <= 0",
+                    (user_id, days[0], days[-1]),
+                )
+
+    def meals(self, user_id, start=None, end=None, limit=None):
+        """期間 [start, end) の食事 (新しい順)。各要素は id, eaten_at, score, names, totals の辞書"""
+        query = f"SELECT id, eaten_at, score, names, {_KEYS_SQL} FROM meals WHERE user_id = ?"
+        params = [user_id]
+        if start is not None:
+            query += " AND eaten_at >= ?"
+            params.append(start)
+        if end is not None:
+            query += " AND eaten_at < ?"
+            params.append(end)
+        query += " ORDER BY eaten_at DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            {
+                "id": row[0],
+                "eaten_at": row[1],
+                "score": row[2],
+                "names": json.loads(row[3]),
+                "totals": _row_totals(row, 4),
+            }
+            for row in rows
+        ]
+
+    def meal_rows(self, meal_id):
+        """記録した食材表の行 (dict) のリスト"""
+        with self._lock:
+            row = self._conn.execute("SELECT ingredients FROM meals WHERE id = ?", (meal_id,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _totals(self, table, user_id, start_day, end_day):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT day, meals, {_KEYS_SQL} FROM {table}"
+                " WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+                (user_id, start_day, end_day),
+            ).fetchall()
+        return [(day_of(row[0]), row[1], _row_totals(row, 2)) for row in rows]
+
+    def daily_totals(self, user_id, start, end):
+        """日付 start..end (datetime.date, 両端含む) の (日付, 食事数, 合計) のリスト。記録のない日は含まない"""
+        return self._totals("daily_totals", user_id, start.toordinal(), end.toordinal())
+
+    def rolling_totals(self, user_id, start, end):
+        """各日を末日とする直近7日間の (日付, 食事数, 合計) のリスト"""
+        return self._totals("rolling_totals", user_id, start.toordinal(), end.toordinal())
+
+    def day_totals(self, user_id, day, rolling=False):
+        """1日分 (rolling=True なら day を末日とする7日間) の (食事数, 合計)。記録がなければ (0, {})"""
+        found = self._totals("rolling_totals" if rolling else "daily_totals", user_id, day.toordinal(), day.toordinal())
+        if not found:
+            return 0, {}
+        return found[0][1], found[0][2]
+
+    def rebuild(self, user_id=None):
+        """meals から日別・7日間の集計を作り直す (集計の不整合を直す場合用)"""
+        where, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table in ("daily_totals", "rolling_totals"):
+                    self._conn.execute(f"DELETE FROM {table} {where}", params)
+                rows = self._conn.execute(f"SELECT user_id, day, {_KEYS_SQL} FROM meals {where}", params).fetchall()
+                for row in rows:
+                    self._apply(row[0], row[1], 1, list(row[2:]))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        self._conn.close()
+
+
+def average_nutrients(meals, totals):
+    """
+    期間の合計を1食あたりの nutrients 辞書にする
+    採点ルールの閾値は1食分を前提にしているため、1日・1週間の摂取量はこの値で採点する
+    """
+    if not meals:
+        return {}
+    return nutrients_from_totals({label: value / meals for label, value in totals.items()})
@@ -0,0 +1,206 @@
+# --- 処理段階ごとの計測と Prometheus 形式での出力 ---
+# 画面の1回の実行 (スクリプトの再実行) や解析ジョブの中で、段階ごとの所要時間を span で記録し、
+# 段階別のヒストグラムに集計する。再実行の回数は理由ごとのカウンタで数える。
+# 所要時間の記録は NNBI_METRICS_SAMPLE_RATE の割合 (既定 0.1) の実行だけで行い、
+# 記録しない実行での span は属性を1回見るだけにする。カウンタは常に数える。
+#
+# 出力 (どちらも任意):
+#   NNBI_METRICS_PORT=9464  -> http://127.0.0.1:9464/metrics で Prometheus のテキスト形式を返す
+#   NNBI_METRICS_FILE=path  -> 同じ内容を NNBI_METRICS_FILE_INTERVAL 秒 (既定 15) ごとにファイルへ書き出す
+#                              (node_exporter の textfile collector など用)
+# 標準ライブラリのみに依存する (入力画面の表示で重いモジュールを読み込まないため)。
+
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_RATE = float(os.environ.get("NNBI_METRICS_SAMPLE_RATE", 0.1))
+FILE_INTERVAL = float(os.environ.get("NNBI_METRICS_FILE_INTERVAL", 15))
+# 所要時間のバケット (秒)。画面の再実行 (数十ms) から API 呼び出し (数秒) までを覆う
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+STAGE_SECONDS = "nnbi_stage_duration_seconds"
+RUNS_TOTAL = "nnbi_script_runs_total"
+RERUNS_TOTAL = "nnbi_reruns_total"
+SPECULATIVE_TOTAL = "nnbi_speculative_analyses_total"
+
+_HELP = {
+    STAGE_SECONDS: ("histogram", "処理段階ごとの所要時間 (サンプリングした実行のみ)"),
+    RUNS_TOTAL: ("counter", "ページごとのスクリプト実行回数"),
+    RERUNS_TOTAL: ("counter", "理由ごとの再実行回数 (st.rerun と食材表の編集)"),
+    SPECULATIVE_TOTAL: ("counter", "アップロード時に始めた先読み解析の結果 (開始・完了済みで使用・実行中に使用・取り消し・期限切れ)"),
+}
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    items = [*labels, *extra]
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+class Registry:
+    """ヒストグラムとカウンタの集計 (スレッドセーフ)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self):
+        """Prometheus のテキスト形式 (version 0.0.4)"""
+        with self._lock:
+            histograms = {key: (list(h.counts), h.total, h.count) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        names = sorted({name for name, _ in histograms} | {name for name, _ in counters})
+        for name in names:
+            kind, text = _HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, n in zip(BUCKETS, counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', f'{bound:g}')])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+_local = threading.local()
+
+
+# --- 実行単位のサンプリングと span ---
+
+def sample():
+    """この実行 (またはジョブ) の所要時間を記録するか"""
+    return SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+
+
+def start_run(page):
+    """スクリプトの実行の始めに呼ぶ。実行回数を数え、この実行の span を記録するかを決める"""
+    registry.inc(RUNS_TOTAL, page=page)
+    _local.sampled = sample()
+    return _local.sampled
+
+
+@contextmanager
+def span(stage, sampled=None):
+    """
+    stage の所要時間を記録する
+    sampled: 記録するか (省略時はこのスレッドで実行中のスクリプトの start_run の結果)
+    """
+    if not (getattr(_local, "sampled", False) if sampled is None else sampled):
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(STAGE_SECONDS, time.perf_counter() - start, stage=stage)
+
+
+def observe(stage, seconds, sampled=True):
+    """別に測った所要時間を記録する (開始と終了が別の場所にある段階用)"""
+    if sampled:
+        registry.observe(STAGE_SECONDS, seconds, stage=stage)
+
+
+def count_rerun(reason):
+    registry.inc(RERUNS_TOTAL, reason=reason)
+
+
+def count_speculative(outcome):
+    registry.inc(SPECULATIVE_TOTAL, outcome=outcome)
+
+
+# --- 出力 ---
+
+def write_file(path):
+    """テキスト形式をファイルに書き出す (書き込み途中のファイルを読まれないよう、一時ファイルから置き換える)"""
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(registry.render())
+    os.replace(path + ".tmp", path)
+
+
+_last_write = 0.0
+
+
+def export_periodically():
+    """NNBI_METRICS_FILE が設定されていれば、前回から FILE_INTERVAL 秒以上たった時だけ書き出す"""
+    global _last_write
+    path = os.environ.get("NNBI_METRICS_FILE")
+    now = time.monotonic()
+    if path and now - _last_write >= FILE_INTERVAL:
+        _last_write = now
+        write_file(path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # アクセスログは出さない
+
+
+def serve(port, host="127.0.0.1"):
+    """/metrics を返す HTTP サーバーをデーモンスレッドで起動し、サーバーを返す"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="nnbi-metrics", daemon=True).start()
+    return server
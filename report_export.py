@@ -0,0 +1,299 @@
+# --- 参加者ごとの NNBI レポートの一括書き出し ---
+# batch_cli.py の採点結果から、参加者1人につき1つの印刷用 HTML レポートを作る (Streamlit UI を経由しない)。
+# 内容は結果画面と同じ総合スコアのゲージ (draw_score_gauge)・PFCバランス (draw_pfc_balance)・
+# サブスコアの内訳と理由・体質タイプ。理由は --reasons 付きで採点した結果にだけ載る。
+# - 図は charts.py の関数で1回だけ作り、その data / layout を共有の assets/report.js に書き出す。
+#   各レポートには参加者ごとの値だけを埋め込み、ブラウザで共有の図に値を入れて描画する
+#   (レポートごとに Plotly の図を組み立てない。plotly.min.js とスタイルも assets に1つだけ置く)
+# - レポートの組み立てはチャンク単位でプロセスプールに分け、できたチャンクから順に書き出す。
+#   ディレクトリへはワーカーが直接書き、zip へは親プロセスがまとめて書く。
+#   zip への書き込みは親プロセスの1スレッドに集まるため、既定では圧縮しない (1件あたり数十µs。
+#   圧縮するとレポートの組み立てより重くなり、ワーカー数を増やしても速くならない)。--compress で圧縮する
+# 係数とその版は採点結果の列 (batch_cli.py が書く weights_version, w_diet など) から載せる。
+# 現在の係数ではなく、その結果を採点したときの係数を表示するため。
+# PDF が必要な場合は、ブラウザで開いて印刷する (印刷用のスタイル付き)。
+#
+# 使い方:
+#   python batch_cli.py questionnaires.csv ingredients.csv -o scores.parquet --reasons
+#   python report_export.py scores.parquet -o reports/       # ディレクトリへ
+#   python report_export.py scores.parquet -o reports.zip    # zip へ
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import sys
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from string import Template
+
+import pandas as pd
+
+from batch_cli import read_chunks
+from batch_scoring import decode_reasons
+from scoring import CONSTITUTIONS, NUTRIENT_COLUMNS
+
+DEFAULT_CHUNKSIZE = 500  # 1タスクで組み立てるレポート数
+ASSETS_DIR = "assets"
+
+CONSTITUTION_DESCS = {c["type"]: c["desc"] for c in CONSTITUTIONS}
+# (サブスコア, 表示名, 重みの列, 式での符号)
+SUBSCORE_ROWS = [
+    ("diet", "X<sub>diet</sub> 食事質", "w_diet", 1),
+    ("bio", "X<sub>bio</sub> 腸内環境", "w_bio", 1),
+    ("dop", "X<sub>dop</sub> 脳内物質", "w_dop", 1),
+    ("risk", "X<sub>risk</sub> リスク", "w_risk", -1),
+]
+UNKNOWN_VERSION = "不明"  # 係数の列がない (古い batch_cli で採点した) 結果
+
+REPORT_TEMPLATE = Template("""<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<title>NNBI レポート $participant</title>
+<link rel="stylesheet" href="$assets/report.css">
+<script src="$assets/plotly.min.js"></script>
+<script src="$assets/report.js"></script>
+</head>
+<body>
+<h1>メンタルヘルス食習慣スコア レポート (NNBI Model)</h1>
+<p class="meta">参加者ID: $participant / 係数の版: $version</p>
+<section class="summary">
+<div id="gauge" class="chart"></div>
+<div class="constitution"><h2>体質タイプ: $constitution</h2><p>$constitution_desc</p></div>
+</section>
+<h2>NNBIスコア算出の内訳</h2>
+<table class="breakdown">
+<tr><th>項目</th><th>重み</th><th>スコア</th><th>理由</th></tr>
+$breakdown
+</table>
+<h2>栄養素 (1食あたり)</h2>
+<section class="nutrients">
+$pfc
+<table>
+$nutrients
+</table>
+</section>
+<script>nnbiRender($values);</script>
+</body>
+</html>
+""")
+
+REPORT_CSS = """body { font-family: sans-serif; margin: 2em auto; max-width: 48em; color: #222; }
+h1 { font-size: 1.4em; }
+h2 { font-size: 1.1em; margin-top: 1.5em; }
+.meta { color: #666; font-size: 0.9em; }
+.summary, .nutrients { display: flex; gap: 2em; align-items: center; }
+.summary .chart { width: 20em; height: 250px; flex: none; }
+.nutrients .chart { width: 12em; height: 150px; flex: none; }
+table { border-collapse: collapse; }
+th, td { border-bottom: 1px solid #ddd; padding: 0.3em 0.8em; text-align: left; vertical-align: top; }
+.breakdown td:nth-child(2), .breakdown td:nth-child(3) { text-align: right; white-space: nowrap; }
+@media print {
+  body { margin: 0; max-width: none; }
+  section, table { break-inside: avoid; }
+}
+"""
+
+# 共有の図に参加者ごとの値を入れて描画する
+REPORT_JS = Template("""const NNBI_FIGURES = $figures;
+
+function nnbiRender(values) {
+  const config = {staticPlot: true, displayModeBar: false};
+  const gauge = structuredClone(NNBI_FIGURES.gauge);
+  gauge.data[0].value = values.score;
+  gauge.data[0].gauge.threshold.value = values.score;
+  Plotly.newPlot("gauge", gauge.data, gauge.layout, config);
+  if (values.pfc) {
+    const pfc = structuredClone(NNBI_FIGURES.pfc);
+    pfc.data[0].values = values.pfc;
+    Plotly.newPlot("pfc", pfc.data, pfc.layout, config);
+  }
+}
+""")
+
+
+# --- 共有ファイル ---
+
+def shared_assets():
+    """(ファイル名, 内容) のリスト。assets/ 以下に1回だけ置く"""
+    import plotly.io as pio
+    from plotly.offline import get_plotlyjs
+
+    from charts import draw_pfc_balance, draw_score_gauge
+
+    # 値はレポートごとに差し替えるため、図の形 (data / layout) だけを使う
+    figures = {
+        "gauge": json.loads(pio.to_json(draw_score_gauge(0))),
+        "pfc": json.loads(pio.to_json(draw_pfc_balance(1, 1, 1))),
+    }
+    return [
+        ("plotly.min.js", get_plotlyjs()),
+        ("report.js", REPORT_JS.substitute(figures=json.dumps(figures, ensure_ascii=False))),
+        ("report.css", REPORT_CSS),
+    ]
+
+
+# --- 1人分のレポート ---
+
+def report_filename(participant):
+    # 参加者IDのうちファイル名に使えない文字は _ にする。置き換えた場合は元のIDのハッシュを付け、
+    # 別の参加者 (a/b と a_b、同じ長さの日本語のIDなど) が同じファイル名で上書きし合わないようにする
+    participant = str(participant)
+    name = re.sub(r"[^0-9A-Za-z_.-]", "_", participant)
+    if name != participant:
+        name += "-" + hashlib.sha256(participant.encode("utf-8")).hexdigest()[:12]
+    return "nnbi_" + name + ".html"
+
+
+def _number(value):
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+def _present(value):
+    return value is not None and pd.notna(value)
+
+
+def _weight(value, sign):
+    return f"{sign * value:+.0%}" if _present(value) else "-"
+
+
+def render_report(row, id_column="respondent_id"):
+    """採点結果の1行 (列名 -> 値) から HTML レポートを作る"""
+    nutrients = {key: row[column] for key, (column, _) in NUTRIENT_COLUMNS.items()}
+    # 理由列のない結果と結合した行では NaN になる
+    mask = row.get("reasons")
+    reasons = decode_reasons(int(mask), nutrients) if _present(mask) else None
+    breakdown = "\n".join(
+        f"<tr><td>{label}</td><td>{_weight(row.get(key), sign)}</td><td>{row[subscore]}</td>"
+        f"<td>{'<br>'.join(html.escape(r) for r in reasons[subscore]) if reasons is not None else '-'}</td></tr>"
+        for subscore, label, key, sign in SUBSCORE_ROWS
+    )
+    version = row.get("weights_version")
+    pfc = [nutrients["protein"], nutrients["fat"], nutrients["carbs"]]
+    has_pfc = sum(pfc) > 0  # draw_pfc_balance と同じく、すべて 0 なら図を出さない
+    constitution = str(row["constitution"])
+    values = {"score": int(row["score"]), "pfc": [float(v) for v in pfc] if has_pfc else None}
+    return REPORT_TEMPLATE.substitute(
+        assets=ASSETS_DIR,
+        participant=html.escape(str(row[id_column])),
+        version=html.escape(str(version) if _present(version) else UNKNOWN_VERSION),
+        constitution=html.escape(constitution),
+        constitution_desc=html.escape(CONSTITUTION_DESCS.get(constitution, "")),
+        breakdown=breakdown,
+        pfc='<div id="pfc" class="chart"></div>' if has_pfc else "<p>栄養素の記録がありません。</p>",
+        nutrients="\n".join(
+            f"<tr><th>{html.escape(column)}</th><td>{_number(nutrients[key])}</td></tr>"
+            for key, (column, _) in NUTRIENT_COLUMNS.items()
+        ),
+        values=json.dumps(values),
+    )
+
+
+def render_chunk(chunk, id_column="respondent_id", output_dir=None):
+    """
+    チャンク (採点結果の DataFrame) 分のレポートを作る (ワーカープロセスで実行)
+    output_dir を指定するとそこへ書き出して件数を、省略すると (ファイル名, HTML のバイト列) のリストを返す
+    """
+    reports = [
+        (report_filename(row[id_column]), render_report(row, id_column).encode("utf-8"))
+        for row in chunk.to_dict("records")
+    ]
+    if output_dir is None:
+        return reports
+    for name, body in reports:
+        with open(os.path.join(output_dir, name), "wb") as f:
+            f.write(body)
+    return len(reports)
+
+
+# --- 書き出し先 ---
+
+class _DirectoryOutput:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, ASSETS_DIR), exist_ok=True)
+
+    def write_assets(self, assets):
+        for name, content in assets:
+            with open(os.path.join(self.path, ASSETS_DIR, name), "w", encoding="utf-8") as f:
+                f.write(content)
+
+    def collect(self, result):
+        return result  # ワーカーが書き出し済み
+
+
+class _ZipOutput:
+    def __init__(self, path, compress=False):
+        self.path = path
+        self._zip = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED,
+                                    compresslevel=1 if compress else None)
+
+    def write_assets(self, assets):
+        # 共有ファイル (plotly.min.js など) は1回だけなので常に圧縮する
+        for name, content in assets:
+            self._zip.writestr(f"{ASSETS_DIR}/{name}", content, compress_type=zipfile.ZIP_DEFLATED, compresslevel=6)
+
+    def collect(self, reports):
+        for name, body in reports:
+            self._zip.writestr(name, body)
+        return len(reports)
+
+    def close(self):
+        self._zip.close()
+
+
+def export(results_path, output_path, id_column="respondent_id", workers=None,
+           chunksize=DEFAULT_CHUNKSIZE, compress=False):
+    """
+    採点結果のファイルからレポートを書き出し、件数を返す
+    output_path が .zip ならその zip に、それ以外はディレクトリに書き出す
+    compress: zip のレポートを圧縮する (親プロセスで圧縮するため、ワーカー数を増やしても速くならない)
+    """
+    to_zip = output_path.lower().endswith(".zip")
+    output = _ZipOutput(output_path, compress) if to_zip else _DirectoryOutput(output_path)
+    workers = workers or os.cpu_count() or 1
+    count = 0
+    try:
+        output.write_assets(shared_assets())
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # 読み込み済みのチャンクが溜まりすぎないよう、実行中のタスク数を抑える
+            pending = deque()
+            for chunk in read_chunks(results_path, chunksize):
+                if chunk.empty:
+                    continue
+                pending.append(pool.submit(render_chunk, chunk, id_column, None if to_zip else output_path))
+                if len(pending) >= workers * 2:
+                    count += output.collect(pending.popleft().result())
+            while pending:
+                count += output.collect(pending.popleft().result())
+    finally:
+        if to_zip:
+            output.close()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="参加者ごとの NNBI レポート (HTML) の一括書き出し")
+    parser.add_argument("results", help="batch_cli.py の採点結果 (CSV / Parquet、--reasons 付きなら理由も載せる)")
+    parser.add_argument("-o", "--output", required=True, help="出力先ディレクトリ、または .zip")
+    parser.add_argument("--id-column", default="respondent_id", help="参加者ID列名")
+    parser.add_argument("--workers", type=int, default=None, help="ワーカープロセス数 (既定は CPU 数)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="1タスクのレポート数")
+    parser.add_argument("--compress", action="store_true", help="zip のレポートを圧縮する (サイズは約半分、速度は親プロセス律速)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    count = export(args.results, args.output, id_column=args.id_column, workers=args.workers,
+                   chunksize=args.chunksize, compress=args.compress)
+    elapsed = time.perf_counter() - start
+    print(f"{count} 件のレポートを書き出しました ({elapsed:.1f} 秒)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# --- 採点結果の集計キューブ (運用ダッシュボード用) ---
+# 採点結果を回答者単位で保存し直さず、スコア・サブスコアのヒストグラムと体質タイプの件数だけを
+# (設問, 選択肢, ストレス段階, アレルギー) ごとに数え上げて持つ。結果が届くたびに件数を足し込むため、
+# ダッシュボードは何十万件分の結果でも再採点や全件走査をせず、配列の部分和だけで表示できる。
+#
+# 絞り込みは ストレス段階・アレルギー (1つ)・設問の回答 (1問) の組み合わせに対応する。
+# どの設問の選択肢で合計しても全回答者になるので、回答で絞らない集計は先頭の設問の和で求める。
+# 保存先は NNBI_CUBES_PATH (既定: NNBI_DATA_DIR の score_cubes.npz)。
+
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from batch_scoring import _allergy_matrix, encode_answers
+from meal_diary import DEFAULT_DATA_DIR
+from scoring import ALLERGY_OPTIONS, CONSTITUTIONS, HABIT_OPTIONS, STRESS_LEVELS, WEIGHTS_VERSION
+
+MEASURES = ["score", "diet", "bio", "dop", "risk"]
+BINS = 101  # 0..100 点を1点刻み
+QUESTIONS = list(HABIT_OPTIONS)
+CONSTITUTION_TYPES = [c["type"] for c in CONSTITUTIONS]
+UNANSWERED = "未回答"
+NO_ALLERGY = "なし"
+# アレルギー軸: 0 = 全員、1.. = 各アレルギーあり、末尾 = アレルギーなし
+ALLERGY_AXIS = [None, *ALLERGY_OPTIONS, NO_ALLERGY]
+
+_OPTIONS = max(len(options) for options in HABIT_OPTIONS.values()) + 1  # 末尾 = 未回答
+_STRESS = len(STRESS_LEVELS) + 1  # 末尾 = 未回答
+_SHAPE = (len(QUESTIONS), _OPTIONS, _STRESS, len(ALLERGY_AXIS))
+
+
+def default_path():
+    data_dir = os.environ.get("NNBI_DATA_DIR", DEFAULT_DATA_DIR)
+    return os.environ.get("NNBI_CUBES_PATH") or os.path.join(data_dir, "score_cubes.npz")
+
+
+def _schema():
+    # 設問・選択肢やNNBI式の係数の版が変わったら古い集計は読み込まない (スコアの分布が混ざるため)
+    return json.dumps([HABIT_OPTIONS, STRESS_LEVELS, ALLERGY_OPTIONS, CONSTITUTION_TYPES, MEASURES, WEIGHTS_VERSION],
+                      ensure_ascii=False)
+
+
+def _allergy_flags(df):
+    """
+    (行数, ALLERGY_AXIS) の bool 配列。リスト・"グルテン;卵" 形式の文字列・bool (グルテンのみ) に対応
+    照合は一括採点のアレルギー判定と同じ (区切り文字で分けた値と選択肢の完全一致)
+    """
+    flags = np.zeros((len(df), len(ALLERGY_AXIS)), dtype=bool)
+    flags[:, 0] = True
+    if "allergies" in df.columns:
+        flags[:, 1:-1] = _allergy_matrix(df["allergies"])
+    flags[:, -1] = ~flags[:, 1:-1].any(axis=1)
+    return flags
+
+
+class ScoreCubes:
+    """
+    採点結果の件数キューブ
+    histograms:    (設問, 選択肢, ストレス, アレルギー, MEASURES, 点数) の件数
+    constitutions: (設問, 選択肢, ストレス, アレルギー, 体質タイプ) の件数
+    """
+
+    def __init__(self, histograms=None, constitutions=None, updated_at=None):
+        self.histograms = np.zeros((*_SHAPE, len(MEASURES), BINS), dtype=np.int64) if histograms is None else histograms
+        self.constitutions = (
+            np.zeros((*_SHAPE, len(CONSTITUTION_TYPES)), dtype=np.int64) if constitutions is None else constitutions
+        )
+        self.updated_at = updated_at
+
+    @property
+    def total(self):
+        # アレルギー軸の先頭 (全員) だけを数える
+        return int(self.histograms[0, :, :, 0, 0].sum())
+
+    def add(self, answers, results):
+        """
+        採点結果を足し込む
+        answers: 20問の回答列と stress_level / allergies 列 (batch_cli の入力と同じ形)
+        results: answers と同じ index・行順の diet / bio / dop / risk / score / constitution 列
+        """
+        n = len(answers)
+        if n == 0:
+            return
+        codes = encode_answers(answers)
+        if "stress_level" in answers.columns:
+            stress = pd.Categorical(answers["stress_level"], categories=STRESS_LEVELS).codes.astype(np.int64)
+        else:
+            stress = np.full(n, -1, dtype=np.int64)
+        stress[stress < 0] = _STRESS - 1
+        points = np.clip(results[MEASURES].to_numpy(dtype=np.int64), 0, BINS - 1)
+        constitution = pd.Categorical(results["constitution"], categories=CONSTITUTION_TYPES).codes.astype(np.int64)
+
+        # 1人が複数のアレルギー区分に入るため、(行, アレルギー区分) の組に展開してから数える
+        rows, allergy = np.nonzero(_allergy_flags(answers))
+        stress, points, constitution = stress[rows], points[rows], constitution[rows]
+        typed = constitution >= 0
+        measure = np.arange(len(MEASURES)) * BINS
+
+        hist = self.histograms.reshape(len(QUESTIONS), -1)
+        const = self.constitutions.reshape(len(QUESTIONS), -1)
+        for q, question in enumerate(QUESTIONS):
+            option = codes[question].astype(np.int64)[rows]
+            option[option < 0] = _OPTIONS - 1
+            cell = (option * _STRESS + stress) * len(ALLERGY_AXIS) + allergy
+            flat = (cell[:, None] * (len(MEASURES) * BINS) + measure + points).ravel()
+            hist[q] += np.bincount(flat, minlength=hist.shape[1])
+            flat = cell[typed] * len(CONSTITUTION_TYPES) + constitution[typed]
+            const[q] += np.bincount(flat, minlength=const.shape[1])
+        self.updated_at = time.time()
+
+    def merge(self, other):
+        self.histograms += other.histograms
+        self.constitutions += other.constitutions
+        self.updated_at = max(filter(None, (self.updated_at, other.updated_at)), default=None)
+
+    def slice(self, stress=None, allergy=None, question=None, answer=None):
+        """
+        絞り込んだ集計を返す (いずれも None なら絞らない)
+        stress: STRESS_LEVELS の値か UNANSWERED / allergy: ALLERGY_OPTIONS の値か NO_ALLERGY
+        question, answer: 設問と選択肢 (UNANSWERED も可)。answer を省くと設問の選択肢ごとの内訳を付ける
+        """
+        q = QUESTIONS.index(question) if question is not None else 0
+        a = ALLERGY_AXIS.index(allergy) if allergy is not None else 0
+        hist = self.histograms[q, :, :, a]
+        const = self.constitutions[q, :, :, a]
+        if stress is not None:
+            s = _STRESS - 1 if stress == UNANSWERED else STRESS_LEVELS.index(stress)
+            hist, const = hist[:, s], const[:, s]
+        else:
+            hist, const = hist.sum(axis=1), const.sum(axis=1)
+        # hist: (選択肢, MEASURES, 点数), const: (選択肢, 体質タイプ)
+        by_answer = None
+        if question is not None and answer is None:
+            by_answer = {
+                option: _summary(hist[i, 0])
+                for i, option in _option_items(question)
+            }
+        if question is not None and answer is not None:
+            i = _OPTIONS - 1 if answer == UNANSWERED else HABIT_OPTIONS[question].index(answer)
+            hist, const = hist[i], const[i]
+        else:
+            hist, const = hist.sum(axis=0), const.sum(axis=0)
+        return CubeSlice(dict(zip(MEASURES, hist)), dict(zip(CONSTITUTION_TYPES, const.tolist())), by_answer)
+
+    def save(self, path=None):
+        """npz に保存する (書き込み中のファイルを読まれないよう、一時ファイルから置き換える)"""
+        path = path or default_path()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, histograms=self.histograms, constitutions=self.constitutions,
+                 updated_at=np.float64(self.updated_at or 0), schema=np.array(_schema()))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=None, missing_ok=False):
+        """保存した集計を読み込む。missing_ok=True ならファイルがない場合に空の集計を返す"""
+        path = path or default_path()
+        if missing_ok and not os.path.exists(path):
+            return cls()
+        with np.load(path) as data:
+            if str(data["schema"]) != _schema():
+                raise ValueError(f"{path}: 設問・選択肢または係数の版が変わっています。集計を作り直してください")
+            return cls(data["histograms"], data["constitutions"], float(data["updated_at"]) or None)
+
+
+def _option_items(question):
+    return [*enumerate(HABIT_OPTIONS[question]), (_OPTIONS - 1, UNANSWERED)]
+
+
+def _summary(histogram):
+    """ヒストグラムから (件数, 平均, 中央値)"""
+    n = int(histogram.sum())
+    if n == 0:
+        return n, None, None
+    mean = float(histogram @ np.arange(BINS)) / n
+    median = int(np.searchsorted(np.cumsum(histogram), (n + 1) / 2))
+    return n, mean, median
+
+
+class CubeSlice:
+    """
+    絞り込んだ集計
+    histograms: MEASURES -> 0..100 点の件数配列 / constitutions: 体質タイプ -> 件数
+    by_answer: 設問だけを指定した場合の 選択肢 -> (件数, 平均スコア, 中央値)
+    """
+
+    __slots__ = ("histograms", "constitutions", "by_answer")
+
+    def __init__(self, histograms, constitutions, by_answer=None):
+        self.histograms = histograms
+        self.constitutions = constitutions
+        self.by_answer = by_answer
+
+    @property
+    def count(self):
+        return int(self.histograms["score"].sum())
+
+    def summary(self, measure="score"):
+        return _summary(self.histograms[measure])
+
+    def binned(self, measure, width=5):
+        """width 点刻みにまとめた 階級の下限 -> 件数 (Series)"""
+        edges = np.arange(0, BINS, width)
+        return pd.Series(np.add.reduceat(self.histograms[measure], edges), index=edges, name=measure)
@@ -0,0 +1,373 @@
+# --- NNBIスコア算出ロジック (Streamlit非依存) ---
+# app.py から切り出した純粋関数群。バッチ処理やCLIからも同じルールで採点できるようにする。
+
+import hashlib
+import json
+import os
+
+# --- 設問定義 (選択肢の順序は画面表示順) ---
+
+HABIT_OPTIONS = {
+    # 問1-10
+    "gluten": ["週1回未満", "週1-2回", "週3-5回", "ほぼ毎日"],
+    "protein": ["毎食摂取", "1日2食", "1日1食", "それ以下"],
+    "fiber": ["1日3皿分以上", "1日2皿分", "1日1皿分", "それ以下"],
+    "carbs": ["適量(茶碗1杯/食)", "やや多い(時々大盛り)", "多い(毎日大盛り)", "過剰(菓子パン等含む)"],
+    "fish": ["週3回以上", "週1-2回", "月1-3回", "ほとんど食べない"],
+    "chicken": ["週3回以上", "週1-2回", "月1-3回", "ほとんど食べない"],
+    "fastfood": ["月1回未満", "月2-3回", "週1-2回", "週3回以上"],
+    "processed_meat": ["週1回未満", "週1-2回", "週3-5回", "ほぼ毎日"],
+    "fermented": ["ほぼ毎日", "週3-4回", "週1-2回", "それ以下"],
+    "bluefish": ["週2回以上", "週1回", "月1-3回", "ほとんど食べない"],
+    # 問11-20
+    "water": ["1.5L以上", "1.0L-1.5L", "1.0L未満", "あまり飲まない"],
+    "caffeine": ["飲まない", "1日1-2杯", "1日3-4杯", "1日5杯以上"],
+    "alcohol": ["飲まない", "週1-2回", "週3-5回", "ほぼ毎日"],
+    "eat_speed": ["ゆっくり(20分以上)", "普通(10-20分)", "早い(10分未満)", "極めて早い"],
+    "breakfast": ["毎日食べる", "週3-4回", "週1-2回", "食べない"],
+    "late_night": ["寝る3時間前まで", "寝る2時間前", "寝る1時間前", "寝る直前が多い"],
+    "veg_variety": ["5種類以上", "3-4種類", "1-2種類", "ほぼ食べない"],
+    "dairy": ["適度(1日1杯/個)", "飲まない/食べない", "やや多い", "過剰に摂る"],
+    "snack": ["ほとんど食べない", "週1-2回", "週3-4回", "毎日甘いもの"],
+    "oil": ["オリーブ/アマニ油中心", "サラダ油/キャノーラ油", "動物性油脂", "揚げ物が多い"],
+}
+
+# 設問の表示名 (改善シミュレーションなど、設問を名前で示す画面用)
+HABIT_LABELS = {
+    "gluten": "グルテン(小麦)", "protein": "タンパク質摂取", "fiber": "食物繊維(野菜)",
+    "carbs": "糖質(ご飯・パン等)", "fish": "魚全般", "chicken": "鶏肉", "fastfood": "ファストフード",
+    "processed_meat": "加工肉(ハム等)", "fermented": "発酵食品(納豆・キムチ)", "bluefish": "青魚(Omega-3)",
+    "water": "1日の水分摂取量(水・茶)", "caffeine": "カフェイン(コーヒー等)", "alcohol": "アルコール頻度",
+    "eat_speed": "食べる速さ", "breakfast": "朝食の習慣", "late_night": "就寝前の食事",
+    "veg_variety": "1日の野菜の種類", "dairy": "乳製品(牛乳・チーズ)", "snack": "甘いおやつ・間食",
+    "oil": "油の質(主に使用するもの)",
+}
+
+STRESS_LEVELS = ["Low", "Medium", "High"]
+ALLERGY_OPTIONS = ["グルテン", "カゼイン", "卵", "乳製品", "そば", "落花生", "えび", "かに"]
+SUPPLEMENT_OPTIONS = ["ビタミンD", "亜鉛", "ケルセチン", "乳酸菌"]
+
+# --- 栄養素定義 (nutrients辞書のキー -> 食材表の列名, 丸め桁数) ---
+# 丸め桁数 None は int() による切り捨て
+
+NUTRIENT_COLUMNS = {
+    "calories": ("カロリー(kcal)", None),
+    "protein": ("タンパク質(g)", 1),
+    "fat": ("脂質(g)", 1),
+    "carbs": ("炭水化物(g)", 1),
+    "fiber_sol": ("水溶性食物繊維(g)", 1),
+    "fiber_insol": ("不溶性食物繊維(g)", 1),
+    "vit_b1": ("ビタミンB1(mg)", 2),
+    "vit_c": ("ビタミンC(mg)", 1),
+    "vit_d": ("ビタミンD(μg)", 1),
+    "iron": ("鉄分(mg)", 1),
+    "zinc": ("亜鉛(mg)", 1),
+    "magnesium": ("マグネシウム(mg)", 1),
+}
+
+# --- 習慣による加点表 (サブスコア -> 設問 -> 回答 -> 点数) ---
+# スカラー版・バッチ版の両方がこの表を参照する
+
+HABIT_POINTS = {
+    # X_diet 習慣 (計60点)
+    "diet": {
+        "fish": {"週3回以上": 10, "週1-2回": 10},
+        "chicken": {"週3回以上": 10, "週1-2回": 10},
+        "veg_variety": {"5種類以上": 15, "3-4種類": 5},
+        "oil": {"オリーブ/アマニ油中心": 10},
+        "water": {"1.5L以上": 5},
+        "breakfast": {"毎日食べる": 10},
+    },
+    # X_bio 習慣 (計50点)
+    "bio": {
+        "fiber": {"1日3皿分以上": 25, "1日2皿分": 15},
+        "fermented": {"ほぼ毎日": 25, "週3-4回": 15},
+    },
+    # X_dop 習慣 (計40点)
+    "dop": {
+        "protein": {"毎食摂取": 20},
+        "bluefish": {"週2回以上": 20, "週1回": 20},
+    },
+    # X_risk 習慣・摂取頻度 (高いほどリスク大)
+    "risk": {
+        "gluten": {"ほぼ毎日": 10, "週3-5回": 10},
+        "fastfood": {"週3回以上": 15},
+        "processed_meat": {"ほぼ毎日": 10, "週3-5回": 10},
+        "carbs": {"過剰(菓子パン等含む)": 15},
+        "snack": {"毎日甘いもの": 10},
+        "alcohol": {"ほぼ毎日": 10},
+        "late_night": {"寝る直前が多い": 10},
+    },
+}
+
+# --- NNBI式の係数 ---
+# 係数は重みファイル (calibrate.py が出力するJSON) から起動時に読み込む。
+# 既定は data/nnbi_weights.json。NNBI_WEIGHTS で別のファイル (校正済みの版など) を指定できる。
+
+WEIGHTS_FORMAT = 1
+WEIGHT_KEYS = ("alpha", "w_diet", "w_bio", "w_dop", "w_risk")
+DEFAULT_WEIGHTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "nnbi_weights.json")
+
+
+def load_weights(path=None):
+    """重みファイルを読み込む。version と WEIGHT_KEYS の係数を含む辞書を返す"""
+    path = path or os.environ.get("NNBI_WEIGHTS") or DEFAULT_WEIGHTS_PATH
+    with open(path, encoding="utf-8") as f:
+        weights = json.load(f)
+    if weights.get("format") != WEIGHTS_FORMAT:
+        raise ValueError(f"{path}: 対応していない重みファイルの形式です (format={weights.get('format')})")
+    missing = [key for key in ("version", *WEIGHT_KEYS) if key not in weights]
+    if missing:
+        raise ValueError(f"{path}: 重みファイルに {', '.join(missing)} がありません")
+    return weights
+
+
+WEIGHTS = load_weights()
+WEIGHTS_VERSION = WEIGHTS["version"]
+W_DIET = WEIGHTS["w_diet"]
+W_BIO = WEIGHTS["w_bio"]
+W_DOP = WEIGHTS["w_dop"]
+W_RISK = WEIGHTS["w_risk"]
+ALPHA = WEIGHTS["alpha"]  # ベースライン切片
+
+
+def habit_points(subscore, habit_answers):
+    """加点表に基づく習慣部分の合計点"""
+    return sum(
+        points.get(habit_answers.get(question), 0)
+        for question, points in HABIT_POINTS[subscore].items()
+    )
+
+
+def nutrients_from_totals(total):
+    """栄養素列ごとの合計 (列名 -> 値) を、表示・採点用に丸めた nutrients 辞書に変換する"""
+    nutrients = {}
+    for key, (column, digits) in NUTRIENT_COLUMNS.items():
+        if digits is None:
+            nutrients[key] = int(total.get(column, 0))
+        else:
+            nutrients[key] = round(total.get(column, 0), digits)
+    return nutrients
+
+
+def calculate_total_nutrients(df_ingredients):
+    if df_ingredients is None or df_ingredients.empty:
+        return {}
+
+    # 型を揃えた食材表にしてから集計する (数値にできない値は 0 として扱う)
+    from ingredients import IngredientTable
+    return IngredientTable.from_frame(df_ingredients).nutrients()
+
+
+# --- サブスコア算出 ---
+# 各サブスコアは「回答・プロフィールだけで決まる習慣部分」と「食事の栄養素で決まる部分」に分かれる。
+# 習慣部分は habit_partial でまとめて求めてキャッシュし、食事が変わっても使い回す。
+# SUBSCORE_INPUTS は各サブスコアが参照する栄養素で、食材編集時にどのサブスコアを再計算すべきかの判定に使う。
+
+SUBSCORE_INPUTS = {
+    "diet": ("protein", "fat", "carbs", "vit_c"),
+    "bio": ("fiber_sol", "fiber_insol", "magnesium"),
+    "dop": ("protein", "iron", "zinc", "vit_b1", "vit_d"),
+    "risk": (),
+}
+
+
+def _freeze(value):
+    # 回答・プロフィールを順序に依存しない比較可能な形にする (リストは集合として扱う)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(v)) for key, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted(str(v) for v in value))
+    return value
+
+
+def profile_key(habit_answers, user_profile):
+    """回答とプロフィールから決まる安定したキー (プロセスやセッションをまたいで同じ値になる)"""
+    payload = json.dumps([_freeze(habit_answers), _freeze(user_profile)], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def risk_habit_part(habit_answers, user_profile):
+    # ==========================================
+    # 4. X_risk: 炎症・阻害リスク因子 (Max 100) ※食事内容に依存しない
+    # ==========================================
+    reasons = []
+    xr_score = habit_points("risk", habit_answers)
+
+    # プロフィール要因
+    if user_profile.get("stress_level") == "High":
+        xr_score += 20
+        reasons.append("・高ストレスによるコルチゾール負荷")
+
+    # アレルギー不整合
+    if "グルテン" in user_profile.get("allergies", []) and habit_answers.get("gluten") != "週1回未満":
+        xr_score += 20
+        reasons.append("・アレルギー物質の摂取リスク")
+
+    return xr_score, reasons
+
+
+def habit_partial(habit_answers, user_profile):
+    """
+    回答・プロフィールだけで決まる部分
+    key: profile_key / subscores: サブスコア名 -> (習慣点, 理由) / constitution: 体質タイプ
+    """
+    subscores = {name: (habit_points(name, habit_answers), []) for name in ("diet", "bio", "dop")}
+    subscores["risk"] = risk_habit_part(habit_answers, user_profile)
+    return {
+        "key": profile_key(habit_answers, user_profile),
+        "subscores": subscores,
+        "constitution": predict_constitution(habit_answers),
+    }
+
+
+def diet_meal_part(habit_score, reasons, nutrients):
+    # ==========================================
+    # 1. X_diet: ポジティブな食事パターン (Max 100)
+    # ==========================================
+    xd_score = habit_score
+
+    # 食事内容 (計40点)
+    # PFCバランスが極端でないか
+    p, f, c = nutrients['protein'], nutrients['fat'], nutrients['carbs']
+    total_g = p + f + c
+    if total_g > 0:
+        p_ratio = p / total_g
+        if 0.15 <= p_ratio <= 0.35: # タンパク質比率が適正
+            xd_score += 20
+            reasons.append("・PFCバランスが良好")
+
+    # ビタミンC (抗酸化)
+    if nutrients['vit_c'] > 30:
+        xd_score += 20
+        reasons.append("・十分なビタミンC (抗酸化作用)")
+
+    xd_score = min(100, xd_score)
+    if xd_score >= 80: reasons.append("・地中海式に近い良質な食習慣")
+    return xd_score, reasons
+
+
+def bio_meal_part(habit_score, reasons, nutrients):
+    # ==========================================
+    # 2. X_bio: 腸内環境・Coprococcus係数 (Max 100)
+    # ==========================================
+    xb_score = habit_score
+
+    # 食事内容 (計50点)
+    total_fiber = nutrients['fiber_sol'] + nutrients['fiber_insol']
+    if total_fiber >= 5.0:
+        xb_score += 30
+        reasons.append(f"・1食で十分な食物繊維 ({total_fiber}g)")
+    elif total_fiber >= 2.0:
+        xb_score += 10
+
+    if nutrients['magnesium'] >= 30: # Mgは腸の蠕動運動に寄与
+        xb_score += 20
+        reasons.append("・マグネシウムによる代謝補助")
+
+    return min(100, xb_score), reasons
+
+
+def dop_meal_part(habit_score, reasons, nutrients):
+    # ==========================================
+    # 3. X_dop: ドーパミン・神経伝達物質合成能 (Max 100)
+    # ==========================================
+    xdo_score = habit_score
+
+    # 食事内容 (計60点: NT-Index簡易版)
+    # ドーパミン合成には アミノ酸(タンパク質) + 鉄 + 葉酸/B群 + 亜鉛 が必須
+    mat_score = 0
+    if nutrients['protein'] >= 20: mat_score += 20
+    elif nutrients['protein'] >= 10: mat_score += 10
+
+    if nutrients['iron'] >= 2.0: mat_score += 10
+    if nutrients['zinc'] >= 3.0: mat_score += 10
+    if nutrients['vit_b1'] >= 0.1: mat_score += 10
+    if nutrients['vit_d'] >= 5.0: mat_score += 10 # セロトニン/ドーパミン調整
+
+    xdo_score += mat_score
+    if mat_score >= 40:
+        reasons.append("・神経伝達物質の原料が豊富")
+
+    return min(100, xdo_score), reasons
+
+
+def risk_meal_part(habit_score, reasons, nutrients):
+    return min(100, habit_score), reasons
+
+
+MEAL_PARTS = {
+    "diet": diet_meal_part,  # X_diet: 良質な食事パターン
+    "bio": bio_meal_part,    # X_bio: 腸内環境・微生物
+    "dop": dop_meal_part,    # X_dop: ドーパミン合成能
+    "risk": risk_meal_part,  # X_risk: 炎症・リスク因子
+}
+
+
+def score_subscore(partial, name, nutrients):
+    """習慣部分 (habit_partial の結果) に食事部分を足して1つのサブスコアを (score, reasons) で返す"""
+    habit_score, reasons = partial["subscores"][name]
+    return MEAL_PARTS[name](habit_score, list(reasons), nutrients)
+
+
+def score_with_partial(partial, nutrients):
+    """習慣部分を再計算せずに1食分を採点する。(final_score, breakdown) を返す"""
+    breakdown = {}
+    for name in MEAL_PARTS:
+        score, reasons = score_subscore(partial, name, nutrients)
+        breakdown[name] = {"score": score, "reasons": reasons}
+    return nnbi_score(breakdown), breakdown
+
+
+def nnbi_score(breakdown):
+    # ==========================================
+    # Final Calculation (NNBI Formula)
+    # M = α + w_diet(Diet) + w_bio(Bio) + w_dop(Dop) - w_risk(Risk)
+    # 既定の係数は α=20, 0.35 / 0.25 / 0.20 / 0.20 (重みファイルで差し替え可能)
+    # ==========================================
+    calculation = (ALPHA + (breakdown["diet"]["score"] * W_DIET) + (breakdown["bio"]["score"] * W_BIO)
+                   + (breakdown["dop"]["score"] * W_DOP) - (breakdown["risk"]["score"] * W_RISK))
+    return int(max(0, min(100, calculation))) # 0-100にクリップ
+
+
+def calculate_comprehensive_score(habit_answers, user_profile, nutrients, constitution_type):
+    """
+    NNBI理論モデルに基づくスコア算出
+    Formula: Score = α + (w_diet * X_diet) + (w_bio * X_bio) + (w_dop * X_dop) - (w_risk * X_risk)
+    ※ 既定の係数 (α=20, 0.35 / 0.25 / 0.20 / 0.20) は満点が100になるよう設計
+    """
+    return score_with_partial(habit_partial(habit_answers, user_profile), nutrients)
+
+
+# --- 体質タイプ定義 (判定順) ---
+
+CONSTITUTIONS = [
+    {"type": "糖質依存・血糖値スパイク型", "desc": "血糖値の乱高下により、気分の波が不安定になりやすい体質"},
+    {"type": "慢性炎症・内臓疲労型", "desc": "腸内環境が乱れやすく、慢性的な疲労感を感じやすい体質"},
+    {"type": "タンパク質不足・エネルギー欠乏型", "desc": "意欲低下や集中力不足に陥りやすい体質"},
+    {"type": "バランス維持型", "desc": "比較的良好なバランスですが、油断は禁物な体質"},
+]
+
+# 体質判定に使う回答 (設問 -> 該当する選択肢)
+CONSTITUTION_RULES = {
+    "heavy_carbs": ("carbs", ["多い(毎日大盛り)", "過剰(菓子パン等含む)"]),
+    "heavy_gluten": ("gluten", ["週3-5回", "ほぼ毎日"]),
+    "heavy_fastfood": ("fastfood", ["週3回以上"]),
+    "heavy_procmeat": ("processed_meat", ["週3-5回", "ほぼ毎日"]),
+    "low_protein": ("protein", ["1日1食", "それ以下"]),
+    "low_fish": ("fish", ["月1-3回", "ほとんど食べない"]),
+}
+
+
+def predict_constitution(answers):
+    # 体質予測ロジック（そのまま維持）
+    flags = {name: answers.get(q) in options for name, (q, options) in CONSTITUTION_RULES.items()}
+
+    if flags["heavy_carbs"] or flags["heavy_gluten"]:
+        return dict(CONSTITUTIONS[0])
+    elif flags["heavy_fastfood"] or flags["heavy_procmeat"]:
+        return dict(CONSTITUTIONS[1])
+    elif flags["low_protein"] or flags["low_fish"]:
+        return dict(CONSTITUTIONS[2])
+    else:
+        return dict(CONSTITUTIONS[3])
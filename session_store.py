@@ -0,0 +1,252 @@
+# --- セッションごとのデータ保持 ---
+# 回答・プロフィール・食材表・画像は st.session_state ではなくプロセス共有の SessionStore に置く。
+# - 画像の送信用 JPEG は一時ディレクトリへ退避し、メモリにはファイルの場所とサムネイルだけを持つ
+# - 回答は設問ごとに1バイト、食材表は IngredientTable (float32 の配列) で保持する
+# - 一定時間 (NNBI_SESSION_IDLE_TIMEOUT 秒) アクセスのないセッションは退避ファイルごと破棄し、
+#   そのセッションが始めた解析ジョブも取り消す (タブを閉じた後に API を呼び続けないため)
+# 標準ライブラリのみに依存する (入力画面の表示で pandas・numpy を読み込まないため)。
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+
+from scoring import ALLERGY_OPTIONS, HABIT_OPTIONS, STRESS_LEVELS, SUPPLEMENT_OPTIONS
+
+IDLE_TIMEOUT = float(os.environ.get("NNBI_SESSION_IDLE_TIMEOUT", 30 * 60))  # 30分
+SWEEP_INTERVAL = 60  # 破棄対象の確認間隔 (秒)
+
+_UNANSWERED = 0xFF
+
+
+def pack_answers(habit_answers):
+    """回答を設問ごとに1バイト (選択肢の番号, 未回答は 0xFF) に詰める"""
+    codes = bytearray(len(HABIT_OPTIONS))
+    for i, (question, options) in enumerate(HABIT_OPTIONS.items()):
+        answer = habit_answers.get(question)
+        codes[i] = options.index(answer) if answer in options else _UNANSWERED
+    return bytes(codes)
+
+
+def unpack_answers(codes):
+    if not codes:
+        return {}
+    return {
+        question: options[code]
+        for code, (question, options) in zip(codes, HABIT_OPTIONS.items()) if code != _UNANSWERED
+    }
+
+
+def _bits(selected, options):
+    return sum(1 << i for i, option in enumerate(options) if option in selected)
+
+
+def _from_bits(bits, options):
+    return [option for i, option in enumerate(options) if bits >> i & 1]
+
+
+def pack_profile(user_profile):
+    """プロフィールを (ストレス段階, アレルギーのビット列, サプリのビット列, 既往歴) に詰める"""
+    if not user_profile:
+        return None
+    stress = user_profile.get("stress_level")
+    return (
+        STRESS_LEVELS.index(stress) if stress in STRESS_LEVELS else -1,
+        _bits(user_profile.get("allergies", []), ALLERGY_OPTIONS),
+        _bits(user_profile.get("supplements", []), SUPPLEMENT_OPTIONS),
+        user_profile.get("medical_history") or "",
+    )
+
+
+def unpack_profile(packed):
+    if packed is None:
+        return {}
+    stress, allergies, supplements, medical_history = packed
+    return {
+        "stress_level": STRESS_LEVELS[stress] if stress >= 0 else None,
+        "allergies": _from_bits(allergies, ALLERGY_OPTIONS),
+        "medical_history": medical_history,
+        "supplements": _from_bits(supplements, SUPPLEMENT_OPTIONS),
+    }
+
+
+@dataclass(frozen=True)
+class SpilledImage:
+    """送信用 JPEG をファイルに退避した画像 (PreparedImage と同じ属性で読める)"""
+    key: str
+    path: str
+    thumbnail_bytes: bytes
+    original_size: int
+    width: int
+    height: int
+
+    @property
+    def upload_bytes(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    @property
+    def nbytes(self):
+        # メモリに常駐する分 (サムネイルのみ)
+        return len(self.thumbnail_bytes)
+
+    @property
+    def spilled_bytes(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+
+class SessionData:
+    """1セッション分のデータ"""
+
+    __slots__ = ("answers", "profile", "image", "ingredients", "jobs", "last_seen")
+
+    def __init__(self):
+        self.answers = b""
+        self.profile = None
+        self.image = None  # SpilledImage
+        self.ingredients = None  # IngredientTable
+        self.jobs = []  # このセッションが始めた未完了の解析ジョブ (AnalysisJob)
+        self.last_seen = time.monotonic()
+
+    def cancel_jobs(self):
+        for job in self.jobs:
+            job.cancel()
+        self.jobs = []
+
+    @property
+    def habit_answers(self):
+        return unpack_answers(self.answers)
+
+    def update_answers(self, answers):
+        self.answers = pack_answers({**self.habit_answers, **answers})
+
+    @property
+    def user_profile(self):
+        return unpack_profile(self.profile)
+
+    @user_profile.setter
+    def user_profile(self, user_profile):
+        self.profile = pack_profile(user_profile)
+
+    @property
+    def nbytes(self):
+        size = sys.getsizeof(self.answers) + (sys.getsizeof(self.profile[3]) if self.profile else 0)
+        if self.image is not None:
+            size += self.image.nbytes
+        if self.ingredients is not None:
+            size += self.ingredients.nbytes
+        return size
+
+
+class SessionStore:
+    """
+    セッションID -> SessionData (スレッドセーフ)
+    spill_dir: 画像の退避先 (プロセスごとに一時ディレクトリを作る。既定は NNBI_SPILL_DIR またはOSの一時領域)
+    idle_timeout: この秒数アクセスのないセッションを破棄する
+    """
+
+    def __init__(self, spill_dir=None, idle_timeout=IDLE_TIMEOUT):
+        base = spill_dir or os.environ.get("NNBI_SPILL_DIR") or None
+        if base:
+            os.makedirs(base, exist_ok=True)
+        self.spill_dir = tempfile.mkdtemp(prefix="nnbi-images-", dir=base)
+        self.idle_timeout = idle_timeout
+        self.evicted = 0
+        self._sessions = {}
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    def session(self, session_id):
+        """セッションのデータ (なければ作る)。アクセス時刻も更新する"""
+        now = time.monotonic()
+        if now - self._last_sweep >= SWEEP_INTERVAL:
+            self.evict_idle(now)
+        with self._lock:
+            data = self._sessions.get(session_id)
+            if data is None:
+                data = self._sessions[session_id] = SessionData()
+            data.last_seen = now
+        return data
+
+    def set_image(self, session_id, image):
+        """
+        PreparedImage の送信用 JPEG をファイルに退避し、セッションの画像として登録する
+        image が None なら画像を外す。戻り値は登録した SpilledImage
+        """
+        data = self.session(session_id)
+        with self._lock:
+            if image is None:
+                data.image = None
+            else:
+                path = os.path.join(self.spill_dir, image.key.split(":")[-1] + ".jpg")
+                if not os.path.exists(path):
+                    with open(path + ".tmp", "wb") as f:
+                        f.write(image.upload_bytes)
+                    os.replace(path + ".tmp", path)
+                data.image = SpilledImage(image.key, path, image.thumbnail_bytes, image.original_size,
+                                          image.width, image.height)
+            self._remove_unreferenced()
+        return data.image
+
+    def track_job(self, session_id, job):
+        """セッションが始めた解析ジョブを登録する (セッションの破棄時に取り消す)"""
+        data = self.session(session_id)
+        with self._lock:
+            data.jobs = [j for j in data.jobs if not j.done]
+            data.jobs.append(job)
+
+    def discard(self, session_id):
+        with self._lock:
+            data = self._sessions.pop(session_id, None)
+            if data is not None:
+                data.cancel_jobs()
+            self._remove_unreferenced()
+
+    def evict_idle(self, now=None):
+        """idle_timeout を超えてアクセスのないセッションを破棄し、破棄した件数を返す"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._last_sweep = now
+            idle = [sid for sid, data in self._sessions.items() if now - data.last_seen > self.idle_timeout]
+            for session_id in idle:
+                self._sessions.pop(session_id).cancel_jobs()
+            self._remove_unreferenced()
+            self.evicted += len(idle)
+        return len(idle)
+
+    def _remove_unreferenced(self):
+        # どのセッションからも参照されていない退避ファイルを消す (ロック内で呼ぶ)
+        in_use = {data.image.path for data in self._sessions.values() if data.image is not None}
+        for name in os.listdir(self.spill_dir):
+            path = os.path.join(self.spill_dir, name)
+            if path not in in_use and name.endswith(".jpg"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def footprint(self):
+        """セッション数、常駐メモリ・退避ファイルの合計バイト数とセッションごとの内訳"""
+        with self._lock:
+            per_session = {sid: data.nbytes for sid, data in self._sessions.items()}
+            images = {data.image.path: data.image for data in self._sessions.values() if data.image is not None}
+        return {
+            "sessions": len(per_session),
+            "resident_bytes": sum(per_session.values()),
+            "spilled_bytes": sum(image.spilled_bytes for image in images.values()),
+            "evicted": self.evicted,
+            "per_session": per_session,
+        }
+
+    def close(self):
+        with self._lock:
+            for data in self._sessions.values():
+                data.cancel_jobs()
+            self._sessions.clear()
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
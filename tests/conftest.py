@@ -0,0 +1,52 @@
+# --- テスト共通: ローカルの LogMeal スタブサーバーとクライアント ---
+
+import socket
+
+import pytest
+
+from fake_logmeal import FakeLogMealServer
+from image_prep import PreparedImage
+from logmeal_cache import LogMealCache, image_key
+from logmeal_client import CircuitBreaker, LogMealClient
+
+
+@pytest.fixture
+def fake_server():
+    server = FakeLogMealServer(seed=0).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def breaker():
+    return CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+
+
+@pytest.fixture
+def client(fake_server, breaker):
+    client = LogMealClient(base_url=fake_server.url, connect_timeout=1.0, read_timeout=2.0,
+                           backoff_factor=0, breaker=breaker)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = LogMealCache(path=str(tmp_path / "logmeal_cache.sqlite3"))
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def closed_port():
+    """接続を受け付けないポート (接続エラー用)"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def image():
+    content = b"meal photo"
+    return PreparedImage(key=image_key(content), upload_bytes=content, thumbnail_bytes=b"",
+                         original_size=len(content), width=1, height=1)
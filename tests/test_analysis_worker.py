@@ -0,0 +1,163 @@
+# --- 解析ワーカー (スタブサーバー相手) ---
+
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+import requests
+
+from analysis_worker import AnalysisJob, AnalysisWorker, WorkerBusyError, call_logmeal_api
+from logmeal_client import NUTRITION_MISSING
+from session_store import SessionStore
+
+
+def make_job(image):
+    job = AnalysisJob(image.key)
+    job.future = Future()
+    return job
+
+
+def test_rows_are_fetched_and_cached(client, cache, fake_server, image):
+    job = make_job(image)
+    rows = call_logmeal_api(job, image, "token", client, cache)
+    assert rows and job.messages == []
+    assert cache.get(image.key) == rows
+    requests_made = fake_server.request_count
+
+    # 2回目はキャッシュから返し、API を呼ばない
+    assert call_logmeal_api(make_job(image), image, "token", client, cache) == rows
+    assert fake_server.request_count == requests_made
+
+
+def test_rows_with_missing_nutrition_are_not_cached(client, cache, monkeypatch, image):
+    def failing(image_id, position, api_token):
+        raise requests.HTTPError("500 Server Error")
+
+    monkeypatch.setattr(client, "nutritional_info", failing)
+    job = make_job(image)
+    rows = call_logmeal_api(job, image, "token", client, cache)
+    assert rows and all(row[NUTRITION_MISSING] for row in rows)
+    assert [level for level, _ in job.messages] == ["warning"]
+    assert cache.get(image.key) is None
+
+
+def test_cancelled_job_does_not_call_api(client, cache, fake_server, image):
+    job = make_job(image)
+    job.future.cancel()
+    assert call_logmeal_api(job, image, "token", client, cache) is None
+    assert fake_server.request_count == 0
+    assert cache.get(image.key) is None
+
+
+def test_job_cancelled_during_segmentation_skips_nutrition(client, cache, fake_server, image):
+    fake_server.latency = 0.3
+    job = make_job(image)
+    timer = threading.Timer(0.1, job.future.cancel)
+    timer.start()
+    try:
+        assert call_logmeal_api(job, image, "token", client, cache) is None
+    finally:
+        timer.cancel()
+    assert fake_server.request_count == 1  # 認識のみ。栄養素APIは呼ばない
+    assert cache.get(image.key) is None  # 途中の結果は保存しない
+
+
+def test_open_breaker_returns_warning(client, cache, fake_server, image):
+    client.breaker.record_failure()
+    client.breaker.record_failure()
+    job = make_job(image)
+    assert call_logmeal_api(job, image, "token", client, cache) is None
+    assert [level for level, _ in job.messages] == ["warning"]
+    assert fake_server.request_count == 0
+
+
+def test_api_error_returns_error_message(client, cache, fake_server, image):
+    fake_server.error_rate = 1.0
+    job = make_job(image)
+    assert call_logmeal_api(job, image, "token", client, cache) is None
+    assert len(job.messages) == 1
+    level, message = job.messages[0]
+    assert level == "error" and message.startswith("APIエラー")
+    assert cache.get(image.key) is None
+
+
+# --- AnalysisWorker の受付枠と先読みジョブ ---
+
+@pytest.fixture
+def worker(client, cache):
+    worker = AnalysisWorker(client=client, cache=cache, max_in_flight=1, max_queued=1, speculative_ttl=0.1)
+    yield worker
+    worker.close()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_cancelled_job_holds_slot_until_api_call_finishes(worker, fake_server, image):
+    fake_server.latency = 0.3
+    job = worker.submit(image, "token")
+    wait_for(lambda: fake_server.request_count == 1)
+    assert job.cancel()
+    # API 呼び出しのスレッドが終わるまでは受付枠を返さない
+    with pytest.raises(WorkerBusyError):
+        worker.submit(image, "token")
+    wait_for(lambda: worker.pending == 0)
+    assert fake_server.request_count == 1  # 取り消し後は栄養素APIを呼ばない
+    assert job.result() is None
+
+
+def test_job_cancelled_while_queued_releases_slot(client, cache, image):
+    worker = AnalysisWorker(client=client, cache=cache, max_in_flight=1, max_queued=2, demo_delay=0.3)
+    try:
+        first = worker.submit(image)
+        queued = worker.submit(image)
+        assert queued.cancel()
+        wait_for(lambda: worker.pending == 1)
+        assert first.result() is not None
+        wait_for(lambda: worker.pending == 0)
+    finally:
+        worker.close()
+
+
+def test_unclaimed_speculative_job_expires(worker, fake_server, image):
+    fake_server.latency = 0.3
+    job = worker.submit(image, "token", speculative=True)
+    wait_for(lambda: job.cancelled)
+    assert not worker.claim(job)
+    wait_for(lambda: worker.pending == 0)
+
+
+def test_claimed_speculative_job_is_kept(worker, fake_server, image):
+    fake_server.latency = 0.1
+    job = worker.submit(image, "token", speculative=True)
+    assert worker.claim(job)
+    assert job.result()
+    assert not job.cancelled
+
+
+# --- セッションの破棄 ---
+
+class _Job:
+    done = False
+    cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        return True
+
+
+def test_evicted_session_cancels_its_jobs(tmp_path):
+    store = SessionStore(spill_dir=str(tmp_path), idle_timeout=60)
+    job, other = _Job(), _Job()
+    store.track_job("idle", job)
+    store.track_job("active", other)
+    store.session("active").last_seen += 120
+    assert store.evict_idle(time.monotonic() + 90) == 1
+    assert job.cancelled and not other.cancelled
+    store.close()
+    assert other.cancelled
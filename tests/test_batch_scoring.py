@@ -0,0 +1,96 @@
+# --- 一括採点 (batch_scoring) とスカラー版の一致 ---
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch_scoring import (
+    calculate_comprehensive_score_batch, calculate_total_nutrients_batch, decode_reasons, predict_constitution_batch,
+)
+from benchmarks import synthetic
+from scoring import (
+    HABIT_OPTIONS, NUTRIENT_COLUMNS, calculate_comprehensive_score, nutrients_from_totals, predict_constitution,
+)
+
+N = 3000
+# 栄養素ごとの値の範囲 (採点の閾値をまたぐように、閾値のおよそ2倍まで)
+SCALES = {
+    "calories": 800, "protein": 40, "fat": 30, "carbs": 80, "fiber_sol": 4, "fiber_insol": 4,
+    "vit_b1": 0.2, "vit_c": 60, "vit_d": 10, "iron": 4, "zinc": 6, "magnesium": 60,
+}
+
+
+def random_rows(n, seed):
+    """回答・プロフィール (synthetic.respondents) と、閾値ちょうどの値も含む栄養素合計"""
+    frame = synthetic.respondents(n, seed).set_index("respondent_id")
+    rng = np.random.default_rng(seed)
+    totals = pd.DataFrame({
+        column: (rng.uniform(0, 2, n) * SCALES[key]).round(2 if key == "vit_b1" else 1)
+        for key, (column, _) in NUTRIENT_COLUMNS.items()
+    }, index=frame.index)
+    totals.iloc[:n // 50] = 0  # 食材なし
+    return frame, totals
+
+
+def scalar_inputs(row):
+    answers = {question: row[question] for question in HABIT_OPTIONS if row[question] is not None}
+    profile = {"stress_level": row["stress_level"],
+               "allergies": row["allergies"].split(";") if row["allergies"] else []}
+    return answers, profile
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_batch_matches_scalar(seed):
+    frame, totals = random_rows(N, seed)
+    nutrients_batch = calculate_total_nutrients_batch(totals)
+    result = calculate_comprehensive_score_batch(pd.concat([frame, nutrients_batch], axis=1), reason_mask=True)
+    constitution = predict_constitution_batch(frame)
+
+    for i, (row, total) in enumerate(zip(frame.to_dict("records"), totals.to_dict("records"))):
+        answers, profile = scalar_inputs(row)
+        nutrients = nutrients_from_totals(total)
+        assert {key: nutrients_batch.iloc[i][column] for key, (column, _) in NUTRIENT_COLUMNS.items()} == nutrients
+
+        score, breakdown = calculate_comprehensive_score(answers, profile, nutrients, None)
+        batch = result.iloc[i]
+        assert batch["score"] == score
+        assert {name: batch[name] for name in breakdown} == {name: b["score"] for name, b in breakdown.items()}
+        assert decode_reasons(batch["reasons"], nutrients) == {name: b["reasons"] for name, b in breakdown.items()}
+        assert constitution.iloc[i] == predict_constitution(answers)["type"]
+
+
+def test_allergies_as_lists_and_bool():
+    frame, totals = random_rows(500, 2)
+    nutrients = calculate_total_nutrients_batch(totals)
+    expected = calculate_comprehensive_score_batch(pd.concat([frame, nutrients], axis=1))
+
+    as_lists = frame.assign(allergies=[value.split(";") if value else [] for value in frame["allergies"]])
+    pd.testing.assert_frame_equal(
+        calculate_comprehensive_score_batch(pd.concat([as_lists, nutrients], axis=1)), expected)
+
+    gluten_only = frame.assign(allergies=frame["allergies"].str.split(";").map(lambda a: "グルテン" in a))
+    gluten_text = frame.assign(allergies=np.where(gluten_only["allergies"], "グルテン", ""))
+    pd.testing.assert_frame_equal(
+        calculate_comprehensive_score_batch(pd.concat([gluten_only, nutrients], axis=1)),
+        calculate_comprehensive_score_batch(pd.concat([gluten_text, nutrients], axis=1)))
+
+
+@pytest.mark.parametrize("allergies", [
+    ["グルテンフリー食品"], ["グルテン"], ["卵", "グルテン"], ["グルテン不耐症の疑い"], [],
+])
+def test_gluten_allergy_matches_whole_option(allergies):
+    frame, totals = random_rows(20, 3)
+    frequent = next(option for option in HABIT_OPTIONS["gluten"] if option != "週1回未満")
+    frame = frame.assign(gluten=frequent)
+    nutrients = calculate_total_nutrients_batch(totals)
+
+    expected = []
+    for row, total in zip(frame.to_dict("records"), totals.to_dict("records")):
+        answers, profile = scalar_inputs(row)
+        score, breakdown = calculate_comprehensive_score(
+            answers, dict(profile, allergies=allergies), nutrients_from_totals(total), None)
+        expected.append((score, breakdown["risk"]["score"]))
+
+    for value in (";".join(allergies), [allergies] * len(frame)):
+        batch = calculate_comprehensive_score_batch(pd.concat([frame.assign(allergies=value), nutrients], axis=1))
+        assert list(zip(batch["score"], batch["risk"])) == expected
@@ -0,0 +1,70 @@
+# --- NNBI式の係数の校正 ---
+
+import numpy as np
+import pytest
+
+from benchmarks import synthetic
+from calibrate import NormalEquations, accumulate
+
+
+def _write_inputs(tmp_path, questionnaire):
+    questionnaire_path = tmp_path / "questionnaires.csv"
+    ingredients_path = tmp_path / "ingredients.csv"
+    questionnaire.to_csv(questionnaire_path, index=False)
+    synthetic.meals(30, 10, seed=0).to_csv(ingredients_path, index=False)
+    return str(questionnaire_path), str(ingredients_path)
+
+
+def test_accumulate_counts_each_respondent_once(tmp_path):
+    questionnaire = synthetic.respondents(10, seed=0)
+    questionnaire["outcome"] = np.linspace(40, 80, 10)
+    questionnaire.loc[3, "outcome"] = np.nan
+    paths = _write_inputs(tmp_path, questionnaire)
+
+    equations, skipped = accumulate(*paths, chunksize=4)
+    assert (equations.count, skipped) == (9, 1)
+
+
+def test_accumulate_rejects_duplicate_across_chunk_boundary(tmp_path):
+    questionnaire = synthetic.respondents(10, seed=0)
+    questionnaire["outcome"] = 60.0
+    # チャンク (4行) の末尾 ID=3 と次チャンクの先頭が同じ回答者
+    questionnaire = questionnaire.iloc[[0, 1, 2, 3, 3, 4, 5, 6, 7, 8, 9]]
+    paths = _write_inputs(tmp_path, questionnaire)
+
+    with pytest.raises(ValueError, match="重複"):
+        accumulate(*paths, chunksize=4)
+
+
+def test_normal_equations_recover_known_coefficients():
+    rng = np.random.default_rng(0)
+    coef = np.array([15.0, 0.4, 0.3, 0.15, 0.25])  # alpha, w_diet, w_bio, w_dop, w_risk
+    equations = NormalEquations()
+    parts = []
+    # チャンクごとに足し込んでも、まとめて解いた場合と同じ係数になる
+    for _ in range(4):
+        subscores = rng.uniform(0, 100, (500, 4))
+        outcome = coef[0] + subscores[:, :3] @ coef[1:4] - subscores[:, 3] * coef[4]
+        part = NormalEquations()
+        part.add(subscores, outcome)
+        parts.append(part)
+        equations.add(subscores, outcome + rng.normal(0, 0.5, len(outcome)))
+
+    merged = NormalEquations()
+    for part in parts:
+        merged.merge(part)
+    np.testing.assert_allclose(merged.solve(), coef, atol=1e-8)
+    assert merged.sse(coef) == pytest.approx(0, abs=1e-6)
+    np.testing.assert_allclose(equations.solve(), coef, atol=0.05)
+    assert equations.count == 2000
+
+
+def test_ridge_pulls_towards_prior():
+    rng = np.random.default_rng(1)
+    subscores = rng.uniform(0, 100, (50, 4))
+    equations = NormalEquations()
+    equations.add(subscores, 20 + subscores[:, 0] * 0.6)
+    prior = np.array([20.0, 0.35, 0.25, 0.2, 0.2])
+    np.testing.assert_allclose(equations.solve(ridge=1e6, prior=prior)[1:], prior[1:], atol=1e-3)
+    with pytest.raises(ValueError):
+        NormalEquations().solve()
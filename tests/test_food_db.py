@@ -0,0 +1,64 @@
+# --- 食品成分データベース ---
+
+import shutil
+from concurrent.futures import Future
+
+import numpy as np
+
+from analysis_worker import AnalysisJob, call_logmeal_api
+from food_db import DEMO_SOURCE, FoodDatabase
+
+
+def copy_source(tmp_path):
+    """デモ用 CSV と同じ内容の、利用者が用意した CSV"""
+    source = tmp_path / "foods.csv"
+    shutil.copy(DEMO_SOURCE, source)
+    return str(source)
+
+
+def test_build_into_given_directory_in_row_order(tmp_path):
+    db = FoodDatabase(path=str(tmp_path / "food_db"), source=DEMO_SOURCE)
+    assert db.demo
+    assert db.nutrients.flags.c_contiguous
+    assert db.lookup("はくまい")["食材名"] == "白米"
+
+
+def test_custom_source_is_not_demo(tmp_path):
+    db = FoodDatabase(path=str(tmp_path / "food_db"), source=copy_source(tmp_path))
+    demo = FoodDatabase(path=str(tmp_path / "demo"), source=DEMO_SOURCE)
+    assert not db.demo
+    np.testing.assert_array_equal(db.nutrients[0], demo.nutrients[0])
+
+
+def test_rebuilds_when_source_changes(tmp_path):
+    path = str(tmp_path / "food_db")
+    assert FoodDatabase(path=path, source=DEMO_SOURCE).demo
+    assert not FoodDatabase(path=path, source=copy_source(tmp_path)).demo
+
+
+def test_suggest_matches_name_or_reading_prefix(tmp_path):
+    db = FoodDatabase(path=str(tmp_path / "food_db"), source=DEMO_SOURCE)
+    assert db.suggest("ミソ")[0] == "味噌汁"
+    assert db.suggest("ほうれん")[0] == "ほうれん草のお浸し"
+    assert db.suggest("") == [] and db.suggest("zzzz") == []
+    assert db.suggest("やき", limit=1) == ["焼き魚"]
+
+
+def _analyze(image, client, cache, food_db):
+    job = AnalysisJob(image.key)
+    job.future = Future()
+    return call_logmeal_api(job, image, "token", client, cache, food_db)
+
+
+def test_demo_database_does_not_override_api_nutrition(tmp_path, client, cache, fake_server, image):
+    food_db = FoodDatabase(path=str(tmp_path / "food_db"), source=DEMO_SOURCE)
+    rows = _analyze(image, client, cache, food_db)
+    assert rows
+    assert fake_server.request_count == 1 + len(rows)  # 全料理の栄養素を API から取得
+
+
+def test_real_database_resolves_locally(tmp_path, client, cache, fake_server, image):
+    food_db = FoodDatabase(path=str(tmp_path / "food_db"), source=copy_source(tmp_path))
+    rows = _analyze(image, client, cache, food_db)
+    assert rows
+    assert fake_server.request_count == 1  # スタブの料理はすべてDBにあるため栄養素APIを呼ばない
@@ -0,0 +1,133 @@
+# --- 食材編集の差分反映 ---
+
+import pandas as pd
+import pytest
+
+from benchmarks import synthetic
+from incremental import HabitPartialCache, IncrementalScorer, IncrementalTotals
+from ingredients import NUTRIENT_LABELS, IngredientTable
+from scoring import MEAL_PARTS, calculate_comprehensive_score
+
+
+def make_table(n=12, seed=0):
+    return IngredientTable.from_frame(synthetic.meals(n, seed=seed))
+
+
+def recompute(table, edit_state):
+    """編集状態を適用した表を作り直して合計する (差分反映の正解)"""
+    df = table.to_frame().astype({label: object for label in NUTRIENT_LABELS})
+    for pos, changes in edit_state.get("edited_rows", {}).items():
+        for column, value in changes.items():
+            df.at[int(pos), column] = value
+    df = df.drop(index=list(edit_state.get("deleted_rows", [])))
+    df = pd.concat([df, pd.DataFrame(edit_state.get("added_rows", []))], ignore_index=True)
+    return IngredientTable.from_frame(df).totals()
+
+
+def assert_totals_equal(actual, expected):
+    assert actual == pytest.approx(expected, abs=1e-3)
+
+
+def test_no_edits_match_table_totals():
+    table = make_table()
+    totals = IncrementalTotals(table)
+    assert_totals_equal(totals.totals(None), table.totals())
+    assert_totals_equal(totals.totals({}), table.totals())
+
+
+def test_added_rows_are_summed():
+    table = make_table()
+    state = {"added_rows": [{"食材名": "豆腐", "タンパク質(g)": 7.0, "脂質(g)": "4.2"}, {"食材名": "水"}]}
+    totals = IncrementalTotals(table).totals(state)
+    assert totals["タンパク質(g)"] == pytest.approx(table.totals()["タンパク質(g)"] + 7.0, abs=1e-3)
+    assert_totals_equal(totals, recompute(table, state))
+
+
+def test_edited_cells_replace_original_values():
+    table = make_table()
+    state = {"edited_rows": {2: {"カロリー(kcal)": 0}, "5": {"鉄分(mg)": "1,5", "食材名": "改名"}}}
+    assert_totals_equal(IncrementalTotals(table).totals(state), recompute(table, state))
+
+
+def test_deleted_rows_are_subtracted_and_their_edits_ignored():
+    table = make_table()
+    state = {"deleted_rows": [0, 3], "edited_rows": {3: {"カロリー(kcal)": 9999}}}
+    assert_totals_equal(IncrementalTotals(table).totals(state), recompute(table, state))
+
+
+def test_series_of_edits_matches_full_recompute():
+    # data_editor は編集のたびに累積した編集状態を渡す
+    table = make_table(30, seed=3)
+    totals = IncrementalTotals(table)
+    states = [
+        {"edited_rows": {1: {"炭水化物(g)": 12.5}}},
+        {"edited_rows": {1: {"炭水化物(g)": 12.5}, 7: {"ビタミンC(mg)": 30}},
+         "added_rows": [{"食材名": "みかん", "ビタミンC(mg)": 32, "炭水化物(g)": 12}]},
+        {"edited_rows": {1: {"炭水化物(g)": 3}, 7: {"ビタミンC(mg)": 30}},
+         "added_rows": [{"食材名": "みかん", "ビタミンC(mg)": 32, "炭水化物(g)": 12}],
+         "deleted_rows": [7, 20]},
+        {"edited_rows": {1: {"炭水化物(g)": 3}},
+         "added_rows": [], "deleted_rows": [7, 20, 29]},
+    ]
+    for state in states:
+        assert_totals_equal(totals.totals(state), recompute(table, state))
+
+
+def test_invalid_values_are_reported_until_fixed():
+    df = synthetic.meals(3, seed=0).astype({"脂質(g)": object})
+    df.at[1, "脂質(g)"] = "たくさん"
+    table = IngredientTable.from_frame(df)
+    totals = IncrementalTotals(table)
+
+    totals.totals({"added_rows": [{"食材名": "油", "脂質(g)": -1}]})
+    assert totals.problems == [(1, "脂質(g)", "たくさん"), (3, "脂質(g)", -1)]
+    totals.totals({"edited_rows": {1: {"脂質(g)": 2.0}}})
+    assert totals.problems == []
+    totals.totals({})
+    assert totals.problems == [(1, "脂質(g)", "たくさん")]
+
+
+# --- 習慣部分のキャッシュ・サブスコアの再計算 ---
+
+def test_partial_cache_evicts_least_recently_used():
+    cache = HabitPartialCache(maxsize=2)
+    (a, profile_a), (b, profile_b), (c, profile_c) = synthetic.profiles(3, seed=0)
+    first = cache.get(a, profile_a)
+    cache.get(b, profile_b)
+    assert cache.get(a, profile_a) is first  # a を最近使ったものにする
+    cache.get(c, profile_c)  # b が追い出される
+    assert (cache.hits, cache.misses) == (1, 3)
+
+    assert cache.get(a, profile_a) is first
+    cache.get(b, profile_b)
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_partial_cache_key_ignores_list_order():
+    cache = HabitPartialCache()
+    answers, profile = synthetic.profiles(1, seed=0)[0]
+    profile = dict(profile, allergies=["グルテン", "卵"])
+    cache.get(answers, profile)
+    cache.get(answers, dict(profile, allergies=["卵", "グルテン"]))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_scorer_recomputes_only_affected_subscores():
+    answers, profile = synthetic.profiles(1, seed=2)[0]
+    nutrients = make_table().nutrients()
+    scorer = IncrementalScorer(HabitPartialCache())
+
+    expected = calculate_comprehensive_score(answers, profile, nutrients, None)
+    assert scorer.score(answers, profile, nutrients) == expected
+    assert scorer.last_recomputed == list(MEAL_PARTS)
+
+    scorer.score(answers, profile, dict(nutrients))
+    assert scorer.last_recomputed == []
+
+    changed = dict(nutrients, magnesium=nutrients["magnesium"] + 50)
+    assert scorer.score(answers, profile, changed) == calculate_comprehensive_score(answers, profile, changed, None)
+    assert scorer.last_recomputed == ["bio"]
+
+    other_answers, other_profile = synthetic.profiles(2, seed=5)[1]
+    scorer.score(other_answers, other_profile, changed)
+    assert scorer.last_recomputed == list(MEAL_PARTS)
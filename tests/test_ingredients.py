@@ -0,0 +1,84 @@
+# --- 食材表の型・栄養素の変換 ---
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch_cli import iter_nutrient_totals
+from benchmarks import synthetic
+from ingredients import NUTRIENT_LABELS, IngredientTable, coerce_nutrient, describe_problems
+
+
+@pytest.mark.parametrize("value, expected", [
+    (1.5, (1.5, True)),
+    (0, (0.0, True)),
+    ("2.25", (2.25, True)),
+    (" 1,200 ", (1200.0, True)),
+    (None, (0.0, True)),
+    (pd.NA, (0.0, True)),
+    (math.nan, (0.0, True)),
+    ("", (0.0, True)),
+    ("  ", (0.0, True)),
+    ("たくさん", (0.0, False)),
+    (-3, (0.0, False)),
+    ("-0.5", (0.0, False)),
+    (math.inf, (0.0, False)),
+    ([1], (0.0, False)),
+])
+def test_coerce_nutrient(value, expected):
+    assert coerce_nutrient(value) == expected
+
+
+def test_frame_round_trip():
+    source = synthetic.meals(20, seed=1)
+    table = IngredientTable.from_frame(source)
+    again = IngredientTable.from_frame(table.to_frame())
+    assert again.names == table.names == tuple(source["食材名"])
+    np.testing.assert_array_equal(again.values, table.values)
+    np.testing.assert_array_equal(again.category_codes, table.category_codes)
+    assert list(table.to_frame().columns) == ["食材名", *NUTRIENT_LABELS, "カテゴリ"]
+    assert again.problems == []
+
+
+def test_rows_round_trip():
+    rows = IngredientTable.from_frame(synthetic.meals(5, seed=2)).to_rows()
+    again = IngredientTable.from_rows(rows)
+    assert again.to_rows() == rows
+    assert IngredientTable.from_rows([]).to_rows() == []
+
+
+def test_invalid_cells_become_zero_and_are_recorded():
+    table = IngredientTable.from_rows([
+        {"食材名": "ご飯", "カロリー(kcal)": "250", "脂質(g)": -1, "カテゴリ": "主食"},
+        {"食材名": None, "カロリー(kcal)": "不明", "カテゴリ": "デザート"},
+    ])
+    assert table.names == ("ご飯", "")
+    assert table.totals()["カロリー(kcal)"] == 250
+    assert table.totals()["脂質(g)"] == 0
+    assert table.problems == [(1, "カロリー(kcal)", "不明"), (0, "脂質(g)", -1)]
+    assert table.to_frame()["カテゴリ"].tolist() == ["主食", "その他"]
+
+
+def test_describe_problems():
+    problems = [(0, "脂質(g)", -1), (2, "鉄分(mg)", "たくさん"), (3, "亜鉛(mg)", "x"), (4, "亜鉛(mg)", "y")]
+    assert describe_problems(problems[:1]) == "1行目の脂質(g)「-1」"
+    assert describe_problems(problems) == "1行目の脂質(g)「-1」、3行目の鉄分(mg)「たくさん」、4行目の亜鉛(mg)「x」 ほか1件"
+    assert describe_problems(problems, limit=1) == "1行目の脂質(g)「-1」 ほか3件"
+
+
+def test_batch_totals_match_app_totals():
+    # 一括採点の食材集計とアプリの食材表で、不正な値の扱いと合計が一致する
+    rows = synthetic.meals(60, 12, seed=4).astype({"脂質(g)": object, "鉄分(mg)": object})
+    rows.loc[rows.index[::7], "脂質(g)"] = -2.5
+    rows.loc[rows.index[1::9], "鉄分(mg)"] = "1,5"
+    rows.loc[rows.index[2::11], "鉄分(mg)"] = "不明"
+    rows.loc[rows.index[3::13], "カロリー(kcal)"] = np.nan
+    chunks = [rows.iloc[i:i + 25] for i in range(0, len(rows), 25)]
+
+    batch = pd.concat(iter_nutrient_totals(chunks, "respondent_id"))
+    assert batch.index.is_unique
+    for respondent_id, group in rows.groupby("respondent_id"):
+        expected = IngredientTable.from_frame(group.reset_index(drop=True)).totals()
+        assert batch.loc[respondent_id].to_dict() == expected
@@ -0,0 +1,27 @@
+# --- LogMeal 認識結果のディスクキャッシュ ---
+
+from logmeal_cache import LogMealCache
+
+
+def test_reads_do_not_write_stats_each_time(cache):
+    cache.put("meal:a", [{"食材名": "ご飯"}])
+    changes = cache._conn.total_changes
+    for _ in range(5):
+        cache.get("meal:missing")
+    assert cache._conn.total_changes == changes
+    assert (cache.hits, cache.misses) == (0, 5)
+
+
+def test_stats_are_shared_between_workers(cache):
+    cache.put("meal:a", [{"食材名": "ご飯"}])
+    assert cache.get("meal:a") == [{"食材名": "ご飯"}]
+    # 別ワーカーの分は close 時に書き出される
+    other = LogMealCache(path=cache.path)
+    other.get("meal:a")
+    other.get("meal:b")
+    other.close()
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 0)
+    assert (stats["total_hits"], stats["total_misses"]) == (2, 1)
+    assert stats["entries"] == 1
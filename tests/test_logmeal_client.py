@@ -0,0 +1,226 @@
+# --- LogMealClient / CircuitBreaker (スタブサーバー相手) ---
+
+import time
+
+import pytest
+import requests
+
+from fake_logmeal import DISHES
+from logmeal_client import (
+    NUTRITION_MISSING, PATH_SEGMENTATION, CircuitBreaker, CircuitOpenError, LogMealClient, detected_dishes,
+    nutrition_row,
+)
+
+
+# --- サーキットブレーカー ---
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_breaker_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_breaker_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()  # 試行中は他の呼び出しを通さない
+
+
+def test_breaker_probe_success_closes():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_breaker_probe_failure_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+# --- _request ---
+
+def test_request_success(client, fake_server):
+    data = client._request("POST", PATH_SEGMENTATION, "token", files={"image": b"meal"})
+    assert data["segmentation_results"]
+    assert fake_server.request_count == 1
+    assert client.breaker.state == "closed"
+
+
+def test_client_error_does_not_trip_breaker(client, fake_server):
+    for _ in range(3):
+        with pytest.raises(requests.HTTPError) as excinfo:
+            client._request("POST", "/v2/unknown", "token")
+        assert excinfo.value.response.status_code == 404
+    assert client.breaker.state == "closed"
+
+
+def test_server_error_is_not_retried_for_post(client, fake_server):
+    fake_server.error_rate = 1.0
+    with pytest.raises(requests.HTTPError) as excinfo:
+        client.segment_meal(b"meal", "token")
+    assert excinfo.value.response.status_code == 503
+    assert fake_server.request_count == 1  # 課金される POST は再送しない
+
+
+def test_rate_limit_with_retry_after_is_retried(client, fake_server):
+    fake_server.error_rate = 1.0
+    fake_server.error_status = 429
+    fake_server.retry_after = 0
+    with pytest.raises(requests.HTTPError) as excinfo:
+        client.segment_meal(b"meal", "token")
+    assert excinfo.value.response.status_code == 429
+    assert fake_server.request_count == 3  # 初回 + 再試行 2回
+
+
+def test_rate_limit_without_retry_after_is_not_retried(client, fake_server):
+    fake_server.error_rate = 1.0
+    fake_server.error_status = 429
+    with pytest.raises(requests.HTTPError):
+        client.segment_meal(b"meal", "token")
+    assert fake_server.request_count == 1
+
+
+def test_read_timeout(fake_server, breaker):
+    fake_server.latency = 0.5
+    client = LogMealClient(base_url=fake_server.url, read_timeout=0.1, backoff_factor=0, breaker=breaker)
+    try:
+        with pytest.raises(requests.ReadTimeout):
+            client.segment_meal(b"meal", "token")
+    finally:
+        client.close()
+    assert fake_server.request_count == 1  # 読み取りタイムアウトでも POST は再送しない
+
+
+def test_connect_error_is_retried_then_counted_once(closed_port):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    client = LogMealClient(base_url=f"http://127.0.0.1:{closed_port}", connect_timeout=0.5,
+                           backoff_factor=0, breaker=breaker)
+    try:
+        with pytest.raises(requests.ConnectionError) as excinfo:
+            client.segment_meal(b"meal", "token")
+    finally:
+        client.close()
+    assert "Max retries exceeded" in str(excinfo.value)
+    assert client.timeout == (0.5, 20.0)
+    assert breaker.state == "closed"  # 再試行込みで1回の失敗
+
+
+def test_failures_open_breaker_and_block_requests(client, fake_server):
+    fake_server.error_rate = 1.0
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            client.segment_meal(b"meal", "token")
+    assert client.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        client.segment_meal(b"meal", "token")
+    assert fake_server.request_count == 2  # 遮断中は上流に送らない
+
+
+def test_breaker_recovers_through_half_open_probe(client, fake_server):
+    fake_server.error_rate = 1.0
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            client.segment_meal(b"meal", "token")
+    time.sleep(0.25)
+    fake_server.error_rate = 0.0
+    assert client.segment_meal(b"meal", "token")["segmentation_results"]
+    assert client.breaker.state == "closed"
+
+
+def test_malformed_body_during_probe_releases_breaker(client, fake_server):
+    fake_server.error_rate = 1.0
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            client.segment_meal(b"meal", "token")
+    time.sleep(0.25)
+    fake_server.error_rate = 0.0
+    fake_server.malformed = True
+    with pytest.raises(ValueError):
+        client.segment_meal(b"meal", "token")
+    assert client.breaker.state == "open"
+    # 試行の枠が返っていれば、次の遮断明けにまた試行できる
+    time.sleep(0.25)
+    fake_server.malformed = False
+    assert client.segment_meal(b"meal", "token")["segmentation_results"]
+    assert client.breaker.state == "closed"
+
+
+# --- analyze_meal ---
+
+def test_analyze_meal_fetches_nutrition_per_dish(client, fake_server):
+    dishes = detected_dishes(client.segment_meal(b"meal", "token"))
+    assert dishes
+    rows = client.analyze_meal(b"meal", "token")
+    assert [row["食材名"] for row in rows] == [dish["name"] for dish in dishes]
+    calories = {dish["name"]: dish["ENERC_KCAL"] for dish in DISHES}
+    assert all(row["カロリー(kcal)"] == calories[row["食材名"]] for row in rows)
+    assert fake_server.request_count == 2 + len(dishes)
+
+
+def test_analyze_meal_skips_nutrition_for_resolved_dishes(client, fake_server):
+    rows = client.analyze_meal(b"meal", "token", resolve=lambda name: {"食材名": name, "local": True})
+    assert rows and all(row["local"] for row in rows)
+    assert fake_server.request_count == 1
+
+
+def test_analyze_meal_keeps_other_dishes_when_one_lookup_fails(client, monkeypatch):
+    dishes = detected_dishes(client.segment_meal(b"meal", "token"))
+    assert len(dishes) >= 2
+    failing = dishes[0]["position"]
+    lookup = client.nutritional_info
+
+    def flaky(image_id, position, api_token):
+        if position == failing:
+            raise requests.HTTPError("500 Server Error")
+        return lookup(image_id, position, api_token)
+
+    monkeypatch.setattr(client, "nutritional_info", flaky)
+    rows = client.analyze_meal(b"meal", "token")
+    assert [row["食材名"] for row in rows] == [dish["name"] for dish in dishes]
+    assert rows[0][NUTRITION_MISSING] and rows[0]["カロリー(kcal)"] is None
+    assert not any(row.get(NUTRITION_MISSING) for row in rows[1:])
+    assert all(row["カロリー(kcal)"] > 0 for row in rows[1:])
+
+
+def test_nutrition_row_tolerates_null_nutrients():
+    dish = {"name": "ご飯"}
+    for info in ({"nutritional_info": None}, {"nutritional_info": {"totalNutrients": None}},
+                 {"nutritional_info": {"totalNutrients": {"PROCNT": None, "FAT": {"quantity": None}}}}):
+        row = nutrition_row(dish, info)
+        assert row["食材名"] == "ご飯" and row["タンパク質(g)"] == 0 and row["脂質(g)"] == 0
+
+
+def test_analyze_meal_cancelled_after_segmentation(client, fake_server):
+    assert client.analyze_meal(b"meal", "token", cancelled=lambda: True) is None
+    assert fake_server.request_count == 1
+
+
+def test_analyze_meal_with_open_breaker(client, fake_server):
+    client.breaker.record_failure()
+    client.breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        client.analyze_meal(b"meal", "token")
+    assert fake_server.request_count == 0
@@ -0,0 +1,110 @@
+# --- 食事記録 ---
+
+import datetime
+
+import pytest
+
+from ingredients import IngredientTable
+from meal_diary import MealDiary, account_user_id, average_nutrients, new_diary_token, token_user_id
+
+USER = token_user_id("a" * 22)
+OTHER = token_user_id("b" * 22)
+
+
+@pytest.fixture
+def diary(tmp_path):
+    diary = MealDiary(path=str(tmp_path / "diary.sqlite3"))
+    yield diary
+    diary.close()
+
+
+def meal(kcal, protein=0.0, name="ご飯"):
+    return IngredientTable.from_rows([{"食材名": name, "カロリー(kcal)": kcal, "タンパク質(g)": protein}])
+
+
+def at(day, hour, minute=0):
+    # ローカル時刻 (日付の区切りはローカルの0時)
+    return datetime.datetime(2026, 3, day, hour, minute).timestamp()
+
+
+def day(n):
+    return datetime.date(2026, 3, n)
+
+
+# --- 持ち主 ---
+
+def test_tokens_are_random_and_accepted():
+    token = new_diary_token()
+    assert token != new_diary_token()
+    assert token_user_id(token) == token_user_id(token)
+    assert token not in token_user_id(token)  # 鍵そのものは保存しない
+
+
+def test_names_are_not_accepted_as_tokens():
+    for value in (None, "", "alice", "山田太郎", "a" * 21, "alice smith" * 3):
+        assert token_user_id(value) is None
+
+
+def test_accounts_and_tokens_do_not_collide():
+    token = new_diary_token()
+    assert account_user_id(token) != token_user_id(token)
+
+
+# --- 記録・集計 ---
+
+def test_add_and_delete_meal(diary):
+    meal_id = diary.add_meal(USER, meal(500, 20), eaten_at=at(1, 12), score=70)
+    [saved] = diary.meals(USER)
+    assert saved["id"] == meal_id and saved["score"] == 70 and saved["names"] == ["ご飯"]
+    assert saved["totals"]["カロリー(kcal)"] == 500
+    assert diary.meal_rows(meal_id) == meal(500, 20).to_rows()
+
+    # 他人の記録は削除できない
+    assert not diary.delete_meal(OTHER, meal_id)
+    assert diary.delete_meal(USER, meal_id)
+    assert not diary.delete_meal(USER, meal_id)
+    assert diary.meals(USER) == []
+    assert diary.day_totals(USER, day(1)) == (0, {})
+    assert diary.day_totals(USER, day(1), rolling=True) == (0, {})
+
+
+def test_daily_totals_split_at_local_midnight(diary):
+    diary.add_meal(USER, meal(300, 10), eaten_at=at(1, 23, 59))
+    diary.add_meal(USER, meal(200, 5), eaten_at=at(2, 0, 1))
+    diary.add_meal(USER, meal(100, 1), eaten_at=at(2, 12))
+    diary.add_meal(OTHER, meal(999), eaten_at=at(2, 12))
+
+    daily = diary.daily_totals(USER, day(1), day(3))
+    assert [(date, count, totals["カロリー(kcal)"]) for date, count, totals in daily] == [
+        (day(1), 1, 300), (day(2), 2, 300),
+    ]
+    count, totals = diary.day_totals(USER, day(2))
+    assert (count, totals["タンパク質(g)"]) == (2, 6)
+    assert average_nutrients(count, totals)["protein"] == 3
+
+
+def test_rolling_totals_cover_seven_days(diary):
+    first = diary.add_meal(USER, meal(100), eaten_at=at(1, 23, 59))
+    diary.add_meal(USER, meal(10), eaten_at=at(2, 0, 1))
+    diary.add_meal(USER, meal(1), eaten_at=at(8, 8))
+
+    rolling = {date: (count, totals["カロリー(kcal)"])
+               for date, count, totals in diary.rolling_totals(USER, day(1), day(10))}
+    assert rolling[day(1)] == (1, 100)
+    assert rolling[day(7)] == (2, 110)  # 3/1-3/7
+    assert rolling[day(8)] == (2, 11)   # 3/2-3/8 (3/1 は外れる)
+    assert rolling[day(9)] == (1, 1)    # 3/3-3/9
+
+    # 削除すると、その食事を含む7日間すべてから引かれる
+    diary.delete_meal(USER, first)
+    assert diary.day_totals(USER, day(7), rolling=True)[1]["カロリー(kcal)"] == 10
+    assert diary.day_totals(USER, day(1), rolling=True) == (0, {})
+
+
+def test_rebuild_matches_incremental_totals(diary):
+    for hour, kcal in ((8, 400), (13, 650), (19, 700)):
+        diary.add_meal(USER, meal(kcal), eaten_at=at(4, hour))
+    diary.delete_meal(USER, diary.meals(USER, limit=1)[0]["id"])
+    before = (diary.daily_totals(USER, day(1), day(12)), diary.rolling_totals(USER, day(1), day(12)))
+    diary.rebuild(USER)
+    assert (diary.daily_totals(USER, day(1), day(12)), diary.rolling_totals(USER, day(1), day(12))) == before
@@ -0,0 +1,65 @@
+# --- 参加者ごとのレポート ---
+
+import pandas as pd
+import pytest
+
+from batch_cli import run
+from benchmarks import synthetic
+from report_export import UNKNOWN_VERSION, render_report, report_filename
+from scoring import CONSTITUTIONS, NUTRIENT_COLUMNS, WEIGHTS_VERSION
+
+
+def test_filenames_are_unique_per_participant():
+    participants = ["a_b", "a/b", "a b", "山田", "佐藤", "a_b" + "-x", 123]
+    names = [report_filename(p) for p in participants]
+    assert len(set(names)) == len(names)
+    assert report_filename("a_b") == "nnbi_a_b.html"  # 使える文字だけならそのまま
+    assert report_filename("山田") == report_filename("山田")  # 実行ごとに変わらない
+
+
+def _row(reasons):
+    row = {column: 1.0 for column, _ in NUTRIENT_COLUMNS.values()}
+    row.update(respondent_id="r1", diet=60, bio=50, dop=40, risk=10, score=55, constitution="バランス維持型",
+               weights_version="20260101-abcdef12", alpha=18.0, w_diet=0.4, w_bio=0.3, w_dop=0.15, w_risk=0.25)
+    if reasons is not ...:
+        row["reasons"] = reasons
+    return row
+
+
+@pytest.mark.parametrize("reasons", [..., float("nan"), None])
+def test_report_without_reasons(reasons):
+    report = render_report(_row(reasons))
+    assert report.count("<td>-</td></tr>") == 4
+
+
+def test_report_with_reasons_mask_as_float():
+    # 欠損のある列と結合すると整数のマスクも float になる
+    report = render_report(_row(float(0xFFFFFFFF)))
+    assert "<td>-</td></tr>" not in report
+
+
+def test_report_uses_weights_from_results():
+    report = render_report(_row(...))
+    assert "係数の版: 20260101-abcdef12" in report
+    assert [f"<td>{w}</td>" in report for w in ("+40%", "+30%", "+15%", "-25%")] == [True] * 4
+    desc = next(c["desc"] for c in CONSTITUTIONS if c["type"] == "バランス維持型")
+    assert "体質タイプ: バランス維持型" in report and desc in report
+
+
+def test_report_without_weight_columns():
+    row = {k: v for k, v in _row(...).items() if k not in ("weights_version", "w_diet", "w_bio", "w_dop", "w_risk")}
+    report = render_report(row)
+    assert f"係数の版: {UNKNOWN_VERSION}" in report
+    assert report.count("<tr><td>X<sub>") == report.count("</td><td>-</td><td>") == 4
+
+
+def test_batch_results_carry_weights(tmp_path):
+    questionnaires, ingredients, output = (str(tmp_path / name) for name in ("q.csv", "i.csv", "scores.csv"))
+    synthetic.respondents(5, seed=0).to_csv(questionnaires, index=False)
+    synthetic.meals(15, 5, seed=0).to_csv(ingredients, index=False)
+    assert run(questionnaires, ingredients, output, chunksize=2) == 5
+
+    results = pd.read_csv(output)
+    assert (results["weights_version"].astype(str) == WEIGHTS_VERSION).all()
+    for row in results.to_dict("records"):
+        assert f"係数の版: {WEIGHTS_VERSION}" in render_report(row)
@@ -0,0 +1,21 @@
+# --- 集計キューブのアレルギー区分 ---
+
+import numpy as np
+import pandas as pd
+
+from score_cubes import ALLERGY_AXIS, NO_ALLERGY, _allergy_flags
+
+
+def _axes(values):
+    flags = _allergy_flags(pd.DataFrame({"allergies": values}))
+    return [[axis for axis, flag in zip(ALLERGY_AXIS[1:], row[1:]) if flag] for row in flags]
+
+
+def test_allergies_match_whole_options():
+    assert _axes(["グルテン;卵", "乳製品, えび", "卵焼き", "", None, np.nan]) == [
+        ["グルテン", "卵"], ["乳製品", "えび"], [NO_ALLERGY], [NO_ALLERGY], [NO_ALLERGY], [NO_ALLERGY],
+    ]
+
+
+def test_allergies_from_multiselect_lists():
+    assert _axes([["かに", "そば"], [], "かに"]) == [["そば", "かに"], [NO_ALLERGY], ["かに"]]
@@ -0,0 +1,64 @@
+# --- NNBI式の係数 (重みファイル) ---
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from scoring import DEFAULT_WEIGHTS_PATH, WEIGHT_KEYS, WEIGHTS_FORMAT, load_weights
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_weights(tmp_path, **overrides):
+    document = {"format": WEIGHTS_FORMAT, "version": "test-1",
+                "alpha": 10, "w_diet": 0.4, "w_bio": 0.3, "w_dop": 0.2, "w_risk": 0.1}
+    document.update(overrides)
+    path = tmp_path / "weights.json"
+    path.write_text(json.dumps({k: v for k, v in document.items() if v is not None}), encoding="utf-8")
+    return str(path)
+
+
+def test_default_weights_file():
+    weights = load_weights(DEFAULT_WEIGHTS_PATH)
+    assert weights["format"] == WEIGHTS_FORMAT and weights["version"]
+    assert all(isinstance(weights[key], (int, float)) for key in WEIGHT_KEYS)
+
+
+def test_missing_keys_are_reported(tmp_path):
+    path = write_weights(tmp_path, w_bio=None, version=None)
+    with pytest.raises(ValueError, match="version, w_bio"):
+        load_weights(path)
+
+
+@pytest.mark.parametrize("value", [None, 0, 2, "1"])
+def test_unsupported_format_is_rejected(tmp_path, value):
+    with pytest.raises(ValueError, match="形式"):
+        load_weights(write_weights(tmp_path, format=value))
+
+
+def test_invalid_json_is_rejected(tmp_path):
+    path = tmp_path / "weights.json"
+    path.write_text("{ not json", encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_weights(str(path))
+
+
+def test_environment_variable_overrides_default(tmp_path, monkeypatch):
+    path = write_weights(tmp_path)
+    monkeypatch.setenv("NNBI_WEIGHTS", path)
+    assert load_weights()["version"] == "test-1"
+    # 明示したパスが環境変数より優先される
+    assert load_weights(DEFAULT_WEIGHTS_PATH)["version"] != "test-1"
+
+
+def test_environment_variable_sets_module_weights(tmp_path):
+    # 係数はモジュールの読み込み時に決まるため、別プロセスで確かめる
+    env = dict(os.environ, NNBI_WEIGHTS=write_weights(tmp_path))
+    output = subprocess.run(
+        [sys.executable, "-c", "import scoring; print(scoring.WEIGHTS_VERSION, scoring.ALPHA, scoring.W_DIET)"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    assert output.split() == ["test-1", "10", "0.4"]
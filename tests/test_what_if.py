@@ -0,0 +1,66 @@
+# --- 改善シミュレーション ---
+
+from itertools import combinations
+
+import pytest
+
+from benchmarks import synthetic
+from scoring import HABIT_OPTIONS, calculate_comprehensive_score, nutrients_from_totals
+from what_if import improvements
+
+
+def brute_force(habit_answers, user_profile, nutrients, max_changes):
+    """すべての回答の組み合わせをスカラー版で採点して、improvements と同じ規則で選ぶ"""
+    candidates = [
+        (question, habit_answers.get(question), option)
+        for question, options in HABIT_OPTIONS.items()
+        for option in options if option != habit_answers.get(question)
+    ]
+
+    def score(combo):
+        answers = {**habit_answers, **{candidates[i][0]: candidates[i][2] for i in combo}}
+        return calculate_comprehensive_score(answers, user_profile, nutrients, None)
+
+    base_score = score(())[0]
+    scores = {(): base_score}
+    results = []
+    for k in range(1, max_changes + 1):
+        for combo in combinations(range(len(candidates)), k):
+            if len({candidates[i][0] for i in combo}) < k:
+                continue
+            value, breakdown = score(combo)
+            scores[combo] = value
+            # どの1問を戻してもスコアが下がるものだけ
+            if all(value > scores[combo[:i] + combo[i + 1:]] for i in range(k)):
+                results.append({
+                    "changes": [candidates[i] for i in combo],
+                    "score": value,
+                    "delta": value - base_score,
+                    "subscores": {name: part["score"] for name, part in breakdown.items()},
+                })
+    # 上がり幅の大きい順、同点なら変更の少ない順 (sort は安定なので同じ変更数は列挙順)
+    return sorted(results, key=lambda r: (-r["score"], len(r["changes"])))
+
+
+def cases(n, seed):
+    totals = synthetic.nutrient_totals(n, seed).to_dict("records")
+    return [(answers, profile, nutrients_from_totals(total))
+            for (answers, profile), total in zip(synthetic.profiles(n, seed), totals)]
+
+
+@pytest.mark.parametrize("answers, profile, nutrients", cases(6, seed=7))
+def test_matches_brute_force(answers, profile, nutrients):
+    expected = brute_force(answers, profile, nutrients, 2)
+    assert improvements(answers, profile, nutrients, max_changes=2, limit=len(expected) + 1) == expected
+
+
+def test_three_changes_match_brute_force():
+    answers, profile, nutrients = cases(1, seed=11)[0]
+    expected = brute_force(answers, profile, nutrients, 3)
+    assert improvements(answers, profile, nutrients, max_changes=3, limit=100) == expected[:100]
+
+
+def test_rejects_too_many_changes():
+    answers, profile, nutrients = cases(1, seed=0)[0]
+    with pytest.raises(ValueError):
+        improvements(answers, profile, nutrients, max_changes=4)
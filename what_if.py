@@ -0,0 +1,117 @@
+# --- 改善シミュレーション (回答を変えた場合のスコア) ---
+# 20問それぞれの別の選択肢に変えた場合と、2-3問を同時に変えた場合のスコアを1回の配列演算で求め、
+# 上がり幅の大きい順に返す。
+# 習慣部分は設問ごとの点の和 (グルテンのアレルギー加点も gluten の1問だけで決まる) なので、
+# 1問だけ変えた場合の差分を scoring の関数で求めておけば、複数の変更はその差分の和になる。
+# 食事部分は回答によらないため、現在の栄養素で1回だけ求める。
+
+from functools import lru_cache
+from itertools import combinations
+
+import numpy as np
+
+from scoring import (
+    ALPHA, HABIT_OPTIONS, MEAL_PARTS, W_BIO, W_DIET, W_DOP, W_RISK, habit_points, risk_habit_part,
+)
+
+SUBSCORES = list(MEAL_PARTS)  # diet, bio, dop, risk
+MAX_CHANGES = 3  # 同時に変える設問数の上限
+_QUESTION_INDEX = {question: i for i, question in enumerate(HABIT_OPTIONS)}
+
+
+def _habit_vector(habit_answers, user_profile):
+    # 習慣部分 (min(100) で丸める前) を SUBSCORES の順で
+    return [habit_points(name, habit_answers) for name in SUBSCORES[:3]] + [
+        risk_habit_part(habit_answers, user_profile)[0]
+    ]
+
+
+def single_changes(habit_answers, user_profile):
+    """
+    1問だけ回答を変える候補
+    戻り値: (設問, 変更前, 変更後) のリストと、各候補の習慣部分の差分 (候補数, SUBSCORES) の配列
+    """
+    base = _habit_vector(habit_answers, user_profile)
+    changes, deltas = [], []
+    for question, options in HABIT_OPTIONS.items():
+        current = habit_answers.get(question)
+        for option in options:
+            if option == current:
+                continue
+            changed = _habit_vector({**habit_answers, question: option}, user_profile)
+            changes.append((question, current, option))
+            deltas.append([c - b for c, b in zip(changed, base)])
+    return changes, np.array(deltas, dtype=np.int64).reshape(-1, len(SUBSCORES))
+
+
+@lru_cache(maxsize=16)
+def _combinations(n, k):
+    # 候補番号の組 (昇順)。候補数はほぼ一定 (回答済みなら60) なので使い回す
+    return np.array(list(combinations(range(n), k)), dtype=np.intp).reshape(-1, k)
+
+
+def _nnbi(subscores):
+    # nnbi_score の配列版 (スカラー版と同じ演算順序で浮動小数点の結果を一致させる)
+    sub = np.minimum(100, subscores)
+    calculation = ALPHA + (sub[:, 0] * W_DIET) + (sub[:, 1] * W_BIO) + (sub[:, 2] * W_DOP) - (sub[:, 3] * W_RISK)
+    return np.clip(calculation, 0, 100).astype(np.int64), sub
+
+
+def improvements(habit_answers, user_profile, nutrients, max_changes=2, limit=10):
+    """
+    回答を max_changes 問まで変えた場合にスコアが上がる変更を、上がり幅の大きい順に返す
+    複数問の変更は、どの1問を戻してもスコアが下がるもの (すべての変更が効いているもの) だけを残す
+    各要素: changes ((設問, 変更前, 変更後) のリスト), score, delta, subscores (サブスコア名 -> 点)
+    """
+    if not 1 <= max_changes <= MAX_CHANGES:
+        raise ValueError(f"max_changes は 1-{MAX_CHANGES} で指定してください")
+    changes, deltas = single_changes(habit_answers, user_profile)
+    # 食事部分は習慣点 0 で評価した加点 (上限 100 は合計後に適用する)
+    meal = np.array([MEAL_PARTS[name](0, [], nutrients)[0] for name in SUBSCORES])
+    base = np.array(_habit_vector(habit_answers, user_profile)) + meal
+    base_score = int(_nnbi(base[None, :])[0][0])
+    questions = np.array([_QUESTION_INDEX[question] for question, _, _ in changes], dtype=np.intp)
+
+    found = []  # (候補番号の組, スコア, サブスコア) を変更数ごとに
+    previous = None
+    n = len(changes)
+    for k in range(1, max_changes + 1):
+        combos = _combinations(n, k)
+        # 同じ設問を2回変える組は除く
+        if k > 1:
+            asked = questions[combos]
+            distinct = np.ones(len(combos), dtype=bool)
+            for i, j in combinations(range(k), 2):
+                distinct &= asked[:, i] != asked[:, j]
+            combos = combos[distinct]
+        scores, sub = _nnbi(base + deltas[combos].sum(axis=1))
+        # 変更数 k-1 の組のスコアを (n,)*(k-1) の表に置き、1問戻した組の最高点と比べる
+        keep = scores > base_score
+        if previous is not None:
+            best_without_one = np.max(
+                [previous[tuple(np.delete(combos, i, axis=1).T)] for i in range(k)], axis=0
+            )
+            keep &= scores > best_without_one
+        if k < max_changes:
+            previous = np.full((n,) * k, base_score, dtype=np.int64)
+            previous[tuple(combos.T)] = scores
+        found.append((combos[keep], scores[keep], sub[keep]))
+
+    combos_by_k = [c for c, _, _ in found]
+    scores = np.concatenate([s for _, s, _ in found])
+    sizes = np.concatenate([np.full(len(c), c.shape[1]) for c in combos_by_k])
+    positions = np.concatenate([np.arange(len(c)) for c in combos_by_k])
+    subs = np.concatenate([s for _, _, s in found])
+    # 上がり幅の大きい順、同点なら変更の少ない順
+    order = np.lexsort((positions, sizes, -scores))[:limit]
+    results = []
+    for r in order:
+        combo = combos_by_k[sizes[r] - 1][positions[r]]
+        results.append({
+            "changes": [changes[i] for i in combo],
+            "score": int(scores[r]),
+            "delta": int(scores[r]) - base_score,
+            "subscores": dict(zip(SUBSCORES, subs[r].tolist())),
+        })
+    return results
+